@@ -0,0 +1,102 @@
+"""
+User-independent allergen prediction (ML + rule-based), shared by the
+Flask app and offline tools such as screen_catalog.py. No Flask imports.
+"""
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import joblib
+
+MODEL_PATHS = {
+    "model": "models/allergen_classifier.joblib",
+    "vectorizer": "models/tfidf_vectorizer.joblib",
+    "label_binarizer": "models/label_binarizer.joblib",
+}
+
+ML_THRESHOLD = 0.40
+
+
+def load_models(paths: Dict[str, str] = MODEL_PATHS) -> Tuple[Any, Any, List[str]]:
+    """Returns (model, vectorizer, allergen_list)."""
+    model = joblib.load(paths["model"])
+    vectorizer = joblib.load(paths["vectorizer"])
+    label_binarizer = joblib.load(paths["label_binarizer"])
+    return model, vectorizer, list(label_binarizer.classes_)
+
+
+def _build_result(cleaned: str, probs: Sequence[float], allergen_list: List[str]) -> Dict[str, Any]:
+    ml_hits = []
+    all_probs = []
+
+    for allergen, p in zip(allergen_list, probs):
+        # convert numpy types to native python
+        p_float = float(p)
+        above = bool(p_float > ML_THRESHOLD)
+
+        all_probs.append({
+            "allergen": str(allergen),
+            "probability": p_float,
+            "above_threshold": above
+        })
+        if above:
+            ml_hits.append(str(allergen))
+
+    # Rule-based
+    rule_hits = []
+    strong = []
+    advisory = []
+
+    lower = cleaned.lower()
+
+    for allergen in allergen_list:
+        alg = str(allergen)
+        if f"contains {alg}" in lower:
+            strong.append(alg)
+        if f"may contain {alg}" in lower:
+            advisory.append(alg)
+        if alg in lower:
+            rule_hits.append(alg)
+
+    combined = sorted(list(set(ml_hits + rule_hits + strong + advisory)))
+
+    # Ensure all lists contain native Python strings
+    return {
+        "ml_flagged_allergens": [str(x) for x in ml_hits],
+        "rule_based_hits": [str(x) for x in rule_hits],
+        "strong_contains_allergens": [str(x) for x in strong],
+        "advisory_allergens": [str(x) for x in advisory],
+        "combined_allergens": [str(x) for x in combined],
+        "all_allergens_with_probs": all_probs
+    }
+
+
+def predict_batch(
+    cleaned_texts: Sequence[str],
+    model,
+    vectorizer,
+    allergen_list: List[str],
+    timings: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Predict many already-cleaned texts with one transform() and one
+    predict_proba() call; same per-text output as predict_one().
+    If timings is given, vectorize / predict_proba / rules ms are written to it.
+    """
+    if not len(cleaned_texts):
+        return []
+    start = time.perf_counter()
+    features = vectorizer.transform(cleaned_texts)
+    vectorized = time.perf_counter()
+    probs = model.predict_proba(features)
+    predicted = time.perf_counter()
+    results = [_build_result(text, row, allergen_list) for text, row in zip(cleaned_texts, probs)]
+    if timings is not None:
+        timings["vectorize"] = (vectorized - start) * 1000
+        timings["predict_proba"] = (predicted - vectorized) * 1000
+        timings["rules"] = (time.perf_counter() - predicted) * 1000
+    return results
+
+
+def predict_one(cleaned: str, model, vectorizer, allergen_list: List[str],
+                timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    return predict_batch([cleaned], model, vectorizer, allergen_list, timings)[0]
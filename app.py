@@ -1,21 +1,41 @@
 ###############################
 # IMPORTS
 ###############################
-from flask import Flask, request, jsonify, redirect, url_for, session
+from flask import Flask, Response, request, jsonify, redirect, url_for, session, has_request_context
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import sqlite3
 import os
+import io
+import itertools
+import csv
+import hashlib
+import hmac
+import ipaddress
+import json
 import re
+import socket
 import time
-import cv2
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import pytesseract
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 import numpy as np
 from PIL import Image
-import joblib
+import requests
 from dotenv import load_dotenv
+import metrics
+from prediction_cache import PredictionCache, model_version
+from allergen_predictor import MODEL_PATHS, load_models, predict_one
+from text_normalizer import clean_text
+from ocr_service import ocr_image, ocr_image_detailed, OCRQualityError, OCR_PROFILES
+from barcode_index import INDEX_PATH as BARCODE_INDEX_PATH, BarcodeIndex, detect_barcodes_in_file, normalize_code
+from near_dup_index import INDEX_PATH as NEAR_DUP_INDEX_PATH, NearDuplicateIndex
+from image_hash_index import (INDEX_PATH as IMAGE_HASH_INDEX_PATH, MAX_DISTANCE as IMAGE_HASH_MAX_DISTANCE,
+                              ImageHashIndex, image_hashes)
+from ocr_spelling import INDEX_PATH as OCR_SPELLING_INDEX_PATH, SpellingIndex
 from llm_service import (
     generate_personalized_advice,
     generate_alternatives,
@@ -44,6 +64,57 @@ CORS(app, supports_credentials=True, origins=[
     "http://127.0.0.1:3001",
 ])
 
+###############################
+# WORKER POOLS
+###############################
+# CPU-bound work (OCR, ML inference) and I/O-bound work (LLM calls) get
+# separate pools so slow LLM responses never hold up scans. Sized per
+# process; under gunicorn, gunicorn_conf.py divides the cores between workers.
+# Tesseract runs as a subprocess and OpenCV releases the GIL, so threads
+# give real parallelism for multi-panel scans.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1)))))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "8"))
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+
+def _run_llm(fn, **kwargs):
+    """Run an llm_service call on the I/O pool and wait for it."""
+    with metrics.span("llm"):
+        return llm_executor.submit(fn, **kwargs).result()
+
+
+###############################
+# METRICS
+###############################
+# Set SERVER_TIMING=1 to add a Server-Timing header with per-stage durations
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "0") == "1"
+
+
+@app.before_request
+def _start_request_timer():
+    request.environ["allergy.start"] = time.perf_counter()
+    metrics.start_request()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    start = request.environ.get("allergy.start")
+    timings = metrics.finish_request()
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        metrics.REQUEST_LATENCY.observe(
+            elapsed,
+            endpoint=request.endpoint or "unmatched",
+            method=request.method,
+            status=str(response.status_code),
+        )
+        if SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = metrics.server_timing_header(timings, elapsed * 1000)
+    return response
+
+
 ###############################
 # DB CONNECTION
 ###############################
@@ -229,139 +300,178 @@ def logout():
 #######################################
 # LOAD ML MODELS (FIXED)
 #######################################
-model = joblib.load("models/allergen_classifier.joblib")
-vectorizer = joblib.load("models/tfidf_vectorizer.joblib")
-label_binarizer = joblib.load("models/label_binarizer.joblib")
+MODEL_CHECK_INTERVAL_SECONDS = 30
 
-ALLERGEN_LIST = list(label_binarizer.classes_)
+model, vectorizer, ALLERGEN_LIST = load_models(MODEL_PATHS)
 
+# Cache of the user-independent prediction, keyed on cleaned text + model version
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "4096")),
+    version=model_version(MODEL_PATHS.values()),
+)
+_model_lock = threading.Lock()
+_model_checked_at = time.time()
+
+# OCR of the same product differs a little from photo to photo, so the
+# exact-text cache misses; this MinHash index finds the earlier product
+# match and advice for a near-identical text. The classifier always runs:
+# an added ingredient ("whey powder") can change the allergens without
+# naming any of them.
+# Seed it with: python near_dup_index.py build food.parquet
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_INDEX", "1") == "1"
+near_dup_index = NearDuplicateIndex(
+    os.getenv("NEAR_DUP_INDEX_PATH", NEAR_DUP_INDEX_PATH),
+    threshold=float(os.getenv("NEAR_DUP_THRESHOLD", "0.8")),
+    max_entries=int(os.getenv("NEAR_DUP_MAX_ENTRIES", "50000")),
+)
+if NEAR_DUP_ENABLED:
+    print(f"Near-duplicate index: {near_dup_index.load()} entries")
+# Distinct (allergens, user allergies) advice variants kept per entry
+NEAR_DUP_ADVICE_PER_ENTRY = 4
 
-#######################################
-# CLEAN TEXT
-#######################################
-def clean_text(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    s = text.lower()
-    s = re.sub(r"[^a-z0-9,;()\-/%\s.]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+
+def _ensure_models_current():
+    """Reload the artifacts (and drop cached predictions) if they changed on disk."""
+    global model, vectorizer, ALLERGEN_LIST, _model_checked_at
+    now = time.time()
+    if now - _model_checked_at < MODEL_CHECK_INTERVAL_SECONDS:
+        return
+    with _model_lock:
+        if now - _model_checked_at < MODEL_CHECK_INTERVAL_SECONDS:
+            return
+        _model_checked_at = now
+        version = model_version(MODEL_PATHS.values())
+        if version == prediction_cache.version:
+            return
+        print(f"Model artifacts changed ({prediction_cache.version} -> {version}); reloading.")
+        # Models first: a request that reads the new version predicts with them
+        model, vectorizer, ALLERGEN_LIST = load_models(MODEL_PATHS)
+        prediction_cache.set_version(version)
 
 
 #######################################
-# RESTORED HIGH-QUALITY OCR PIPELINE
+# COMBINED HYBRID PREDICTION LOGIC
 #######################################
-def ocr_image(image_path: str) -> str:
+def _predict_allergens(cleaned, timings=None):
     """
-    Restored OCR pipeline (the one that gave excellent results earlier).
+    User-independent part of the pipeline (ML + rule-based). The result only
+    depends on the cleaned text and the loaded model, so it is cached.
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        return ""
-
-    # Step 1: Convert
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    # Step 2: Light denoise
-    denoised = cv2.fastNlMeansDenoising(gray, h=10)
-
-    # Step 3: Adaptive threshold
-    th = cv2.adaptiveThreshold(
-        denoised, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY,
-        31, 3
-    )
-
-    # Step 4: Upscale
-    up = cv2.resize(th, None, fx=2, fy=2, interpolation=cv2.INTER_LINEAR)
-
-    # Best Tesseract config from earlier
-    config = "--oem 3 --psm 6"
+    return predict_one(cleaned, model, vectorizer, ALLERGEN_LIST, timings)
 
-    text = pytesseract.image_to_string(up, config=config)
 
-    return text
+def _near_duplicate(cleaned):
+    """(match, signature) from the near-duplicate index; (None, None) when disabled or the text is too short."""
+    if not NEAR_DUP_ENABLED:
+        return None, None
+    with metrics.span("near_dup"):
+        signature = near_dup_index.signature(cleaned)
+        match = near_dup_index.query(cleaned, signature) if signature is not None else None
+    return match, signature
 
 
-#######################################
-# COMBINED HYBRID PREDICTION LOGIC
-#######################################
-def full_prediction_pipeline(raw_text):
+def full_prediction_pipeline(raw_text, user_id=None, declared_allergens=None):
     """
     Run full pipeline and ensure all returned values are native Python types
-    so jsonify() won't fail.
+    so jsonify() won't fail. user_id defaults to the session user; pass it
+    explicitly when running outside a request (background jobs).
+    declared_allergens (e.g. from the barcode index) are merged into
+    combined_allergens before personalization.
     """
-    cleaned = clean_text(raw_text)
-
-    # ML probs
-    X_vec = vectorizer.transform([cleaned])
-    probs = model.predict_proba(X_vec)[0]
-
-    ml_hits = []
-    all_probs = []
-
-    # Ensure ALLERGEN_LIST is in sync with label_binarizer.classes_
-    # ALLERGEN_LIST = list(label_binarizer.classes_) was set at load time.
-
-    for allergen, p in zip(ALLERGEN_LIST, probs):
-        # convert numpy types to native python
-        p_float = float(p)
-        above = bool(p_float > 0.40)
-
-        all_probs.append({
-            "allergen": str(allergen),
-            "probability": p_float,
-            "above_threshold": above
-        })
-        if above:
-            ml_hits.append(str(allergen))
-
-    # Rule-based
-    rule_hits = []
-    strong = []
-    advisory = []
-
-    lower = cleaned.lower()
-
-    for allergen in ALLERGEN_LIST:
-        alg = str(allergen)
-        if f"contains {alg}" in lower:
-            strong.append(alg)
-        if f"may contain {alg}" in lower:
-            advisory.append(alg)
-        if alg in lower:
-            rule_hits.append(alg)
-
-    combined = sorted(list(set(ml_hits + rule_hits + strong + advisory)))
-
-    # User personalization
+    _ensure_models_current()
+    with metrics.span("clean_text"):
+        cleaned = clean_text(raw_text)
+
+    # Read before predicting: a reload in between makes this put a no-op
+    version = prediction_cache.version
+    core = prediction_cache.get(cleaned)
+    if core is None:
+        # Stage timings come back from the pool thread and are recorded here
+        timings = {}
+        core = cpu_executor.submit(_predict_allergens, cleaned, timings).result()
+        prediction_cache.put(cleaned, core, version)
+        for stage, ms in timings.items():
+            metrics.observe_stage(stage, ms)
+    near, _ = _near_duplicate(cleaned)
+    combined = sorted(set(core["combined_allergens"]) | set(declared_allergens or []))
+
+    # User personalization (applied on top of the cached result)
+    if user_id is None and has_request_context():
+        user_id = session.get("user_id")
     personalized = []
-    if "user_id" in session:
-        db = get_db()
-        user = db.execute("SELECT allergies FROM users WHERE id=?",
-                          (session["user_id"],)).fetchone()
+    if user_id is not None:
+        with metrics.span("db_user_allergies"):
+            db = get_db()
+            user = db.execute("SELECT allergies FROM users WHERE id=?",
+                              (user_id,)).fetchone()
         if user and user[0]:
             user_allergies = [u.strip().lower() for u in user[0].split(",")]
             personalized = [a for a in combined if a in user_allergies]
 
-    # Ensure all lists contain native Python strings
     result = {
         "input_text": str(raw_text),
         "cleaned_text": str(cleaned),
-        "ml_flagged_allergens": [str(x) for x in ml_hits],
-        "rule_based_hits": [str(x) for x in rule_hits],
-        "strong_contains_allergens": [str(x) for x in strong],
-        "advisory_allergens": [str(x) for x in advisory],
-        "combined_allergens": [str(x) for x in combined],
+        "ml_flagged_allergens": list(core["ml_flagged_allergens"]),
+        "rule_based_hits": list(core["rule_based_hits"]),
+        "strong_contains_allergens": list(core["strong_contains_allergens"]),
+        "advisory_allergens": list(core["advisory_allergens"]),
+        "combined_allergens": list(combined),
         "user_specific_risk": [str(x) for x in personalized],
-        "all_allergens_with_probs": all_probs
+        "all_allergens_with_probs": [dict(p) for p in core["all_allergens_with_probs"]]
     }
+    if near is not None:
+        match = near["payload"]
+        result["near_duplicate"] = {"similarity": round(near["similarity"], 3), "source": match.get("source")}
+        # Product fields for OFF matches; reported, not merged (the label may differ)
+        for key in ("product_name", "barcode", "declared_allergens"):
+            if key in match:
+                result["near_duplicate"][key] = match[key]
 
     return result
 
 
 
+###################################
+# RESPONSE SHAPING
+###################################
+# Left out with verbose=false: echoed texts and per-allergen probabilities
+VERBOSE_ONLY_FIELDS = ("input_text", "cleaned_text", "ocr_raw_text", "all_allergens_with_probs")
+# Per-panel keys left out with verbose=false (OCR text and word boxes)
+VERBOSE_ONLY_PANEL_FIELDS = ("ocr_text", "words")
+
+
+def _response_options(data=None):
+    """Read fields= / verbose= from the query string, form or JSON body."""
+    data = data if isinstance(data, dict) else {}
+    fields = request.args.get("fields") or request.form.get("fields") or data.get("fields")
+    verbose = request.args.get("verbose") or request.form.get("verbose")
+    if verbose is None:
+        verbose = data.get("verbose", True)
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    if isinstance(verbose, str):
+        verbose = verbose.strip().lower() not in ("0", "false", "no")
+    return (list(fields) if fields else None), bool(verbose)
+
+
+def shape_prediction(result, fields=None, verbose=True):
+    """
+    Trim a prediction payload for small clients. fields= keeps only the
+    listed top-level keys; verbose=False drops the large echo/debug ones.
+    """
+    if fields:
+        return {k: result[k] for k in fields if k in result}
+    if verbose:
+        return result
+    shaped = {k: v for k, v in result.items() if k not in VERBOSE_ONLY_FIELDS}
+    if "panels" in shaped:
+        shaped["panels"] = [
+            {k: v for k, v in p.items() if k not in VERBOSE_ONLY_PANEL_FIELDS}
+            for p in shaped["panels"]
+        ]
+    return shaped
+
+
 ###################################
 # /predict TEXT ENDPOINT
 ###################################
@@ -372,39 +482,204 @@ def predict():
         return jsonify({"error": "ingredients_text field is required"}), 400
 
     result = full_prediction_pipeline(data["ingredients_text"])
-    return jsonify(result)
+    return jsonify(shape_prediction(result, *_response_options(data)))
 
 
 ###################################
 # /predict_image ENDPOINT (FULL HYBRID FIXED)
 ###################################
-@app.route("/predict_image", methods=["POST"])
-def predict_image():
+MAX_IMAGES_PER_REQUEST = int(os.getenv("MAX_IMAGES_PER_REQUEST", "8"))
+
+# Perceptual hashes of each panel are matched against earlier scans (same
+# packaging, another photo). A hit is only reported, never used in place of
+# OCR: a label with one ingredient swapped hashes as close as a re-shot of
+# the same label (see bench_image_hash.py), so the panel is always OCR'd and
+# the hit is checked against the fresh text. Off by default.
+IMAGE_HASH_ENABLED = os.getenv("IMAGE_HASH_INDEX", "0") == "1"
+image_hash_index = ImageHashIndex(
+    os.getenv("IMAGE_HASH_INDEX_PATH", IMAGE_HASH_INDEX_PATH),
+    max_distance=int(os.getenv("IMAGE_HASH_MAX_DISTANCE", str(IMAGE_HASH_MAX_DISTANCE))),
+    max_entries=int(os.getenv("IMAGE_HASH_MAX_ENTRIES", "5000")),
+)
+if IMAGE_HASH_ENABLED:
+    print(f"Image hash index: {image_hash_index.load()} entries")
+# OCR result fields stored with each scan
+IMAGE_HASH_OCR_FIELDS = ("text", "profile")
+
+# OCR misreadings ("rnilk", "s0y") are corrected before clean_text. Needs the
+# index built by `python ocr_spelling.py build`; without it this is a no-op.
+OCR_SPELLING_ENABLED = os.getenv("OCR_SPELLING", "1") == "1"
+ocr_speller = SpellingIndex(os.getenv("OCR_SPELLING_INDEX_PATH", OCR_SPELLING_INDEX_PATH))
+
+
+def _timed_ocr(filepath, profile=None):
+    """OCR one panel; unreadable images come back rejected instead of raising."""
+    start = time.perf_counter()
     try:
-        if "image" not in request.files:
-            return jsonify({"error": "No image uploaded"}), 400
+        ocr = ocr_image_detailed(filepath, profile=profile)
+        ocr["rejected"] = None
+    except OCRQualityError as e:
+        ocr = {"text": "", "words": [], "mean_confidence": 0.0, "dropped_words": 0,
+               "quality": e.quality, "profile": None, "rejected": str(e)}
+    return ocr, (time.perf_counter() - start) * 1000
 
-        img = request.files["image"]
-        if not img or not img.filename:
-            return jsonify({"error": "Invalid image upload"}), 400
 
+def _panel_ocr(filepath, profile=None):
+    """
+    _timed_ocr, plus the earlier scan whose perceptual hashes match the panel
+    (when IMAGE_HASH_ENABLED). The match is a hint only: match["same_text"]
+    says whether its stored OCR agrees with this one.
+    Returns (ocr, ocr_ms, hash_ms, match).
+    """
+    hashes = match = None
+    hash_ms = 0.0
+    if IMAGE_HASH_ENABLED:
+        start = time.perf_counter()
+        try:
+            hashes = image_hashes(filepath)
+        except OSError:
+            pass  # unreadable; OCR reports it
+        match = image_hash_index.lookup(hashes) if hashes is not None else None
+        hash_ms = (time.perf_counter() - start) * 1000
+
+    ocr, ms = _timed_ocr(filepath, profile)
+    if match is not None:
+        match["same_text"] = clean_text(match["payload"]["text"]) == clean_text(ocr["text"])
+        metrics.IMAGE_HASH_HITS.inc(outcome="same_text" if match["same_text"] else "text_changed")
+    # A changed text is stored too, so the next photo of it matches its own scan
+    if (hashes is not None and not ocr["rejected"] and ocr["text"].strip()
+            and (match is None or not match["same_text"])):
+        image_hash_index.add(hashes, {k: ocr.get(k) for k in IMAGE_HASH_OCR_FIELDS})
+    return ocr, ms, hash_ms, match
+
+
+def _get_uploaded_images():
+    """Uploaded panels in order: 'images' (repeated) first, then legacy 'image'."""
+    files = request.files.getlist("images") + request.files.getlist("image")
+    return [f for f in files if f and f.filename]
+
+
+def _parse_scan_upload():
+    """Validate the upload fields. Returns (images, ocr_profile, error_response)."""
+    images = _get_uploaded_images()
+    if not images:
+        if "image" not in request.files and "images" not in request.files:
+            return None, None, (jsonify({"error": "No image uploaded"}), 400)
+        return None, None, (jsonify({"error": "Invalid image upload"}), 400)
+    if len(images) > MAX_IMAGES_PER_REQUEST:
+        return None, None, (jsonify({"error": f"Too many images. Send at most {MAX_IMAGES_PER_REQUEST} per scan."}), 400)
+
+    # Optional per-request preprocessing profile (fast / balanced / quality / auto)
+    ocr_profile = (request.form.get("ocr_profile") or request.args.get("ocr_profile") or "").strip().lower() or None
+    if ocr_profile and ocr_profile not in OCR_PROFILES + ("auto",):
+        return None, None, (jsonify({"error": f"Unknown ocr_profile. Use one of: auto, {', '.join(OCR_PROFILES)}"}), 400)
+    return images, ocr_profile, None
+
+
+@metrics.span("upload_save")
+def _save_uploads(images):
+    os.makedirs("uploads", exist_ok=True)
+    batch_id = uuid.uuid4().hex[:8]
+    filepaths = []
+    for index, img in enumerate(images):
         filename = secure_filename(img.filename)
         print("Received image:", filename)
-        filepath = os.path.join("uploads", filename)
-        os.makedirs("uploads", exist_ok=True)
+        # Prefix so panels with the same name (e.g. image.jpg) don't overwrite each other
+        filepath = os.path.join("uploads", f"{batch_id}_{index}_{filename}")
         img.save(filepath)
         print("Saved to:", filepath)
+        filepaths.append((filename, filepath))
+    return filepaths
+
+
+def run_image_scan(filepaths, ocr_profile=None, user_id=None, detect_barcode=None):
+    """
+    OCR saved panels and run the prediction pipeline on the merged text.
+    If a panel shows a barcode that is in the local index, that answer is
+    returned instead and OCR is skipped (detect_barcode defaults to
+    BARCODE_DETECTION). Returns (payload, http_status); usable outside a
+    request context.
+    """
+    if detect_barcode is None:
+        detect_barcode = BARCODE_DETECTION_ENABLED
+    if detect_barcode:
+        payload = scan_barcodes(filepaths, user_id=user_id)
+        if payload is not None:
+            return payload, 200
+
+    # OCR all panels in parallel; map() keeps panel order
+    ocr_results = list(cpu_executor.map(
+        lambda path: _panel_ocr(path, ocr_profile), [path for _, path in filepaths]
+    ))
+
+    panels = []
+    for (filename, _), (ocr, ms, hash_ms, match) in zip(filepaths, ocr_results):
+        if IMAGE_HASH_ENABLED:
+            metrics.observe_stage("image_hash", hash_ms)
+        metrics.observe_stage("ocr", ms)
+        if not ocr["rejected"]:
+            metrics.observe_stage("ocr_preprocess", ocr["preprocess_ms"])
+            metrics.observe_stage("ocr_tesseract", ocr["tesseract_ms"])
+        panels.append({
+            "filename": filename,
+            "ocr_text": ocr["text"],
+            "ocr_ms": round(ms, 1),
+            "has_text": bool(ocr["text"].strip()),
+            "mean_confidence": ocr["mean_confidence"],
+            "dropped_low_confidence_words": ocr["dropped_words"],
+            "words": ocr["words"],
+            "quality": ocr["quality"],
+            "ocr_profile": ocr["profile"],
+            "noise_sigma": ocr.get("noise_sigma"),
+            "rejected": ocr["rejected"],
+            # Hamming distances to the closest earlier scan, and whether its OCR agreed
+            "image_match": None if match is None else {"distance": match["distance"],
+                                                       "phash_distance": match["phash_distance"],
+                                                       "same_text": match["same_text"]},
+        })
+
+    ocr_text = "\n\n".join(p["ocr_text"].strip() for p in panels if p["has_text"])
+    if not ocr_text:
+        rejected = [p for p in panels if p["rejected"]]
+        if rejected:
+            return {
+                "error": rejected[0]["rejected"],
+                "quality": [p["quality"] for p in panels],
+                "ocr_timings_ms": [p["ocr_ms"] for p in panels],
+            }, 422
+        return {
+            "error": "Could not extract text from image. Try a clearer, well-lit ingredient label photo."
+        }, 422
+
+    print("OCR text:", ocr_text[:100])
+    corrections = []
+    if OCR_SPELLING_ENABLED:
+        with metrics.span("ocr_spelling"):
+            text, corrections = ocr_speller.correct_text(ocr_text)
+    else:
+        text = ocr_text
+    result = full_prediction_pipeline(text, user_id=user_id)
+    result["source"] = "ocr"
+    result["ocr_raw_text"] = ocr_text
+    result["ocr_corrections"] = corrections
+    result["image_count"] = len(panels)
+    result["panels"] = panels
+    result["ocr_timings_ms"] = [p["ocr_ms"] for p in panels]
+    return result, 200
 
-        ocr_text = ocr_image(filepath)
-        if not ocr_text.strip():
-            return jsonify({
-                "error": "Could not extract text from image. Try a clearer, well-lit ingredient label photo."
-            }), 422
 
-        print("OCR text:", ocr_text[:100])
-        result = full_prediction_pipeline(ocr_text)
-        result["ocr_raw_text"] = ocr_text
-        return jsonify(result)
+@app.route("/predict_image", methods=["POST"])
+def predict_image():
+    try:
+        images, ocr_profile, error = _parse_scan_upload()
+        if error:
+            return error
+
+        filepaths = _save_uploads(images)
+        payload, status = run_image_scan(filepaths, ocr_profile)
+        if status == 200:
+            payload = shape_prediction(payload, *_response_options())
+        return jsonify(payload), status
     except pytesseract.TesseractNotFoundError:
         return jsonify({
             "error": "Tesseract OCR is not installed or not found at configured path."
@@ -414,6 +689,316 @@ def predict_image():
         return jsonify({"error": f"Scan processing failed: {str(e)}"}), 500
 
 
+###################################
+# BARCODE LOOKUP
+###################################
+# Products already in the Open Food Facts dump are answered from a local
+# index (python barcode_index.py build food.parquet) in milliseconds;
+# OCR only runs on a miss. Without the index file every lookup misses.
+barcode_index = BarcodeIndex(os.getenv("BARCODE_INDEX_PATH", BARCODE_INDEX_PATH))
+# Look for barcodes in /predict_image and scan-job uploads before OCR
+BARCODE_DETECTION_ENABLED = os.getenv("BARCODE_DETECTION", "1") == "1"
+
+
+def lookup_barcode(code):
+    with metrics.span("barcode_lookup"):
+        product = barcode_index.lookup(code)
+    metrics.BARCODE_LOOKUPS.inc(outcome="hit" if product else "miss")
+    return product
+
+
+def barcode_prediction(product, user_id=None):
+    """Prediction payload for an indexed product: its ingredients run through the pipeline plus declared allergens."""
+    result = full_prediction_pipeline(product["ingredients_text"], user_id=user_id,
+                                      declared_allergens=product["declared_allergens"])
+    result["source"] = "barcode_index"
+    result["barcode"] = product["barcode"]
+    result["product_name"] = product["product_name"]
+    result["declared_allergens"] = list(product["declared_allergens"])
+    return result
+
+
+def scan_barcodes(filepaths, user_id=None):
+    """Detect barcodes in the saved panels; the first indexed one wins. None if nothing is indexed."""
+    if not barcode_index.available:
+        return None
+    with metrics.span("barcode_detect"):
+        detected = list(cpu_executor.map(detect_barcodes_in_file, [path for _, path in filepaths]))
+    for (filename, _), codes in zip(filepaths, detected):
+        for code in codes:
+            product = lookup_barcode(code)
+            if product:
+                result = barcode_prediction(product, user_id=user_id)
+                result["image_count"] = len(filepaths)
+                result["panels"] = [{"filename": name, "barcodes": found}
+                                    for (name, _), found in zip(filepaths, detected)]
+                return result
+    return None
+
+
+@app.route("/predict_barcode", methods=["GET", "POST"])
+def predict_barcode():
+    """
+    Look up a product by barcode ({"barcode": "..."}, form field or ?barcode=)
+    or by barcode images. With images, a miss falls back to the OCR scan.
+    """
+    data = request.get_json(silent=True) or {}
+    code = data.get("barcode") or request.form.get("barcode") or request.args.get("barcode")
+    has_images = bool(_get_uploaded_images())
+    if not code and not has_images:
+        return jsonify({"error": "barcode field or image upload is required"}), 400
+    if code and normalize_code(code) is None:
+        return jsonify({"error": "barcode must contain digits"}), 400
+
+    try:
+        if code:
+            product = lookup_barcode(code)
+            if product:
+                return jsonify(shape_prediction(barcode_prediction(product), *_response_options(data)))
+            if not has_images:
+                return jsonify({
+                    "error": "Barcode not found in the local product index. Scan the ingredient label instead.",
+                    "barcode": normalize_code(code),
+                    "index_available": barcode_index.available,
+                }), 404
+
+        images, ocr_profile, error = _parse_scan_upload()
+        if error:
+            return error
+        filepaths = _save_uploads(images)
+        payload, status = run_image_scan(filepaths, ocr_profile, detect_barcode=True)
+        if status == 200:
+            payload = shape_prediction(payload, *_response_options())
+        return jsonify(payload), status
+    except pytesseract.TesseractNotFoundError:
+        return jsonify({
+            "error": "Tesseract OCR is not installed or not found at configured path."
+        }), 500
+    except Exception as e:
+        print(f"predict_barcode error: {str(e)}")
+        return jsonify({"error": f"Barcode lookup failed: {str(e)}"}), 500
+
+
+@app.route("/barcode_index/stats", methods=["GET"])
+def barcode_index_stats():
+    return jsonify({"success": True, **barcode_index.stats()})
+
+
+###################################
+# ASYNC SCAN JOBS
+###################################
+SCAN_JOB_WORKERS = int(os.getenv("SCAN_JOB_WORKERS", "2"))
+SCAN_JOB_TTL_SECONDS = int(os.getenv("SCAN_JOB_TTL_SECONDS", "3600"))
+SCAN_JOB_CLEANUP_INTERVAL_SECONDS = 60
+SCAN_JOB_CALLBACK_TIMEOUT_SECONDS = 5
+# Job state is transient, so it lives in its own untracked database
+SCAN_JOBS_DB = os.getenv("SCAN_JOBS_DB", "models/scan_jobs.db")
+# Callbacks go only to these hosts (comma-separated), signed with the secret;
+# without both, callback_url is refused
+SCAN_CALLBACK_HOSTS = {h.strip().lower() for h in os.getenv("SCAN_CALLBACK_HOSTS", "").split(",") if h.strip()}
+SCAN_CALLBACK_SECRET = os.getenv("SCAN_CALLBACK_SECRET", "")
+
+scan_job_executor = ThreadPoolExecutor(max_workers=SCAN_JOB_WORKERS, thread_name_prefix="scan-job")
+_scan_jobs_cleaned_at = 0.0
+_scan_jobs_ready = False
+_scan_jobs_lock = threading.Lock()
+
+
+def get_jobs_db():
+    """Connection to the scan job database; the table is created on first use."""
+    global _scan_jobs_ready
+    conn = sqlite3.connect(SCAN_JOBS_DB, check_same_thread=False)
+    if not _scan_jobs_ready:
+        with _scan_jobs_lock:
+            if not _scan_jobs_ready:
+                _create_scan_jobs_table(conn)
+                _scan_jobs_ready = True
+    return conn
+
+
+def _create_scan_jobs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scan_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            status TEXT NOT NULL,  -- 'queued', 'running', 'done' or 'failed'
+            callback_url TEXT,
+            result TEXT,  -- JSON payload (prediction or error)
+            http_status INTEGER,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            expires_at REAL NOT NULL  -- rows past this are deleted (TTL)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_jobs_expires ON scan_jobs (expires_at)")
+    conn.commit()
+
+
+def _update_scan_job(job_id, status, result=None, http_status=None):
+    now = time.time()
+    conn = get_jobs_db()
+    conn.execute(
+        "UPDATE scan_jobs SET status=?, result=?, http_status=?, updated_at=?, expires_at=? WHERE id=?",
+        (status, json.dumps(result) if result is not None else None, http_status,
+         now, now + SCAN_JOB_TTL_SECONDS, job_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def _cleanup_expired_scan_jobs():
+    """Drop finished/abandoned jobs past their TTL (at most once a minute)."""
+    global _scan_jobs_cleaned_at
+    now = time.time()
+    if now - _scan_jobs_cleaned_at < SCAN_JOB_CLEANUP_INTERVAL_SECONDS:
+        return
+    _scan_jobs_cleaned_at = now
+    conn = get_jobs_db()
+    deleted = conn.execute("DELETE FROM scan_jobs WHERE expires_at < ?", (now,)).rowcount
+    conn.commit()
+    conn.close()
+    if deleted:
+        print(f"Removed {deleted} expired scan job(s)")
+
+
+def _scan_job_body(job_id, status, result=None, http_status=None):
+    body = {"job_id": job_id, "status": status}
+    if status == "done":
+        body["result"] = result
+    elif status == "failed":
+        body["error"] = (result or {}).get("error", "Scan processing failed")
+        body["details"] = result
+        body["http_status"] = http_status
+    return body
+
+
+def _callback_url_error(url):
+    """Why url may not receive a job callback, or None if it may."""
+    if not (SCAN_CALLBACK_HOSTS and SCAN_CALLBACK_SECRET):
+        return "callbacks are not enabled on this server (SCAN_CALLBACK_HOSTS / SCAN_CALLBACK_SECRET)"
+    try:
+        parts = urlparse(url)
+        port = parts.port
+    except ValueError:
+        return "callback_url is not a valid URL"
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        return "callback_url must be an http(s) URL"
+    if host not in SCAN_CALLBACK_HOSTS:
+        return f"callback_url host '{host}' is not allowed"
+    # Checked again before sending, in case the name now resolves elsewhere
+    try:
+        infos = socket.getaddrinfo(host, port or (443 if parts.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except socket.gaierror:
+        return f"callback_url host '{host}' does not resolve"
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            return f"callback_url host '{host}' resolves to a non-public address"
+    return None
+
+
+def _send_scan_job_callback(job_id, callback_url, body):
+    """
+    POST the job body, signed: X-Scan-Signature is
+    sha256=HMAC-SHA256(SCAN_CALLBACK_SECRET, "<X-Scan-Timestamp>.<raw body>").
+    """
+    error = _callback_url_error(callback_url)
+    if error:
+        print(f"scan job {job_id} callback skipped: {error}")
+        return
+    data = json.dumps(body).encode("utf-8")
+    timestamp = str(int(time.time()))
+    signature = hmac.new(SCAN_CALLBACK_SECRET.encode("utf-8"), timestamp.encode("ascii") + b"." + data,
+                         hashlib.sha256).hexdigest()
+    try:
+        requests.post(
+            callback_url,
+            data=data,
+            headers={"Content-Type": "application/json", "X-Scan-Timestamp": timestamp,
+                     "X-Scan-Signature": f"sha256={signature}"},
+            timeout=SCAN_JOB_CALLBACK_TIMEOUT_SECONDS,
+            allow_redirects=False,  # a redirect could point anywhere
+        )
+    except requests.RequestException as e:
+        print(f"scan job {job_id} callback failed: {str(e)}")
+
+
+def _process_scan_job(job_id, filepaths, ocr_profile, user_id, callback_url):
+    _update_scan_job(job_id, "running")
+    try:
+        payload, http_status = run_image_scan(filepaths, ocr_profile, user_id=user_id)
+    except pytesseract.TesseractNotFoundError:
+        payload, http_status = {"error": "Tesseract OCR is not installed or not found at configured path."}, 500
+    except Exception as e:
+        print(f"scan job {job_id} error: {str(e)}")
+        payload, http_status = {"error": f"Scan processing failed: {str(e)}"}, 500
+
+    status = "done" if http_status == 200 else "failed"
+    _update_scan_job(job_id, status, payload, http_status)
+
+    if callback_url:
+        _send_scan_job_callback(job_id, callback_url, _scan_job_body(job_id, status, payload, http_status))
+
+
+@app.route("/scan_jobs", methods=["POST"])
+def create_scan_job():
+    """Queue an image scan and return immediately; poll GET /scan_jobs/<id> or pass callback_url."""
+    _cleanup_expired_scan_jobs()
+
+    images, ocr_profile, error = _parse_scan_upload()
+    if error:
+        return error
+
+    callback_url = (request.form.get("callback_url") or "").strip() or None
+    callback_error = _callback_url_error(callback_url) if callback_url else None
+    if callback_error:
+        return jsonify({"error": callback_error}), 400
+
+    filepaths = _save_uploads(images)
+    job_id = uuid.uuid4().hex
+    user_id = session.get("user_id")
+    now = time.time()
+
+    conn = get_jobs_db()
+    conn.execute(
+        "INSERT INTO scan_jobs (id, user_id, status, callback_url, created_at, updated_at, expires_at) "
+        "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+        (job_id, user_id, callback_url, now, now, now + SCAN_JOB_TTL_SECONDS)
+    )
+    conn.commit()
+    conn.close()
+
+    scan_job_executor.submit(_process_scan_job, job_id, filepaths, ocr_profile, user_id, callback_url)
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for("get_scan_job", job_id=job_id),
+    }), 202
+
+
+@app.route("/scan_jobs/<job_id>", methods=["GET"])
+def get_scan_job(job_id):
+    _cleanup_expired_scan_jobs()
+
+    conn = get_jobs_db()
+    row = conn.execute(
+        "SELECT user_id, status, result, http_status, created_at, updated_at FROM scan_jobs WHERE id=?",
+        (job_id,)
+    ).fetchone()
+    conn.close()
+
+    # Jobs created by a logged-in user are only visible to that user
+    if not row or (row[0] is not None and row[0] != session.get("user_id")):
+        return jsonify({"error": "Job not found"}), 404
+
+    result = json.loads(row[2]) if row[2] else None
+    body = _scan_job_body(job_id, row[1], result, row[3])
+    body["created_at"] = row[4]
+    body["updated_at"] = row[5]
+    return jsonify(body)
+
+
 @app.route("/save_scan", methods=["POST"])
 def save_scan():
     print("Save scan called")
@@ -463,32 +1048,211 @@ def get_history():
 
     user_id = session["user_id"]
 
+    try:
+        # Pull the first batch now so DB errors still return a 500
+        batches = _iter_history_rows(user_id)
+        first = next(batches, None)
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+    def generate():
+        # Serialize batch by batch instead of building the whole history list
+        yield '{"success":true,"history":['
+        sep = ""
+        if first is not None:
+            for _, rows in itertools.chain([first], batches):
+                for row in rows:
+                    yield sep + json.dumps(dict(zip(HISTORY_EXPORT_COLUMNS, row)), separators=(",", ":"))
+                    sep = ","
+        yield "]}"
+
+    return Response(generate(), mimetype="application/json")
+
+
+MAX_IMPORT_SCANS = int(os.getenv("MAX_IMPORT_SCANS", "10000"))
+EXPORT_BATCH_ROWS = 500
+HISTORY_EXPORT_COLUMNS = ["product_name", "ingredients", "result", "allergens_found", "timestamp"]
+
+
+def _scan_import_row(user_id, item):
+    """Validate one imported scan; returns the INSERT params or None."""
+    if not isinstance(item, dict):
+        return None
+    product_name = str(item.get("product_name") or "").strip()
+    result = str(item.get("result") or "").strip()
+    if not product_name or not result:
+        return None
+    allergens_found = item.get("allergens_found", "")
+    if isinstance(allergens_found, list):
+        allergens_found = ",".join(str(a).strip() for a in allergens_found if str(a).strip())
+    return (
+        user_id,
+        product_name,
+        str(item.get("ingredients") or ""),
+        result,
+        str(allergens_found or ""),
+        item.get("timestamp") or None,
+    )
+
+
+@app.route("/import_history", methods=["POST"])
+def import_history():
+    """
+    Bulk-import scans: JSON {"scans": [...]} or an NDJSON body, one scan per
+    line. All rows go in with one executemany() in a single transaction;
+    an existing (user_id, product_name) row is updated instead of failing.
+    """
+    if "user_id" not in session:
+        return jsonify({"success": False, "message": "Not logged in"}), 401
+
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        try:
+            scans = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            return jsonify({"success": False, "message": "Invalid NDJSON body"}), 400
+    else:
+        data = request.get_json(silent=True)
+        scans = data.get("scans") if isinstance(data, dict) else data
+    if not isinstance(scans, list) or not scans:
+        return jsonify({"success": False, "message": "No scans provided"}), 400
+    if len(scans) > MAX_IMPORT_SCANS:
+        return jsonify({"success": False, "message": f"Too many scans. Import at most {MAX_IMPORT_SCANS} per request."}), 400
+
+    user_id = session["user_id"]
+    rows, rejected = [], []
+    for index, item in enumerate(scans):
+        row = _scan_import_row(user_id, item)
+        if row is None:
+            rejected.append(index)
+        else:
+            rows.append(row)
+
     try:
         conn = get_db()
-        c = conn.cursor()
-        c.execute("""
-            SELECT product_name, ingredients, result, allergens_found, timestamp
-            FROM scan_history
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-        """, (user_id,))
-        rows = c.fetchall()
+        with conn:  # one transaction, one commit
+            conn.executemany("""
+                INSERT INTO scan_history (user_id, product_name, ingredients, result, allergens_found, timestamp)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                ON CONFLICT(user_id, product_name) DO UPDATE SET
+                    ingredients = excluded.ingredients,
+                    result = excluded.result,
+                    allergens_found = excluded.allergens_found,
+                    timestamp = excluded.timestamp
+            """, rows)
         conn.close()
-
-        history = []
-        for row in rows:
-            history.append({
-                "product_name": row[0],
-                "ingredients": row[1],
-                "result": row[2],
-                "allergens_found": row[3],
-                "timestamp": row[4]
-            })
-
-        return jsonify({"success": True, "history": history})
     except Exception as e:
+        print("Import error:", str(e))
         return jsonify({"success": False, "message": str(e)}), 500
 
+    return jsonify({
+        "success": True,
+        "received": len(scans),
+        "imported": len(rows),
+        "rejected_indexes": rejected,
+    })
+
+
+def _iter_history_rows(user_id):
+    """Yield scan_history rows in batches from a cursor instead of fetchall()."""
+    conn = get_db()
+    try:
+        cursor = conn.cursor()
+        if user_id is None:
+            cursor.execute(f"""
+                SELECT user_id, {", ".join(HISTORY_EXPORT_COLUMNS)}
+                FROM scan_history
+                ORDER BY user_id, timestamp DESC
+            """)
+        else:
+            cursor.execute(f"""
+                SELECT {", ".join(HISTORY_EXPORT_COLUMNS)}
+                FROM scan_history
+                WHERE user_id = ?
+                ORDER BY timestamp DESC
+            """, (user_id,))
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+            if not rows:
+                break
+            yield cursor.description, rows
+    finally:
+        conn.close()
+
+
+def _export_ndjson(user_id):
+    for description, rows in _iter_history_rows(user_id):
+        names = [d[0] for d in description]
+        yield "".join(json.dumps(dict(zip(names, row))) + "\n" for row in rows)
+
+
+def _export_csv(user_id):
+    header_written = False
+    for description, rows in _iter_history_rows(user_id):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if not header_written:
+            writer.writerow([d[0] for d in description])
+            header_written = True
+        writer.writerows(rows)
+        yield buf.getvalue()
+
+
+@app.route("/export_history", methods=["GET"])
+def export_history():
+    """
+    Stream scan history as NDJSON (default) or CSV (?format=csv).
+    With SCAN_EXPORT_TOKEN set, a matching X-Export-Token header exports
+    every user's history (nightly analytics job).
+    """
+    export_token = os.getenv("SCAN_EXPORT_TOKEN", "")
+    if export_token and hmac.compare_digest(request.headers.get("X-Export-Token", "").encode(), export_token.encode()):
+        user_id = None
+    elif "user_id" in session:
+        user_id = session["user_id"]
+    else:
+        return jsonify({"success": False, "message": "Not logged in"}), 401
+
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if fmt == "csv":
+        return Response(_export_csv(user_id), mimetype="text/csv",
+                        headers={"Content-Disposition": "attachment; filename=scan_history.csv"})
+    if fmt in ("ndjson", "jsonl"):
+        return Response(_export_ndjson(user_id), mimetype="application/x-ndjson")
+    return jsonify({"success": False, "message": "format must be ndjson or csv"}), 400
+
+
+def personalized_advice(product_name, detected_allergens, user_allergies, ingredients_text):
+    """
+    generate_personalized_advice on the LLM pool, reusing advice stored for a
+    near-identical ingredient text with the same product name, detected and
+    user allergens. The advice names the product, so it is never served for
+    another one.
+    """
+    cleaned = clean_text(ingredients_text)
+    near, signature = _near_duplicate(cleaned)
+    product = " ".join((product_name or "").lower().split())
+    key = f"{product}|{','.join(sorted(detected_allergens))}|{','.join(sorted(user_allergies))}"
+    stored = dict((near["payload"].get("advice") or {}) if near else {})
+    if key in stored:
+        metrics.NEAR_DUP_REUSE.inc(kind="advice")
+        return stored[key]
+
+    advice = _run_llm(generate_personalized_advice,
+        product_name=product_name,
+        detected_allergens=detected_allergens,
+        user_allergies=user_allergies,
+        ingredients_text=ingredients_text,
+    )
+    if signature is not None:
+        stored[key] = advice
+        while len(stored) > NEAR_DUP_ADVICE_PER_ENTRY:
+            stored.pop(next(iter(stored)))
+        if near is None:
+            near_dup_index.insert(cleaned, {"source": "history", "advice": stored}, signature)
+        else:
+            near_dup_index.update(near["id"], {"advice": stored})
+    return advice
+
 
 @app.route("/get_ai_advice", methods=["POST"])
 def get_ai_advice():
@@ -509,7 +1273,7 @@ def get_ai_advice():
         return jsonify({"success": True, "advice": "No allergens detected. This product appears to be safe for you!"})
 
     try:
-        payload = generate_personalized_advice(
+        payload = personalized_advice(
             product_name=product_name,
             detected_allergens=_parse_csv_list(allergens),
             user_allergies=_parse_csv_list(user_allergies) or _get_session_user_allergies(),
@@ -543,7 +1307,7 @@ def llm_personalized_advice():
     user_allergies = _get_session_user_allergies()
 
     try:
-        advice = generate_personalized_advice(
+        advice = personalized_advice(
             product_name=product_name,
             detected_allergens=detected_allergens,
             user_allergies=user_allergies,
@@ -573,7 +1337,7 @@ def llm_alternatives():
     user_allergies = _get_session_user_allergies()
 
     try:
-        alternatives = generate_alternatives(
+        alternatives = _run_llm(generate_alternatives,
             product_name=product_name,
             detected_allergens=detected_allergens,
             user_allergies=user_allergies,
@@ -598,7 +1362,7 @@ def llm_emergency_guidance():
         return jsonify({"success": False, "message": "symptoms is required"}), 400
 
     try:
-        guidance = generate_emergency_guidance(
+        guidance = _run_llm(generate_emergency_guidance,
             suspected_allergen=suspected_allergen or "unknown",
             symptoms=symptoms,
             has_epinephrine=has_epinephrine,
@@ -633,24 +1397,104 @@ def llm_faq():
         return jsonify({"success": False, "message": "Too many requests. Please wait a minute and try again."}), 429
 
     try:
-        answer = answer_faq_question(question=question, user_allergies=_get_session_user_allergies())
+        answer = _run_llm(answer_faq_question, question=question, user_allergies=_get_session_user_allergies())
         return jsonify({"success": True, **answer})
     except LLMServiceError as e:
         print(f"FAQ LLM unavailable: {str(e)}")
+        metrics.LLM_ROUTE_CALLS.inc(route="local_faq_fallback", outcome="ok")
         fallback = _local_faq_fallback(question)
         return jsonify({"success": True, **fallback})
     except Exception as e:
         print(f"Unexpected FAQ error: {str(e)}")
+        metrics.LLM_ROUTE_CALLS.inc(route="local_faq_fallback", outcome="error")
         fallback = _local_faq_fallback(question)
         return jsonify({"success": True, **fallback})
 
 
+@app.route("/prediction_cache/stats", methods=["GET"])
+def prediction_cache_stats():
+    return jsonify({"success": True, **prediction_cache.stats()})
+
+
+def _prediction_cache_families():
+    # No hit-ratio gauge: gauges are summed across gunicorn workers, and the
+    # ratio is rate(lookups{result="hit"}) / rate(lookups) in Prometheus
+    stats = prediction_cache.stats()
+    return [
+        ("allergy_prediction_cache_lookups_total", "counter", "Prediction cache lookups by result.",
+         [("allergy_prediction_cache_lookups_total", {"result": "hit"}, stats["hits"]),
+          ("allergy_prediction_cache_lookups_total", {"result": "miss"}, stats["misses"])]),
+        ("allergy_prediction_cache_entries", "gauge", "Entries in the prediction cache.",
+         [("allergy_prediction_cache_entries", {}, stats["entries"])]),
+        ("allergy_prediction_cache_evictions_total", "counter", "LRU evictions.",
+         [("allergy_prediction_cache_evictions_total", {}, stats["evictions"])]),
+    ]
+
+
+metrics.REGISTRY.add_collector(_prediction_cache_families)
+
+
+@app.route("/near_duplicates/stats", methods=["GET"])
+def near_duplicate_stats():
+    return jsonify({"success": True, "enabled": NEAR_DUP_ENABLED, **near_dup_index.stats()})
+
+
+def _near_dup_families():
+    stats = near_dup_index.stats()
+    return [
+        ("allergy_near_duplicate_lookups_total", "counter", "Near-duplicate index lookups by result.",
+         [("allergy_near_duplicate_lookups_total", {"result": "hit"}, stats["hits"]),
+          ("allergy_near_duplicate_lookups_total", {"result": "miss"}, stats["misses"])]),
+        ("allergy_near_duplicate_entries", "gauge", "Entries in the near-duplicate index.",
+         [("allergy_near_duplicate_entries", {}, stats["entries"])]),
+    ]
+
+
+metrics.REGISTRY.add_collector(_near_dup_families)
+
+
+@app.route("/ocr_spelling/stats", methods=["GET"])
+def ocr_spelling_stats():
+    return jsonify({"success": True, "enabled": OCR_SPELLING_ENABLED, **ocr_speller.stats()})
+
+
+@app.route("/image_hash_index/stats", methods=["GET"])
+def image_hash_stats():
+    return jsonify({"success": True, "enabled": IMAGE_HASH_ENABLED, **image_hash_index.stats()})
+
+
+def _image_hash_families():
+    stats = image_hash_index.stats()
+    return [
+        ("allergy_image_hash_lookups_total", "counter", "Perceptual-hash image index lookups by result.",
+         [("allergy_image_hash_lookups_total", {"result": "hit"}, stats["hits"]),
+          ("allergy_image_hash_lookups_total", {"result": "miss"}, stats["misses"])]),
+        ("allergy_image_hash_entries", "gauge", "Scanned images in the perceptual-hash index.",
+         [("allergy_image_hash_entries", {}, stats["entries"])]),
+    ]
+
+
+metrics.REGISTRY.add_collector(_image_hash_families)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition (per worker process)."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/")
 def home():
     return redirect(url_for("login"))
 
 
 
+def shutdown_executors(wait=True):
+    """Stop the worker pools; with wait=True in-flight scans and LLM calls finish first."""
+    for executor in (scan_job_executor, cpu_executor, llm_executor):
+        executor.shutdown(wait=wait)
+
+
 ###################################
 # RUN APP
 ###################################
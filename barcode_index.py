@@ -0,0 +1,289 @@
+"""
+Local barcode -> product lookup built from the Open Food Facts Parquet dump.
+
+    python barcode_index.py build food.parquet                 # -> models/barcode_index.db
+    python barcode_index.py lookup 3017620422003
+
+The index is a single SQLite table keyed by the normalized barcode
+(WITHOUT ROWID, so the primary-key B-tree holds the rows and a lookup is
+one index descent). It is built into a temporary file and swapped in with
+os.replace(), so a running server picks up a rebuild without seeing a
+half-written file. Allergens are stored as the classifier's labels
+(milk, tree_nut, ...), mapped from OFF allergens_tags.
+
+detect_barcodes() finds EAN/UPC codes in an image with OpenCV's barcode
+module; without it (opencv builds before 4.8) it returns nothing and
+callers fall back to OCR.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from data_loader import PARQUET_PATH, iter_record_batches
+
+INDEX_PATH = "models/barcode_index.db"
+INSERT_BATCH_ROWS = 10_000
+
+INDEX_COLUMNS = {
+    "code": "code",
+    "product_name": "product_name",
+    "ingredients_text": "ingredients_text",
+    "allergens": "allergens_tags",
+}
+
+# OFF allergen tag (without the 'en:' prefix) -> classifier label
+OFF_ALLERGEN_TAGS = {
+    "milk": "milk",
+    "eggs": "egg", "egg": "egg",
+    "peanuts": "peanut", "peanut": "peanut",
+    "nuts": "tree_nut", "tree-nuts": "tree_nut", "almonds": "tree_nut", "almond": "tree_nut",
+    "hazelnuts": "tree_nut", "hazelnut": "tree_nut", "walnuts": "tree_nut", "walnut": "tree_nut",
+    "cashew-nuts": "tree_nut", "cashew": "tree_nut", "pecan-nuts": "tree_nut", "pecan": "tree_nut",
+    "pistachio-nuts": "tree_nut", "brazil-nuts": "tree_nut", "macadamia-nuts": "tree_nut",
+    "soybeans": "soy", "soy": "soy", "soya": "soy",
+    "wheat": "wheat",
+    "gluten": "gluten",
+    "sesame-seeds": "sesame", "sesame": "sesame",
+    "fish": "fish",
+    "crustaceans": "shellfish", "molluscs": "shellfish", "shellfish": "shellfish",
+    "mustard": "mustard",
+}
+
+
+def normalize_code(code: Any) -> Optional[str]:
+    """
+    Digits only; UPC-A (12 digits) and shorter non-EAN-8 codes are
+    zero-padded to EAN-13, the form OFF mostly uses. None if no digits.
+    """
+    if code is None:
+        return None
+    digits = "".join(ch for ch in str(code) if ch.isdigit())
+    if not digits:
+        return None
+    if len(digits) != 8 and len(digits) < 13:
+        digits = digits.zfill(13)
+    return digits
+
+
+def valid_checksum(code: str) -> bool:
+    """GS1 check digit test for EAN-8 / UPC-A / EAN-13 / GTIN-14."""
+    if not code.isdigit() or len(code) not in (8, 12, 13, 14):
+        return False
+    body, check = code[:-1], int(code[-1])
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return (10 - total % 10) % 10 == check
+
+
+def parse_allergen_tags(raw: Optional[str]) -> List[str]:
+    """'en:milk,en:nuts' -> ['milk', 'tree_nut'] (unknown tags are dropped)."""
+    labels = set()
+    for token in (raw or "").split(","):
+        token = token.strip().lower().split(":")[-1]
+        if token in OFF_ALLERGEN_TAGS:
+            labels.add(OFF_ALLERGEN_TAGS[token])
+    return sorted(labels)
+
+
+###################################
+# BUILD
+###################################
+def _rows(batches) -> Iterable[tuple]:
+    for batch in batches:
+        columns = batch.to_pydict()
+        for code, name, ingredients, allergens in zip(
+            columns["code"], columns["product_name"], columns["ingredients_text"], columns["allergens"]
+        ):
+            code = normalize_code(code)
+            if not code:
+                continue
+            tags = parse_allergen_tags(allergens)
+            # Nothing to answer from: no ingredients and no declared allergens
+            if not (ingredients and str(ingredients).strip()) and not tags:
+                continue
+            yield code, name, ingredients, ",".join(tags)
+
+
+def build_index(parquet_path: str = PARQUET_PATH, out_path: str = INDEX_PATH) -> Dict[str, Any]:
+    """Stream the dump into a fresh index file and swap it in. Returns build stats."""
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE products ("
+            "code TEXT PRIMARY KEY, product_name TEXT, ingredients_text TEXT, allergens TEXT"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        rows = _rows(iter_record_batches(parquet_path, INDEX_COLUMNS, require_ingredients=False))
+        chunk = []
+        seen = 0
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= INSERT_BATCH_ROWS:
+                # Duplicate codes in the dump: the last row wins
+                conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)", chunk)
+                seen += len(chunk)
+                chunk = []
+        if chunk:
+            conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)", chunk)
+            seen += len(chunk)
+
+        products = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("source", os.path.abspath(parquet_path)),
+            ("built_at", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+            ("products", str(products)),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, out_path)
+    return {
+        "rows_read": seen,
+        "products": products,
+        "bytes": os.path.getsize(out_path),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+###################################
+# LOOKUP
+###################################
+class BarcodeIndex:
+    """
+    Read-only, thread-safe lookups (one SQLite connection per thread). A
+    missing index file just means every lookup misses; a rebuilt file is
+    picked up on the next lookup.
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.mtime != mtime:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn, self._local.mtime = conn, mtime
+        return conn
+
+    def lookup(self, code: Any) -> Optional[Dict[str, Any]]:
+        code = normalize_code(code)
+        conn = self._connection() if code else None
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT code, product_name, ingredients_text, allergens FROM products WHERE code=?", (code,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "barcode": row[0],
+            "product_name": row[1] or "",
+            "ingredients_text": row[2] or "",
+            "declared_allergens": [a for a in (row[3] or "").split(",") if a],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        if conn is None:
+            return {"available": False, "path": self.path}
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        return {"available": True, "path": self.path, "bytes": os.path.getsize(self.path), **meta}
+
+
+###################################
+# DETECTION
+###################################
+_detector_local = threading.local()
+
+
+def _detector():
+    if not hasattr(_detector_local, "detector"):
+        import cv2
+
+        barcode = getattr(cv2, "barcode", None)
+        _detector_local.detector = barcode.BarcodeDetector() if barcode is not None else None
+    return _detector_local.detector
+
+
+def detect_barcodes(image: np.ndarray) -> List[str]:
+    """Decoded EAN/UPC codes with a valid check digit, normalized; [] if none or unsupported."""
+    detector = _detector()
+    if detector is None or image is None:
+        return []
+    try:
+        # 4.x returns (ok, infos, types, points), 5.x (ok, infos, points, ...)
+        result = detector.detectAndDecodeMulti(image)
+    except Exception:
+        return []
+    codes = []
+    for info in (result[1] or ()) if result and result[0] else ():
+        digits = "".join(ch for ch in str(info) if ch.isdigit())
+        if digits and valid_checksum(digits):
+            code = normalize_code(digits)
+            if code not in codes:
+                codes.append(code)
+    return codes
+
+
+def detect_barcodes_in_file(path: str) -> List[str]:
+    import cv2
+
+    return detect_barcodes(cv2.imread(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local barcode index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build the index from the OFF Parquet dump")
+    build.add_argument("parquet", nargs="?", default=PARQUET_PATH)
+    build.add_argument("--out", default=INDEX_PATH)
+    lookup = sub.add_parser("lookup", help="Look up barcodes")
+    lookup.add_argument("codes", nargs="+")
+    lookup.add_argument("--index", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"Indexing {args.parquet} -> {args.out} ...")
+        stats = build_index(args.parquet, args.out)
+        print(f"{stats['products']:,} products from {stats['rows_read']:,} rows, "
+              f"{stats['bytes'] / 1e6:.1f} MB in {stats['seconds']:.1f}s")
+        return
+
+    index = BarcodeIndex(args.index)
+    if not index.available:
+        raise SystemExit(f"No index at {args.index}; run: python barcode_index.py build")
+    for code in args.codes:
+        start = time.perf_counter()
+        product = index.lookup(code)
+        ms = (time.perf_counter() - start) * 1000
+        print(f"{code}: {product if product else 'not found'}  ({ms:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# bench_image_hash.py
+# Recognition rate, false-match rate and latency of the perceptual-hash
+# image index (image_hash_index.py) on synthetic label photos.
+#
+#   python bench_image_hash.py
+#   python bench_image_hash.py --count 300 --pad 20000 --out image_hash.json
+#   python bench_image_hash.py --csv off_sample_10k.csv --max-distance 32 --phash-max-distance 12
+#
+# Each label is "scanned" once clean and stored; it is then re-shot with the
+# synth_labels distortion buckets plus a reframed crop (a slightly different
+# distance / angle), which should match its own entry. Labels that were
+# never stored are shot the same way and must not match anything; so must
+# re-shots matching another label's entry. Both count as false matches.
+# Without --csv the labels are shuffled ingredient lists built from the seed
+# texts: same font and layout, different words.
+#
+# The hardest case is reported separately: --variants copies of each stored
+# label with one ingredient swapped for an allergen ("rice flour" ->
+# "milk powder"), shot the same way. Any match there would hide the added
+# allergen if the stored OCR were reused, which is why app.py only reports
+# image matches and always OCRs the panel.
+import argparse
+import io
+import json
+import random
+import time
+
+import numpy as np
+
+from image_hash_index import MAX_DISTANCE, PHASH_MAX_DISTANCE, ImageHashIndex, hamming, image_hashes
+from synth_labels import BUCKETS, SEED_TEXTS, load_texts, render_label
+
+RESHOT_BUCKETS = ["skew_3", "blur_light", "uneven_light", "noisy", "phone_photo", "low_res"]
+# Swapped into a label for the single-ingredient variants
+VARIANT_INGREDIENTS = ["peanuts", "milk powder", "sesame", "eggs", "almonds", "soy flour", "mustard", "celery"]
+
+
+def shuffled_texts(count, rng):
+    items = sorted({i.strip(" .") for t in SEED_TEXTS for i in t.split(",") if i.strip(" .")})
+    return [", ".join(rng.sample(items, rng.randint(6, 14))) + "." for _ in range(count)]
+
+
+def variant(text, rng):
+    """text with one ingredient replaced by an allergen ingredient."""
+    items = text.rstrip(" .").split(", ")
+    i = rng.randrange(len(items))
+    items[i] = rng.choice([x for x in VARIANT_INGREDIENTS if x != items[i]])
+    return ", ".join(items) + "."
+
+
+def reframe(img, rng):
+    """Crop up to 6% off each side and rescale: the same label shot from a little closer / further."""
+    w, h = img.size
+    box = [int(w * rng.uniform(0, 0.06)), int(h * rng.uniform(0, 0.06)),
+           int(w * (1 - rng.uniform(0, 0.06))), int(h * (1 - rng.uniform(0, 0.06)))]
+    return img.crop(box).resize((int(w * rng.uniform(0.7, 1.3)), int(h * rng.uniform(0.7, 1.3))))
+
+
+def as_jpeg(img):
+    """Round-trip through JPEG so hashing includes decoding an upload."""
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=88)
+    return buf.getvalue()
+
+
+def shots(text, rng, buckets):
+    for bucket in buckets:
+        yield bucket, render_label(text, BUCKETS[bucket], rng)
+    yield "reframed", reframe(render_label(text, {}, rng), rng)
+
+
+def _percentiles(values):
+    return {"mean": float(np.mean(values)), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the perceptual-hash image index.")
+    parser.add_argument("--csv", help="Training CSV with ingredients_text (default: shuffled seed ingredients)")
+    parser.add_argument("--count", type=int, default=100, help="Labels stored (and as many never stored)")
+    parser.add_argument("--pad", type=int, default=10_000, help="Random extra entries in the index")
+    parser.add_argument("--variants", type=int, default=2, help="Single-ingredient variants per stored label")
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE)
+    parser.add_argument("--phash-max-distance", type=int, default=PHASH_MAX_DISTANCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON here")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.csv:
+        texts = load_texts(args.csv, 2 * args.count, args.seed)
+    else:
+        texts = shuffled_texts(2 * args.count, rng)
+    stored, unseen = texts[:len(texts) // 2], texts[len(texts) // 2:]
+
+    index = ImageHashIndex(max_distance=args.max_distance, phash_max_distance=args.phash_max_distance,
+                           max_entries=args.count + args.pad)
+    np_rng = np.random.default_rng(args.seed)
+    dhashes = []  # for the linear-scan comparison
+    for _ in range(args.pad):
+        hashes = (int.from_bytes(np_rng.bytes(32), "big"), int.from_bytes(np_rng.bytes(8), "big"))
+        index.add(hashes, {"pad": True})
+        dhashes.append(hashes[0])
+    ids = {}
+    hash_ms = []
+    for i, text in enumerate(stored):
+        data = as_jpeg(render_label(text, {}, rng))
+        start = time.perf_counter()
+        hashes = image_hashes(io.BytesIO(data))
+        hash_ms.append((time.perf_counter() - start) * 1000)
+        ids[index.add(hashes, {"label": i})] = i
+        dhashes.append(hashes[0])
+
+    lookup_ms, linear_ms = [], []
+    per_bucket = {}
+    false_unseen = 0
+    unseen_shots = 0
+    for label_set, is_stored in ((stored, True), (unseen, False)):
+        for i, text in enumerate(label_set):
+            for bucket, img in shots(text, rng, RESHOT_BUCKETS):
+                data = as_jpeg(img)
+                start = time.perf_counter()
+                hashes = image_hashes(io.BytesIO(data))
+                hash_ms.append((time.perf_counter() - start) * 1000)
+                match = None
+                if hashes is not None:
+                    start = time.perf_counter()
+                    match = index.lookup(hashes)
+                    lookup_ms.append((time.perf_counter() - start) * 1000)
+                    if len(linear_ms) < 200:
+                        start = time.perf_counter()
+                        [d for d in dhashes if hamming(hashes[0], d) <= args.max_distance]
+                        linear_ms.append((time.perf_counter() - start) * 1000)
+                if is_stored:
+                    row = per_bucket.setdefault(bucket, {"shots": 0, "recognized": 0, "wrong_label": 0})
+                    row["shots"] += 1
+                    if match is not None:
+                        if ids.get(match["id"]) == i:
+                            row["recognized"] += 1
+                        else:
+                            row["wrong_label"] += 1
+                else:
+                    unseen_shots += 1
+                    false_unseen += match is not None
+
+    variant_shots = variant_matches = 0
+    for i, text in enumerate(stored):
+        for _ in range(args.variants):
+            for bucket, img in shots(variant(text, rng), rng, ["clean"] + RESHOT_BUCKETS):
+                hashes = image_hashes(io.BytesIO(as_jpeg(img)))
+                match = index.lookup(hashes) if hashes is not None else None
+                variant_shots += 1
+                variant_matches += match is not None and ids.get(match["id"]) == i
+
+    reshots = sum(r["shots"] for r in per_bucket.values())
+    wrong = sum(r["wrong_label"] for r in per_bucket.values())
+    results = {
+        "labels_stored": len(stored),
+        "index_entries": len(index),
+        "max_distance": args.max_distance,
+        "phash_max_distance": args.phash_max_distance,
+        "recognition_rate": sum(r["recognized"] for r in per_bucket.values()) / reshots,
+        "false_match_rate": (wrong + false_unseen) / (reshots + unseen_shots),
+        "false_matches": {"wrong_label": wrong, "never_stored": false_unseen,
+                          "never_stored_shots": unseen_shots},
+        "variant_match_rate": variant_matches / max(1, variant_shots),
+        "variant_matches": {"matched": variant_matches, "shots": variant_shots},
+        "per_bucket": {b: {**r, "recognition_rate": r["recognized"] / r["shots"]} for b, r in per_bucket.items()},
+        "hash_ms": _percentiles(hash_ms),
+        "lookup_ms": _percentiles(lookup_ms),
+        "linear_scan_ms": _percentiles(linear_ms),
+    }
+
+    print(f"{len(stored)} labels stored, index of {len(index)} entries, "
+          f"radius {args.max_distance} (dHash) / {args.phash_max_distance} (pHash)")
+    print(f"{'bucket':14s} {'recognized':>10s} {'wrong':>6s}")
+    for bucket, r in results["per_bucket"].items():
+        print(f"{bucket:14s} {r['recognition_rate']:10.1%} {r['wrong_label']:6d}")
+    print(f"Recognition rate: {results['recognition_rate']:.1%}")
+    print(f"False-match rate: {results['false_match_rate']:.2%} "
+          f"({wrong} wrong label, {false_unseen}/{unseen_shots} never-stored shots matched)")
+    if variant_shots:
+        print(f"Single-ingredient variants matching the original: {results['variant_match_rate']:.1%} "
+              f"({variant_matches}/{variant_shots} shots)")
+    for name in ("hash_ms", "lookup_ms", "linear_scan_ms"):
+        r = results[name]
+        print(f"{name:15s} mean {r['mean']:.3f}  p50 {r['p50']:.3f}  p95 {r['p95']:.3f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# bench_labels.py
+# Compares the row-by-row label builder with build_label_matrix() on
+# synthetic OFF-like rows. Run: python bench_labels.py [--rows 1000000]
+import argparse
+import time
+
+import numpy as np
+
+from test_labels import _random_frame
+from train_model import TARGET_ALLERGENS, build_label_matrix, build_labels
+from sklearn.preprocessing import MultiLabelBinarizer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # Build a 10k-row pool and tile it; generating 1M random rows in Python
+    # would take longer than the benchmark itself.
+    pool = _random_frame(10_000, seed=1)
+    reps = -(-args.rows // len(pool))
+    df = pool.loc[np.tile(pool.index, reps)[: args.rows]].reset_index(drop=True)
+    print(f"Rows: {len(df):,}")
+
+    t0 = time.perf_counter()
+    Y_fast = build_label_matrix(df)
+    fast = time.perf_counter() - t0
+    print(f"build_label_matrix : {fast:8.2f}s  ({len(df) / fast:,.0f} rows/s)")
+
+    t0 = time.perf_counter()
+    mlb = MultiLabelBinarizer(classes=TARGET_ALLERGENS)
+    Y_slow = mlb.fit_transform(df.apply(build_labels, axis=1))
+    slow = time.perf_counter() - t0
+    print(f"apply(build_labels): {slow:8.2f}s  ({len(df) / slow:,.0f} rows/s)")
+
+    print(f"Speedup: {slow / fast:.1f}x, identical: {np.array_equal(Y_fast, Y_slow)}")
+
+
+if __name__ == "__main__":
+    main()
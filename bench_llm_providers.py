@@ -0,0 +1,142 @@
+# bench_llm_providers.py
+# Compare LLM backends on the app's real prompts: load time, latency,
+# tokens/sec and how often the reply parses as the expected JSON.
+#
+#   python bench_llm_providers.py --providers huggingface
+#   LLAMA_MODEL_PATH=models/qwen2.5-1.5b-instruct-q4_k_m.gguf python bench_llm_providers.py --providers llama_cpp
+#   python bench_llm_providers.py --providers huggingface,openai_compatible --repeats 10 --out llm_bench.json
+#
+# Providers are configured exactly as in the app (see llm_service.py PROVIDERS).
+# When a backend does not report completion tokens (hf-inference), they are
+# estimated from the reply text and the row is marked "estimated".
+import argparse
+import json
+import re
+import time
+
+import numpy as np
+
+import llm_service
+from llm_service import LLMServiceError
+
+PROMPTS = {
+    "advice": (llm_service._advice_prompt(
+        "Choco Hazelnut Spread", ["milk", "hazelnut", "soy"], ["milk", "tree nuts"],
+        "Sugar, palm oil, hazelnuts 13%, skimmed milk powder 8.7%, fat-reduced cocoa 7.4%, "
+        "emulsifier: lecithins (soya), vanillin."), 260, 0.1),
+    "alternatives": (llm_service._alternatives_prompt(
+        "Choco Hazelnut Spread", ["milk", "hazelnut"], ["milk", "tree nuts"]), 300, 0.3),
+    "emergency": (llm_service._emergency_prompt(
+        "peanut", "itchy mouth, hives on the arms, mild stomach cramps", "yes", "adult"), 320, 0.1),
+    "faq": (llm_service._faq_prompt(
+        "What does 'may contain traces of nuts' mean?", ["peanut"]), 220, 0.2),
+}
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    # Rough BPE-like count: words and punctuation marks
+    return len(_TOKEN_RE.findall(text))
+
+
+def bench_provider(name, kinds, repeats):
+    start = time.perf_counter()
+    try:
+        provider = llm_service._build_provider(name)
+        provider.warm_up()
+    except LLMServiceError as e:
+        return {"provider": name, "error": str(e)}
+    load_ms = (time.perf_counter() - start) * 1000
+
+    rows = []
+    for kind in kinds:
+        prompt, max_new_tokens, temperature = PROMPTS[kind]
+        for _ in range(repeats):
+            start = time.perf_counter()
+            try:
+                result = provider.complete(prompt, max_new_tokens, temperature)
+            except LLMServiceError as e:
+                rows.append({"kind": kind, "ms": (time.perf_counter() - start) * 1000, "error": str(e)})
+                continue
+            ms = (time.perf_counter() - start) * 1000
+            try:
+                llm_service._extract_json_object(result["text"])
+                json_ok = True
+            except LLMServiceError:
+                json_ok = False
+            tokens = result["completion_tokens"]
+            rows.append({
+                "kind": kind,
+                "ms": ms,
+                "tokens": tokens if tokens is not None else estimate_tokens(result["text"]),
+                "estimated": tokens is None,
+                "json_ok": json_ok,
+            })
+
+    ok = [r for r in rows if "error" not in r]
+    latencies = [r["ms"] for r in ok]
+    total_tokens = sum(r["tokens"] for r in ok)
+    total_seconds = sum(latencies) / 1000
+    return {
+        "provider": name,
+        "load_ms": load_ms,
+        "requests": len(rows),
+        "errors": len(rows) - len(ok),
+        "first_ms": rows[0]["ms"] if rows else None,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else None,
+        "tokens_per_s": (total_tokens / total_seconds) if total_seconds else None,
+        "tokens_estimated": any(r["estimated"] for r in ok),
+        "json_ok_rate": (sum(r["json_ok"] for r in ok) / len(ok)) if ok else None,
+        "by_kind": {
+            kind: float(np.median([r["ms"] for r in ok if r["kind"] == kind]))
+            for kind in kinds if any(r["kind"] == kind for r in ok)
+        },
+        "sample_errors": sorted({r["error"] for r in rows if "error" in r})[:3],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM providers on the app's prompts.")
+    parser.add_argument("--providers", default="huggingface", help="huggingface, llama_cpp, openai_compatible")
+    parser.add_argument("--kinds", default=",".join(PROMPTS))
+    parser.add_argument("--repeats", type=int, default=5, help="Requests per prompt kind")
+    parser.add_argument("--out", help="Write results as JSON here")
+    args = parser.parse_args()
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in PROMPTS]
+    if unknown:
+        raise SystemExit(f"Unknown prompt kind(s): {', '.join(unknown)}")
+
+    results = []
+    for name in [p.strip() for p in args.providers.split(",") if p.strip()]:
+        print(f"Benchmarking {name} ...")
+        results.append(bench_provider(name, kinds, args.repeats))
+
+    print(f"\n{'provider':<19}{'load ms':>9}{'first ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'tok/s':>8}{'json ok':>9}{'errors':>8}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['provider']:<19}  unavailable: {r['error']}")
+            continue
+
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else "n/a"
+
+        tok = fmt(r["tokens_per_s"], ".1f") + ("*" if r["tokens_estimated"] else "")
+        print(f"{r['provider']:<19}{r['load_ms']:>9.0f}{fmt(r['first_ms'], '.0f'):>10}{fmt(r['p50_ms'], '.0f'):>9}"
+              f"{fmt(r['p95_ms'], '.0f'):>9}{tok:>8}{fmt(r['json_ok_rate'], '.2f'):>9}{r['errors']:>8}")
+        for message in r["sample_errors"]:
+            print(f"    error: {message}")
+    if any(r.get("tokens_estimated") for r in results):
+        print("* completion tokens estimated from the reply text")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# bench_normalizer.py
+# Times the old per-call regex cleaning against text_normalizer.
+# Run: python bench_normalizer.py [--rows 200000]
+import argparse
+import re
+import time
+
+from test_normalizer import SAMPLES, _random_texts
+from text_normalizer import clean_text, clean_texts
+
+
+def regex_clean(text):
+    # Pre-text_normalizer implementation (regexes compiled on the fly)
+    if not isinstance(text, str):
+        return ""
+    s = text.lower()
+    s = re.sub(r"[^a-z0-9,;()\-/%\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+def _time(label, fn, n):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28} {elapsed:7.3f}s  {n / elapsed:>12,.0f} texts/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    # Mostly realistic label text plus some random noise
+    pool = SAMPLES[:-1] * 50 + _random_texts(100, seed=2)
+    texts = (pool * (args.rows // len(pool) + 1))[: args.rows]
+    print(f"Texts: {len(texts):,}")
+
+    base = _time("regex (old clean_text)", lambda: [regex_clean(t) for t in texts], len(texts))
+    single = _time("clean_text", lambda: [clean_text(t) for t in texts], len(texts))
+    batch = _time("clean_texts (batched)", lambda: clean_texts(texts), len(texts))
+    print(f"Speedup vs regex: single {base / single:.1f}x, batched {base / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench_ocr_profiles.py
+# Latency and allergen recall of each OCR preprocessing profile.
+#
+#   python bench_ocr_profiles.py                                   # test_img.png
+#   python bench_ocr_profiles.py --images "labels/*.png" --labels labels.json
+#   python bench_ocr_profiles.py --images test_img.png --expected milk,wheat,soy
+#
+# labels.json maps image path -> list of allergens expected on that label.
+# Needs Tesseract installed (set TESSERACT_CMD if it is not on the default path).
+import argparse
+import glob
+import json
+import time
+
+import cv2
+import numpy as np
+
+import ocr_service
+from allergen_predictor import load_models, predict_one
+from text_normalizer import clean_text
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_profile(profile, images, expected, repeats, models):
+    latencies, pre_ms, tess_ms, noise = [], [], [], []
+    found_total, expected_total = 0, 0
+    for path in images:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            ocr = ocr_service.ocr_image_detailed(path, profile=profile, check_quality=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+            pre_ms.append(ocr["preprocess_ms"])
+            tess_ms.append(ocr["tesseract_ms"])
+        if ocr["noise_sigma"] is not None:
+            noise.append(f"{ocr['noise_sigma']:.1f}->{ocr['profile']}")
+
+        wanted = set(expected.get(path, []))
+        if wanted:
+            detected = set(predict_one(clean_text(ocr["text"]), *models)["combined_allergens"])
+            found_total += len(wanted & detected)
+            expected_total += len(wanted)
+
+    return {
+        "profile": profile,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "preprocess_p50_ms": _percentile(pre_ms, 50),
+        "tesseract_p50_ms": _percentile(tess_ms, 50),
+        "allergen_recall": (found_total / expected_total) if expected_total else None,
+        "auto_choices": noise,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR preprocessing profiles.")
+    parser.add_argument("--images", default="test_img.png", help="Glob of label images")
+    parser.add_argument("--labels", help="JSON file: image path -> expected allergens")
+    parser.add_argument("--expected", help="Comma-separated allergens expected on every image")
+    parser.add_argument("--profiles", default="fast,balanced,quality,auto")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--out", help="Write results as JSON here")
+    args = parser.parse_args()
+
+    images = sorted(glob.glob(args.images))
+    if not images:
+        raise SystemExit(f"No images match {args.images}")
+
+    expected = {}
+    if args.labels:
+        with open(args.labels) as f:
+            expected = json.load(f)
+    elif args.expected:
+        wanted = [a.strip() for a in args.expected.split(",") if a.strip()]
+        expected = {path: wanted for path in images}
+
+    print(f"{len(images)} image(s), {args.repeats} repeat(s) each")
+    for path in images[:5]:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is not None:
+            print(f"  {path}: noise sigma {ocr_service.estimate_noise(gray):.2f}")
+
+    models = load_models() if expected else None
+    results = [run_profile(p.strip(), images, expected, args.repeats, models) for p in args.profiles.split(",")]
+
+    print(f"\n{'profile':<10}{'p50 ms':>10}{'p95 ms':>10}{'prep ms':>10}{'tess ms':>10}{'recall':>9}")
+    for r in results:
+        recall = "n/a" if r["allergen_recall"] is None else f"{r['allergen_recall']:.2f}"
+        print(f"{r['profile']:<10}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['preprocess_p50_ms']:>10.1f}{r['tesseract_p50_ms']:>10.1f}{recall:>9}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# bench_ocr_spelling.py
+# Allergen recall on OCR-damaged ingredient texts with and without
+# ocr_spelling correction, correction throughput, and lookup time against
+# dictionary size.
+#
+#   python ocr_spelling.py build
+#   python bench_ocr_spelling.py
+#   python bench_ocr_spelling.py --csv off_sample_10k.csv --count 2000 --rate 0.3 --out ocr_spelling.json
+#
+# Texts are damaged in --rate of their words under two noise models, and
+# both are reported:
+#   lookalike  typical Tesseract misreadings (m -> rn, l -> I, o -> 0, g -> q,
+#              a dropped letter, ...). These are the pairs OCR_CONFUSIONS
+#              discounts, so the recovery here is an upper bound.
+#   random     one uniform edit (any letter substituted, dropped, doubled or
+#              two swapped), independent of OCR_CONFUSIONS: a lower bound.
+# Real Tesseract output lies in between; bench_ocr_synthetic.py measures it
+# on rendered labels. Recall and precision compare the allergens predicted
+# for the damaged / corrected text with those predicted for the original,
+# so they isolate the OCR loss.
+# The scaling run rebuilds the index with --pad-words random extra words
+# (lengths drawn from the vocabulary's, at least 5: 200k random 3-4 letter
+# strings would fill most of that space, which no real vocabulary does).
+# The probes per token stay the same; only the candidates sharing a delete
+# key grow with the dictionary.
+import argparse
+import json
+import os
+import random
+import re
+import string
+import tempfile
+import time
+
+import numpy as np
+
+from allergen_predictor import MODEL_PATHS, load_models, predict_batch
+from ocr_spelling import (INDEX_PATH, SpellingIndex, allergen_terms, build_index, dictionary_from_vectorizer,
+                          lookup_keys)
+from synth_labels import load_texts
+from text_normalizer import clean_texts
+
+NOISE_MODELS = ("lookalike", "random")
+# printed -> misread (the same pairs as OCR_CONFUSIONS)
+MISREADS = [("m", "rn"), ("l", "I"), ("i", "l"), ("o", "0"), ("s", "5"), ("g", "q"), ("e", "c"),
+            ("t", "f"), ("d", "cl"), ("w", "vv"), ("h", "li"), ("n", "ri"), ("u", "ii"), ("b", "h")]
+_WORD_RE = re.compile(r"[A-Za-z]{3,}")
+
+
+def random_edit(word, rng):
+    i = rng.randrange(len(word))
+    kind = rng.choice(("substitute", "drop", "double", "swap"))
+    if kind == "substitute":
+        return word[:i] + rng.choice(string.ascii_lowercase.replace(word[i].lower(), "")) + word[i + 1:]
+    if kind == "drop":
+        return word[:i] + word[i + 1:]
+    if kind == "double":
+        return word[:i] + word[i] + word[i:]
+    i = min(i, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def damage_word(word, rng, model="lookalike"):
+    if model == "random":
+        return random_edit(word, rng)
+    if rng.random() < 0.25 and len(word) > 5:
+        i = rng.randrange(1, len(word) - 1)
+        return word[:i] + word[i + 1:]  # dropped letter
+    options = [(i, a, b) for i in range(len(word)) for a, b in MISREADS if word.startswith(a, i)]
+    if not options:
+        return word
+    i, a, b = rng.choice(options)
+    return word[:i] + b + word[i + len(a):]
+
+
+def damage(text, rate, rng, model="lookalike"):
+    return _WORD_RE.sub(lambda m: damage_word(m.group(0), rng, model) if rng.random() < rate else m.group(0), text)
+
+
+def allergen_scores(truth, predicted):
+    """Recall of the truth allergens and precision of the predicted ones, summed over texts."""
+    tp = sum(len(t & p) for t, p in zip(truth, predicted))
+    return {"recall": tp / max(1, sum(len(t) for t in truth)),
+            "precision": tp / max(1, sum(len(p) for p in predicted))}
+
+
+def _per_token_us(index, tokens):
+    index.correct_word.cache_clear()
+    start = time.perf_counter()
+    for token in tokens:
+        index.correct_word(token)
+    return (time.perf_counter() - start) / len(tokens) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR spelling correction.")
+    parser.add_argument("--csv", help="Training CSV with ingredients_text (default: synth_labels seed texts)")
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=0.3, help="Fraction of words misread")
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--pad-words", type=int, default=200_000, help="Extra words for the scaling run (0 = skip)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON here")
+    args = parser.parse_args()
+
+    index = SpellingIndex(args.index)
+    if not index.available:
+        raise SystemExit(f"No index at {args.index}; run: python ocr_spelling.py build")
+    rng = random.Random(args.seed)
+    texts = load_texts(args.csv, seed=args.seed)
+    texts = (texts * (args.count // len(texts) + 1))[:args.count]
+    damaged_by_model = {model: [damage(t, args.rate, rng, model) for t in texts] for model in NOISE_MODELS}
+    damaged = damaged_by_model["lookalike"]
+
+    index.correct_word.cache_clear()
+    start = time.perf_counter()
+    corrected = [index.correct_text(t)[0] for t in damaged]
+    cold_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for t in damaged:
+        index.correct_text(t)
+    warm_s = time.perf_counter() - start
+    tokens = sum(len(_WORD_RE.findall(t)) for t in damaged)
+
+    model, vectorizer, allergen_list = load_models()
+
+    def allergens(batch):
+        return [set(r["combined_allergens"]) for r in predict_batch(clean_texts(batch), model, vectorizer,
+                                                                      allergen_list)]
+
+    truth = allergens(texts)
+    results = {"texts": len(texts), "misread_rate": args.rate}
+    for noise in NOISE_MODELS:
+        batch = damaged_by_model[noise]
+        fixed = corrected if noise == "lookalike" else [index.correct_text(t)[0] for t in batch]
+        results[noise] = {"damaged": allergen_scores(truth, allergens(batch)),
+                          "corrected": allergen_scores(truth, allergens(fixed))}
+    results.update({
+        "throughput": {
+            "tokens": tokens,
+            "cold_tokens_per_s": tokens / cold_s,
+            "warm_tokens_per_s": tokens / warm_s,
+            "cold_ms_per_text": cold_s * 1000 / len(texts),
+            "warm_ms_per_text": warm_s * 1000 / len(texts),
+        },
+    })
+
+    if args.pad_words:
+        # Same lookups against a dictionary padded with random words
+        sample = list({w.lower() for t in damaged for w in _WORD_RE.findall(t)})[:2000]
+        import joblib
+
+        words = dictionary_from_vectorizer(joblib.load(MODEL_PATHS["vectorizer"]))
+        pad_rng = random.Random(args.seed + 1)
+        lengths = [len(w) for w in words if len(w) >= 5]
+        padded = dict(words)
+        while len(padded) < len(words) + args.pad_words:
+            padded["".join(pad_rng.choices(string.ascii_lowercase, k=pad_rng.choice(lengths)))] = 1e-6
+        with tempfile.TemporaryDirectory() as tmp:
+            big_path = os.path.join(tmp, "padded.idx")
+            stats = build_index(padded, allergen_terms(), big_path)
+            big = SpellingIndex(big_path)
+            results["scaling"] = {
+                "words": [len(words), stats["words"]],
+                "us_per_token": [_per_token_us(index, sample), _per_token_us(big, sample)],
+                "probes_per_token": float(np.mean([len(lookup_keys(t)) for t in sample])),
+                "index_mb": [os.path.getsize(args.index) / 1e6, stats["bytes"] / 1e6],
+            }
+
+    print(f"{len(texts)} texts, {args.rate:.0%} of words misread")
+    for noise in NOISE_MODELS:
+        for name in ("damaged", "corrected"):
+            r = results[noise][name]
+            print(f"{noise:9s} {name:10s} allergen recall {r['recall']:.1%}  precision {r['precision']:.1%}")
+    print("(lookalike uses the pairs OCR_CONFUSIONS discounts, so its gain is an upper bound; "
+          "random edits are independent of them)")
+    t = results["throughput"]
+    print(f"Throughput: {t['cold_tokens_per_s']:,.0f} tokens/s cold, {t['warm_tokens_per_s']:,.0f} warm "
+          f"({t['cold_ms_per_text']:.2f} / {t['warm_ms_per_text']:.2f} ms per text)")
+    if "scaling" in results:
+        s = results["scaling"]
+        print(f"Lookup ({s['probes_per_token']:.0f} probes/token): {s['us_per_token'][0]:.0f} us/token with "
+              f"{s['words'][0]:,} words, {s['us_per_token'][1]:.0f} us/token with {s['words'][1]:,} "
+              f"({s['index_mb'][1]:.0f} MB)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# bench_ocr_synthetic.py
+# Run the OCR pipeline over images from synth_labels.py and report, per
+# distortion bucket: character error rate, allergen recall and latency.
+#
+#   python synth_labels.py --out synth_labels
+#   python bench_ocr_synthetic.py --manifest synth_labels/manifest.jsonl --workers 4
+#   python bench_ocr_synthetic.py --profile auto --check-quality --out ocr_synth.json
+#
+# Allergen recall compares what the predictor finds in the OCR text with
+# what it finds in the ground-truth text, so it isolates the OCR loss.
+# Needs Tesseract installed (set TESSERACT_CMD if it is not on the default path).
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
+import numpy as np
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+def edit_distance(a, b):
+    """Levenshtein distance (two-row DP)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def char_error_rate(truth, hypothesis):
+    truth, hypothesis = _normalize(truth), _normalize(hypothesis)
+    if not truth:
+        return 0.0 if not hypothesis else 1.0
+    return edit_distance(truth, hypothesis) / len(truth)
+
+
+def _ocr_one(task):
+    import pytesseract
+    from ocr_service import OCRQualityError, ocr_image_detailed
+
+    item, profile, check_quality = task
+    start = time.perf_counter()
+    rejected = None
+    try:
+        ocr = ocr_image_detailed(item["image"], profile=profile, check_quality=check_quality)
+        text = ocr["text"]
+    except OCRQualityError as e:
+        text, rejected = "", ",".join(e.quality["reasons"])
+    except pytesseract.TesseractNotFoundError:
+        return {"error": "tesseract_not_found"}
+    ms = (time.perf_counter() - start) * 1000
+    return {
+        "image": item["image"],
+        "bucket": item["bucket"],
+        "truth": item["text"],
+        "ocr_text": text,
+        "ms": ms,
+        "cer": char_error_rate(item["text"], text),
+        "rejected": rejected,
+    }
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def summarize(rows, truth_allergens, ocr_allergens):
+    by_bucket = defaultdict(list)
+    for row, expected, found in zip(rows, truth_allergens, ocr_allergens):
+        by_bucket[row["bucket"]].append((row, set(expected), set(found)))
+
+    report = []
+    for bucket, items in by_bucket.items():
+        ms = [r["ms"] for r, _, _ in items]
+        expected_total = sum(len(e) for _, e, _ in items)
+        found_total = sum(len(e & f) for _, e, f in items)
+        false_pos = sum(len(f - e) for _, e, f in items)
+        report.append({
+            "bucket": bucket,
+            "images": len(items),
+            "cer_mean": float(np.mean([r["cer"] for r, _, _ in items])),
+            "cer_p90": _percentile([r["cer"] for r, _, _ in items], 90),
+            "allergen_recall": (found_total / expected_total) if expected_total else None,
+            "extra_allergens": false_pos,
+            "rejected": sum(1 for r, _, _ in items if r["rejected"]),
+            "p50_ms": _percentile(ms, 50),
+            "p95_ms": _percentile(ms, 95),
+            "p99_ms": _percentile(ms, 99),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR accuracy/latency per synthetic distortion bucket.")
+    parser.add_argument("--manifest", default="synth_labels/manifest.jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--profile", default=None, help="OCR profile: fast | balanced | quality | auto")
+    parser.add_argument("--check-quality", action="store_true", help="Apply the blur/contrast rejection gate")
+    parser.add_argument("--out", help="Write summary (and per-image rows) as JSON here")
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    if not items:
+        raise SystemExit(f"No images in {args.manifest}")
+
+    print(f"OCR on {len(items)} images with {args.workers} worker(s) ...")
+    start = time.perf_counter()
+    tasks = [(item, args.profile, args.check_quality) for item in items]
+    with Pool(processes=args.workers) as pool:
+        rows = pool.map(_ocr_one, tasks, chunksize=max(1, len(tasks) // (args.workers * 8)))
+    wall = time.perf_counter() - start
+    if any(r.get("error") == "tesseract_not_found" for r in rows):
+        raise SystemExit("Tesseract is not installed or not found (set TESSERACT_CMD).")
+
+    from allergen_predictor import load_models, predict_batch
+    from text_normalizer import clean_texts
+
+    model, vectorizer, allergen_list = load_models()
+    truth = predict_batch(clean_texts([r["truth"] for r in rows]), model, vectorizer, allergen_list)
+    found = predict_batch(clean_texts([r["ocr_text"] for r in rows]), model, vectorizer, allergen_list)
+    report = summarize(rows,
+                       [t["combined_allergens"] for t in truth],
+                       [f["combined_allergens"] for f in found])
+
+    print(f"{len(rows) / wall:.1f} images/s overall\n")
+    print(f"{'bucket':<14}{'n':>5}{'CER':>8}{'recall':>8}{'extra':>7}{'rej':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for r in report:
+        recall = "n/a" if r["allergen_recall"] is None else f"{r['allergen_recall']:.2f}"
+        print(f"{r['bucket']:<14}{r['images']:>5}{r['cer_mean']:>8.3f}{recall:>8}{r['extra_allergens']:>7}"
+              f"{r['rejected']:>5}{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"images_per_s": len(rows) / wall, "buckets": report, "images": rows}, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# bench_prompt_compaction.py
+# Advice-prompt size before and after prompt_compactor, and optionally the
+# LLM latency of generate_personalized_advice for both.
+#
+#   python bench_prompt_compaction.py
+#   python bench_prompt_compaction.py --csv off_sample_10k.csv --count 200 --budget 80
+#
+# With an LLM (real or the local stub; --prompt-token-ms makes the stub's
+# latency grow with prompt length like a real model's prefill):
+#   python hf_stub_server.py --latency-ms 50 --prompt-token-ms 2 --hf-models-404
+#   HUGGINGFACE_API_BASE=http://127.0.0.1:8008/models HUGGINGFACE_API_KEY=stub \
+#       python bench_prompt_compaction.py --llm --count 20
+#
+# Label texts are wrapped in a nutrition table and OCR noise, as a
+# /predict_image OCR of a whole pack would be (--plain to use them as-is).
+# "before" is the previous prompt: the raw text cut at 1200 characters.
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+import llm_service
+from allergen_predictor import load_models, predict_one
+from prompt_compactor import compact_ingredients, estimate_tokens
+from synth_labels import load_texts
+from text_normalizer import clean_text
+
+NUTRITION_PANEL = (
+    "NUTRITION INFORMATION Typical values per 100g per portion (30g) %RI* Energy 2252kJ/539kcal 676kJ/162kcal 8% "
+    "Fat 30.9g 9.3g 13% of which saturates 10.6g 3.2g 16% Carbohydrate 57.5g 17.3g 7% of which sugars 56.3g "
+    "16.9g 19% Fibre 3.4g Protein 6.3g 1.9g 4% Salt 0.107g 0.032g 1% *Reference intake of an average adult "
+    "(8400kJ/2000kcal)"
+)
+PACK_TEXT = (
+    "Store in a cool, dry place. Once opened consume within 4 weeks. Best before: see lid. "
+    "Distributed by Example Foods Ltd, PO Box 123, London. www.examplefoods.com Customer careline 0800 000 000. "
+    "Recycle: lid plastic, jar glass. Net weight 400g e"
+)
+USER_ALLERGIES = ["milk", "tree nuts"]
+
+
+def _ocr_noise(rng, words):
+    alphabet = "il1|!;:.,'`~-_rnmwvO0o#%"
+    return " ".join("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(words))
+
+
+def full_label(text, rng):
+    """Ingredient text as it shows up in a whole-pack OCR: tables, pack copy and noise around it."""
+    parts = [NUTRITION_PANEL, "INGREDIENTS: " + text, _ocr_noise(rng, 12), PACK_TEXT, _ocr_noise(rng, 8)]
+    rng.shuffle(parts)
+    return "\n".join(parts)
+
+
+def _percentiles(values):
+    return {"mean": float(np.mean(values)), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure advice-prompt compaction.")
+    parser.add_argument("--csv", help="Training CSV with ingredients_text (default: synth_labels seed texts)")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--budget", type=int, default=llm_service._get_env_int("LLM_PROMPT_TOKEN_BUDGET", 120),
+                        help="Token budget for the label excerpt")
+    parser.add_argument("--plain", action="store_true", help="Do not wrap texts in nutrition tables / OCR noise")
+    parser.add_argument("--llm", action="store_true", help="Also time generate_personalized_advice (uses the LLM)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON here")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = load_texts(args.csv, seed=args.seed)
+    texts = (texts * (args.count // len(texts) + 1))[:args.count]
+    labels = texts if args.plain else [full_label(t, rng) for t in texts]
+
+    model, vectorizer, allergen_list = load_models()
+    cases = []
+    for label in labels:
+        detected = predict_one(clean_text(label), model, vectorizer, allergen_list)["combined_allergens"]
+        cases.append((label, detected))
+
+    before_tokens, after_tokens, before_chars, after_chars, compact_ms = [], [], [], [], []
+    for label, detected in cases:
+        start = time.perf_counter()
+        compact_ingredients(label, detected + USER_ALLERGIES, token_budget=args.budget)
+        compact_ms.append((time.perf_counter() - start) * 1000)
+        os.environ["LLM_PROMPT_TOKEN_BUDGET"] = "0"
+        before = llm_service._advice_prompt("Product", detected, USER_ALLERGIES, label)
+        os.environ["LLM_PROMPT_TOKEN_BUDGET"] = str(args.budget)
+        after = llm_service._advice_prompt("Product", detected, USER_ALLERGIES, label)
+        before_tokens.append(estimate_tokens(before))
+        after_tokens.append(estimate_tokens(after))
+        before_chars.append(len(before))
+        after_chars.append(len(after))
+
+    results = {
+        "cases": len(cases),
+        "budget": args.budget,
+        "prompt_tokens_before": _percentiles(before_tokens),
+        "prompt_tokens_after": _percentiles(after_tokens),
+        "prompt_chars_before": _percentiles(before_chars),
+        "prompt_chars_after": _percentiles(after_chars),
+        "compaction_ms": _percentiles(compact_ms),
+    }
+    saved = 1 - sum(after_tokens) / sum(before_tokens)
+    results["token_reduction"] = saved
+
+    print(f"{len(cases)} labels, excerpt budget {args.budget} tokens")
+    print(f"{'':<22}{'mean':>9}{'p50':>9}{'p95':>9}")
+    for name in ("prompt_tokens_before", "prompt_tokens_after", "prompt_chars_before", "prompt_chars_after",
+                 "compaction_ms"):
+        r = results[name]
+        print(f"{name:<22}{r['mean']:>9.1f}{r['p50']:>9.1f}{r['p95']:>9.1f}")
+    print(f"Prompt tokens saved: {saved:.0%}")
+
+    if args.llm:
+        for label_name, budget in (("before", "0"), ("after", str(args.budget))):
+            os.environ["LLM_PROMPT_TOKEN_BUDGET"] = budget
+            latencies, errors = [], 0
+            for label, detected in cases:
+                start = time.perf_counter()
+                try:
+                    llm_service.generate_personalized_advice("Product", detected, USER_ALLERGIES, label)
+                except llm_service.LLMServiceError:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+            results[f"llm_ms_{label_name}"] = _percentiles(latencies) if latencies else None
+            results[f"llm_errors_{label_name}"] = errors
+            if latencies:
+                r = results[f"llm_ms_{label_name}"]
+                print(f"LLM {label_name:<7} mean {r['mean']:7.0f} ms  p50 {r['p50']:7.0f} ms  "
+                      f"p95 {r['p95']:7.0f} ms  errors {errors}")
+            else:
+                print(f"LLM {label_name:<7} all {errors} calls failed")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
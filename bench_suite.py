@@ -0,0 +1,297 @@
+# bench_suite.py
+# In-process benchmark suite: no running server needed. Covers clean_text,
+# the prediction pipeline (single, cached and batched), /predict through the
+# Flask test client, ocr_image on an image corpus, _extract_json_object and
+# llm_service against a stubbed Hugging Face provider.
+#
+#   python bench_suite.py --out bench_results.json
+#   python bench_suite.py --out new.json --compare bench_results.json
+#   python bench_suite.py --only clean_text,llm --images "labels/*.png"
+#
+# Run from the repo root (the app loads models/ and models/users.db).
+# ocr_image is skipped when Tesseract is not installed.
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from unittest import mock
+
+import numpy as np
+
+SAMPLE_TEXTS = [
+    "Ingredients: milk powder, sugar, wheat flour, soy lecithin",
+    "Water, tomatoes, salt, spices. May contain traces of peanuts and tree nuts.",
+    "Enriched flour (wheat flour, niacin, reduced iron, thiamin mononitrate), eggs, butter (cream, salt), almonds",
+    "Rice, sunflower oil, sea salt",
+    "Sugar, cocoa butter, whole milk powder, hazelnuts 13%, emulsifier (soy lecithin), vanilla",
+    "Chickpeas, tahini (sesame), lemon juice, garlic. Contains sesame.",
+    "Salmon, shrimp, wheat, soybeans, salt, sugar, mustard seed",
+    "ZUTATEN: Weizenmehl, Zucker, Haselnüsse, Vollmilchpulver, Eier",
+]
+
+LLM_REPLIES = {
+    "advice": json.dumps({
+        "verdict_summary": "Not safe for you.",
+        "risk_explanation": "Contains milk, which is on your allergy list.",
+        "hidden_ingredient_watchouts": ["whey", "casein"],
+        "safer_next_step": "Choose a certified dairy-free option.",
+    }),
+    "alternatives": "Sure! Here you go:\n" + json.dumps({"alternatives": [
+        {"alternative_name": f"Option {i}", "why_safer": "No milk", "caution_note": "Check label"} for i in range(4)
+    ]}) + "\nHope this helps.",
+    "faq": json.dumps({"answer": "Cross-contact means traces can transfer.", "safety_disclaimer": "Informational only."}),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(fn, min_runs=20, min_seconds=0.5, items=1):
+    """Call fn() until both limits are reached; per-item latency stats in ms."""
+    fn()  # warm-up
+    samples = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < min_runs or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000 / items)
+        if len(samples) >= 100000:
+            break
+    arr = np.array(samples)
+    return {
+        "runs": len(samples),
+        "items_per_run": items,
+        "median_ms": float(np.median(arr)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "mean_ms": float(arr.mean()),
+        "ops_per_s": float(1000.0 / np.median(arr)) if np.median(arr) > 0 else None,
+    }
+
+
+###################################
+# BENCHMARK GROUPS
+###################################
+def bench_clean_text(texts, args):
+    from text_normalizer import clean_text, clean_texts
+
+    batch = (texts * (1000 // len(texts) + 1))[:1000]
+    return {
+        "clean_text.single": measure(lambda: [clean_text(t) for t in texts], items=len(texts),
+                                     min_runs=args.min_runs, min_seconds=args.min_seconds),
+        "clean_text.batch_1000": measure(lambda: clean_texts(batch), items=len(batch),
+                                         min_runs=args.min_runs, min_seconds=args.min_seconds),
+    }
+
+
+def bench_pipeline(texts, args):
+    import app
+    from allergen_predictor import predict_batch
+    from text_normalizer import clean_texts
+
+    def uncached():
+        for t in texts:
+            app.prediction_cache.clear()
+            app.full_prediction_pipeline(t)
+
+    def cached():
+        for t in texts:
+            app.full_prediction_pipeline(t)
+
+    batch = (texts * (256 // len(texts) + 1))[:256]
+
+    def batched():
+        predict_batch(clean_texts(batch), app.model, app.vectorizer, app.ALLERGEN_LIST)
+
+    client = app.app.test_client()
+
+    def flask_predict():
+        for t in texts:
+            client.post("/predict", json={"ingredients_text": t})
+
+    with app.app.test_request_context():
+        results = {
+            "pipeline.single_uncached": measure(uncached, items=len(texts),
+                                                min_runs=args.min_runs, min_seconds=args.min_seconds),
+            "pipeline.single_cached": measure(cached, items=len(texts),
+                                              min_runs=args.min_runs, min_seconds=args.min_seconds),
+            "pipeline.batched_256": measure(batched, items=len(batch),
+                                            min_runs=args.min_runs, min_seconds=args.min_seconds),
+        }
+    app.prediction_cache.clear()
+    results["flask.predict"] = measure(flask_predict, items=len(texts),
+                                       min_runs=args.min_runs, min_seconds=args.min_seconds)
+    return results
+
+
+def bench_ocr(texts, args):
+    import pytesseract
+    from ocr_service import ocr_image
+
+    images = sorted(glob.glob(args.images))
+    if not images:
+        return {"ocr_image": {"skipped": f"no images match {args.images}"}}
+    try:
+        ocr_image(images[0])
+    except pytesseract.TesseractNotFoundError:
+        return {"ocr_image": {"skipped": "Tesseract not installed"}}
+
+    results = {}
+    for path in images:
+        results[f"ocr_image.{os.path.basename(path)}"] = measure(
+            lambda: ocr_image(path), min_runs=args.ocr_runs, min_seconds=0)
+    return results
+
+
+def bench_extract_json(texts, args):
+    from llm_service import LLMServiceError, _extract_json_object
+
+    plain = LLM_REPLIES["advice"]
+    wrapped = LLM_REPLIES["alternatives"]
+    invalid = "I am sorry, I cannot answer that { not json"
+
+    def invalid_case():
+        try:
+            _extract_json_object(invalid)
+        except LLMServiceError:
+            pass
+
+    return {
+        "extract_json.plain": measure(lambda: _extract_json_object(plain),
+                                      min_runs=args.min_runs, min_seconds=args.min_seconds),
+        "extract_json.wrapped": measure(lambda: _extract_json_object(wrapped),
+                                        min_runs=args.min_runs, min_seconds=args.min_seconds),
+        "extract_json.invalid": measure(invalid_case, min_runs=args.min_runs, min_seconds=args.min_seconds),
+    }
+
+
+class _StubResponse:
+    status_code = 200
+
+    def __init__(self, text):
+        self._payload = [{"generated_text": text}]
+        self.text = json.dumps(self._payload)
+
+    def json(self):
+        return self._payload
+
+
+def _stub_post(url, headers=None, json=None, timeout=None):
+    prompt = json.get("inputs") or json["messages"][-1]["content"]
+    if "shopping assistant" in prompt:
+        return _StubResponse(LLM_REPLIES["alternatives"])
+    if "education assistant" in prompt:
+        return _StubResponse(LLM_REPLIES["faq"])
+    return _StubResponse(LLM_REPLIES["advice"])
+
+
+def bench_llm(texts, args):
+    import llm_service
+
+    env = {"HUGGINGFACE_API_KEY": "bench-stub-key"}
+    with mock.patch.dict(os.environ, env), mock.patch.object(llm_service.requests, "post", _stub_post):
+        return {
+            "llm.personalized_advice": measure(lambda: llm_service.generate_personalized_advice(
+                "Choco Bar", ["milk", "hazelnut"], ["milk"], texts[4]),
+                min_runs=args.min_runs, min_seconds=args.min_seconds),
+            "llm.alternatives": measure(lambda: llm_service.generate_alternatives(
+                "Choco Bar", ["milk"], ["milk"]), min_runs=args.min_runs, min_seconds=args.min_seconds),
+            "llm.faq": measure(lambda: llm_service.answer_faq_question(
+                "What is cross-contact?", ["peanut"]), min_runs=args.min_runs, min_seconds=args.min_seconds),
+        }
+
+
+GROUPS = {
+    "clean_text": bench_clean_text,
+    "pipeline": bench_pipeline,
+    "ocr": bench_ocr,
+    "extract_json": bench_extract_json,
+    "llm": bench_llm,
+}
+
+
+def compare(current, baseline, threshold):
+    """Print median changes vs a previous run; returns names slower than threshold."""
+    regressions = []
+    print(f"\n{'benchmark':<36}{'base ms':>12}{'new ms':>12}{'change':>10}")
+    for name, new in current["benchmarks"].items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if not old or "median_ms" not in old or "median_ms" not in new:
+            continue
+        change = new["median_ms"] / old["median_ms"] - 1 if old["median_ms"] else 0.0
+        flag = "  <-- slower" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36}{old['median_ms']:>12.4f}{new['median_ms']:>12.4f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the in-process benchmark suite.")
+    parser.add_argument("--only", help=f"Comma-separated groups: {', '.join(GROUPS)}")
+    parser.add_argument("--texts", help="File with one ingredient text per line (default: built-in samples)")
+    parser.add_argument("--images", default="test_img.png", help="Glob of label images for ocr_image")
+    parser.add_argument("--min-runs", type=int, default=20)
+    parser.add_argument("--min-seconds", type=float, default=0.5)
+    parser.add_argument("--ocr-runs", type=int, default=3)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    texts = SAMPLE_TEXTS
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    groups = list(GROUPS) if not args.only else [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown:
+        raise SystemExit(f"Unknown group(s): {', '.join(unknown)}")
+
+    benchmarks = {}
+    for group in groups:
+        print(f"Running {group} ...", file=sys.stderr)
+        benchmarks.update(GROUPS[group](texts, args))
+
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "benchmarks": benchmarks,
+    }
+
+    print(f"\n{'benchmark':<36}{'median ms':>12}{'p95 ms':>12}{'ops/s':>12}")
+    for name, r in benchmarks.items():
+        if "skipped" in r:
+            print(f"{name:<36}  skipped: {r['skipped']}")
+            continue
+        print(f"{name:<36}{r['median_ms']:>12.4f}{r['p95_ms']:>12.4f}{r['ops_per_s']:>12.0f}")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            raise SystemExit(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
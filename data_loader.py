@@ -0,0 +1,254 @@
+"""
+Shared Open Food Facts data loading for extract_small_sample.py and train_model.py.
+
+Rows are streamed straight out of the Parquet dump as Arrow record batches.
+DuckDB only reads the projected columns and pushes the WHERE clause
+(ingredients present, optional country) down into the Parquet scan, so the
+full dump never has to fit in memory and no intermediate CSV is needed.
+"""
+from typing import Dict, Iterator, Optional
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+PARQUET_PATH = "food.parquet"
+BATCH_SIZE = 50_000
+# Stratified sampling keeps the most common strata values as their own
+# strata and pools the long tail (OFF allergen strings are very diverse)
+MAX_STRATA = 64
+OTHER_STRATUM = "\x00other"
+
+# Output column -> source column in the OFF dump
+DEFAULT_COLUMNS = {
+    "product_name": "product_name",
+    "ingredients_text": "ingredients_text",
+    "allergens": "allergens_tags",
+    "code": "code",
+    "countries": "countries_tags",
+}
+
+
+def _describe_columns(con, parquet_path: str) -> Dict[str, str]:
+    rows = con.execute(f"DESCRIBE SELECT * FROM read_parquet('{parquet_path}')").fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+def _select_expr(source: str, alias: str, column_type: str) -> str:
+    # OFF stores *_tags as VARCHAR[] in the Parquet dump; flatten them to the
+    # 'en:milk,en:gluten' form parse_allergens_field() expects.
+    if column_type.endswith("[]"):
+        return f"array_to_string({source}, ',') AS {alias}"
+    return f"{source} AS {alias}"
+
+
+def build_query(
+    con,
+    parquet_path: str = PARQUET_PATH,
+    columns: Optional[Dict[str, str]] = None,
+    country: Optional[str] = None,
+    require_ingredients: bool = True,
+) -> str:
+    """Build the projected + filtered SELECT over the Parquet file."""
+    columns = columns or DEFAULT_COLUMNS
+    schema = _describe_columns(con, parquet_path)
+
+    select = []
+    for alias, source in columns.items():
+        if source not in schema:
+            raise ValueError(f"Column '{source}' not found in {parquet_path}")
+        select.append(_select_expr(source, alias, schema[source]))
+
+    where = []
+    if require_ingredients:
+        where.append("ingredients_text IS NOT NULL")
+    if country:
+        tag = country if ":" in country else f"en:{country.lower()}"
+        tag = tag.replace("'", "''")
+        if schema.get("countries_tags", "").endswith("[]"):
+            where.append(f"list_contains(countries_tags, '{tag}')")
+        else:
+            where.append(f"countries_tags LIKE '%{tag}%'")
+
+    query = f"SELECT {', '.join(select)} FROM read_parquet('{parquet_path}')"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query
+
+
+def iter_record_batches(
+    parquet_path: str = PARQUET_PATH,
+    columns: Optional[Dict[str, str]] = None,
+    country: Optional[str] = None,
+    require_ingredients: bool = True,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[pa.RecordBatch]:
+    """Stream matching rows as Arrow record batches (constant memory)."""
+    con = duckdb.connect()
+    try:
+        query = build_query(con, parquet_path, columns, country, require_ingredients)
+        reader = con.execute(query).fetch_record_batch(batch_size)
+        for batch in reader:
+            if batch.num_rows:
+                yield batch
+    finally:
+        con.close()
+
+
+def _smallest_keys(table: pa.Table, keys: np.ndarray, n: int, *extra: np.ndarray):
+    """Keep the n rows of table with the smallest keys (plus aligned arrays)."""
+    if len(keys) <= n:
+        return (table, keys) + extra
+    idx = np.argpartition(keys, n - 1)[:n]
+    return (table.take(pa.array(idx)), keys[idx]) + tuple(e[idx] for e in extra)
+
+
+def reservoir_sample(batches, n: int, seed: int = 42) -> Optional[pa.Table]:
+    """
+    Uniform sample of n rows without replacement in a single pass.
+
+    Every row gets a random priority and the n smallest are kept, which is
+    equivalent to classic reservoir sampling but vectorized per batch.
+    The same seed and input order always give the same sample.
+    """
+    rng = np.random.default_rng(seed)
+    kept = None
+    kept_keys, kept_pos = np.empty(0), np.empty(0, dtype=np.int64)
+    offset = 0
+
+    for batch in batches:
+        table = pa.Table.from_batches([batch])
+        keys = rng.random(batch.num_rows)
+        pos = np.arange(offset, offset + batch.num_rows)
+        offset += batch.num_rows
+        if kept is not None:
+            table = pa.concat_tables([kept, table])
+            keys = np.concatenate([kept_keys, keys])
+            pos = np.concatenate([kept_pos, pos])
+        kept, kept_keys, kept_pos = _smallest_keys(table, keys, n, pos)
+
+    if kept is None:
+        return None
+    # Restore source order so downstream splits are stable
+    return kept.take(pa.array(np.argsort(kept_pos)))
+
+
+def strata_counts(
+    parquet_path: str,
+    strata_column: str,
+    country: Optional[str] = None,
+    max_strata: int = MAX_STRATA,
+) -> Dict[str, int]:
+    """
+    Row counts of the max_strata most common strata_column values, plus the
+    rest pooled under OTHER_STRATUM, from one aggregate query over the
+    Parquet scan. Null / empty values count as "".
+    """
+    con = duckdb.connect()
+    try:
+        query = build_query(con, parquet_path, country=country)
+        rows = con.execute(
+            f'SELECT s, c, sum(c) OVER () FROM (SELECT coalesce(CAST("{strata_column}" AS VARCHAR), \'\') AS s, '
+            f"count(*) AS c FROM ({query}) GROUP BY s) ORDER BY c DESC, s LIMIT {int(max_strata)}"
+        ).fetchall()
+    finally:
+        con.close()
+    counts = {value: int(c) for value, c, _ in rows}
+    rest = int(rows[0][2]) - sum(counts.values()) if rows else 0
+    if rest:
+        counts[OTHER_STRATUM] = rest
+    return counts
+
+
+def stratified_sample(batches, n: int, strata_column: str, counts: Dict[str, int],
+                      seed: int = 42) -> Optional[pa.Table]:
+    """
+    Proportional stratified sample of n rows in a single pass.
+
+    counts (from strata_counts()) fixes the strata and their sizes up front:
+    values not in it are pooled under OTHER_STRATUM. n is allocated
+    proportionally to the counts, and each stratum keeps a reservoir of
+    exactly its quota, so at most n rows are held whatever the cardinality
+    of strata_column.
+    """
+    total = sum(counts.values())
+    if not total:
+        return None
+
+    # Largest-remainder allocation so quotas sum to min(n, total)
+    target = min(n, total)
+    exact = {k: target * c / total for k, c in counts.items()}
+    quotas = {k: int(v) for k, v in exact.items()}
+    leftover = target - sum(quotas.values())
+    for k in sorted(exact, key=lambda k: (exact[k] - quotas[k], k), reverse=True)[:leftover]:
+        quotas[k] += 1
+
+    names = sorted(counts)
+    position = {name: i for i, name in enumerate(names)}
+    other = position.get(OTHER_STRATUM)
+    rng = np.random.default_rng(seed)
+    reservoirs: Dict[int, tuple] = {}
+
+    for batch in batches:
+        strata = batch.column(strata_column).to_pylist()
+        strata = np.array(["" if v is None else str(v) for v in strata], dtype=object)
+        keys = rng.random(batch.num_rows)
+        table = pa.Table.from_batches([batch])
+
+        # One np.unique per batch; rows are then grouped by stratum index
+        values, inverse = np.unique(strata, return_inverse=True)
+        lookup = np.array([position.get(v, other if other is not None else -1) for v in values], dtype=np.int64)
+        row_strata = lookup[inverse.ravel()]
+        order = np.argsort(row_strata, kind="stable")
+        present, starts = np.unique(row_strata[order], return_index=True)
+        for j, idx in zip(present.tolist(), np.split(order, starts[1:])):
+            quota = quotas[names[j]] if j >= 0 else 0  # -1: a value counts didn't see
+            if not quota:
+                continue
+            part, part_keys = table.take(pa.array(idx)), keys[idx]
+            if j in reservoirs:
+                prev, prev_keys = reservoirs[j]
+                part = pa.concat_tables([prev, part])
+                part_keys = np.concatenate([prev_keys, part_keys])
+            reservoirs[j] = _smallest_keys(part, part_keys, quota)
+
+    if not reservoirs:
+        return None
+    return pa.concat_tables([reservoirs[j][0] for j in sorted(reservoirs)])
+
+
+def load_training_frame(
+    parquet_path: str = PARQUET_PATH,
+    sample_size: Optional[int] = None,
+    sampling: str = "reservoir",
+    strata_column: str = "allergens",
+    country: Optional[str] = None,
+    seed: int = 42,
+    batch_size: int = BATCH_SIZE,
+):
+    """
+    Load a training DataFrame straight from the Parquet dump.
+
+    sampling: 'reservoir' (uniform), 'stratified' (proportional on
+    the MAX_STRATA most common strata_column values plus the rest pooled)
+    or 'none' (every matching row). sample_size=None
+    also returns every matching row.
+    """
+    batches = iter_record_batches(parquet_path, country=country, batch_size=batch_size)
+
+    if sample_size is None or sampling == "none":
+        batches = list(batches)
+        table = pa.Table.from_batches(batches) if batches else None
+    elif sampling == "reservoir":
+        table = reservoir_sample(batches, sample_size, seed=seed)
+    elif sampling == "stratified":
+        counts = strata_counts(parquet_path, strata_column, country=country)
+        table = stratified_sample(batches, sample_size, strata_column, counts, seed=seed)
+    else:
+        raise ValueError(f"Unknown sampling strategy: {sampling}")
+
+    if table is None:
+        return pd.DataFrame(columns=list(DEFAULT_COLUMNS))
+    return table.to_pandas()
+
@@ -1,27 +1,29 @@
-import duckdb
+import argparse
 
-PARQUET_PATH = "food.parquet"     # same folder as this script
-OUT_CSV = "off_sample_10k.csv"    # output file
+from data_loader import PARQUET_PATH, load_training_frame
 
-con = duckdb.connect()
+OUT_CSV = "off_sample_10k.csv"    # output file
 
-query = f"""
-SELECT
-    product_name,
-    ingredients_text,
-    allergens_tags AS allergens,
-    code,
-    countries_tags AS countries
-FROM '{PARQUET_PATH}'
-WHERE ingredients_text IS NOT NULL
-LIMIT 10000;
-"""
+# train_model.py now reads food.parquet directly through data_loader; this
+# script only exports a sample for manual inspection.
+parser = argparse.ArgumentParser(description="Export a reproducible sample of the OFF dump to CSV.")
+parser.add_argument("--parquet", default=PARQUET_PATH)
+parser.add_argument("--out", default=OUT_CSV)
+parser.add_argument("--sample-size", type=int, default=10000)
+parser.add_argument("--sampling", choices=["reservoir", "stratified", "none"], default="reservoir")
+parser.add_argument("--country", default=None, help="e.g. 'france' or 'en:united-states'")
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
 
-print("Running query... (this should NOT freeze your laptop)")
-df = con.execute(query).df()
-con.close()
+print("Streaming rows from Parquet... (this should NOT freeze your laptop)")
+df = load_training_frame(
+    args.parquet,
+    sample_size=args.sample_size,
+    sampling=args.sampling,
+    country=args.country,
+    seed=args.seed,
+)
 
 print(f"Rows extracted: {len(df)}")
-df.to_csv(OUT_CSV, index=False)
-print(f"Saved to {OUT_CSV}")
-
+df.to_csv(args.out, index=False)
+print(f"Saved to {args.out}")
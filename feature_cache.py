@@ -0,0 +1,152 @@
+"""
+On-disk cache for train_model.py.
+
+Two layers:
+  * a per-row store (row hash -> cleaned text + multi-hot labels) so only
+    new or changed rows are cleaned and labelled on each run;
+  * TF-IDF train/val CSR matrices (.npz) plus the fitted vectorizer, keyed
+    by a hash of the dataset rows, the vectorizer config and the split, so
+    classifier-only experiments skip the vectorizer fit entirely.
+"""
+import hashlib
+import inspect
+import json
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from joblib import dump, load
+
+CACHE_DIR = os.path.join("models", "feature_cache")
+LATEST_FILE = "latest.json"
+
+
+def _sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def row_hashes(df: pd.DataFrame, columns=("ingredients_text", "allergens")) -> np.ndarray:
+    """Stable uint64 hash per row over the raw input columns."""
+    cols = [c for c in columns if c in df.columns]
+    return pd.util.hash_pandas_object(df[cols].astype(object), index=False).to_numpy(dtype=np.uint64)
+
+
+def dataset_key(hashes: np.ndarray) -> str:
+    return _sha1(np.ascontiguousarray(hashes).tobytes())
+
+
+def config_key(config: Dict[str, Any]) -> str:
+    return _sha1(json.dumps(config, sort_keys=True, default=str).encode())
+
+
+def code_fingerprint(*objs) -> str:
+    """
+    Hash of modules/functions/classes (by source) and constants (as JSON) so
+    cached rows are dropped when the cleaning or labelling logic changes.
+    """
+    parts = []
+    for obj in objs:
+        if inspect.ismodule(obj) or inspect.isfunction(obj) or inspect.isclass(obj):
+            parts.append(inspect.getsource(obj))
+        else:
+            parts.append(json.dumps(obj, sort_keys=True))
+    return _sha1("\n".join(parts).encode())
+
+
+def vocabulary_fingerprint(vectorizer) -> str:
+    """Hash of a fitted vectorizer's term -> column mapping; saved models record it for warm starts."""
+    return _sha1("\n".join(vectorizer.get_feature_names_out()).encode())
+
+
+class RowCache:
+    """Per-row cleaned text and labels, stored as one Parquet file per code fingerprint."""
+
+    def __init__(self, fingerprint: str, n_labels: int, cache_dir: str = CACHE_DIR):
+        self.path = os.path.join(cache_dir, f"rows_{fingerprint}.parquet")
+        self.n_labels = n_labels
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _load(self) -> pd.DataFrame:
+        if os.path.exists(self.path):
+            return pd.read_parquet(self.path)
+        return pd.DataFrame({"row_hash": np.empty(0, dtype=np.uint64), "clean_text": [], "labels": []})
+
+    def prepare(
+        self,
+        df: pd.DataFrame,
+        hashes: np.ndarray,
+        clean_fn: Callable[[pd.Series], pd.Series],
+        label_fn: Callable[[pd.DataFrame], np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Return (clean_text, Y, n_new) for df, computing only rows whose hash
+        is not cached yet. Labels are stored bit-packed.
+        """
+        store = self._load()
+        known = pd.Index(store["row_hash"].to_numpy(dtype=np.uint64))
+        missing = ~np.isin(hashes, known.to_numpy())
+
+        if missing.any():
+            new_df = df.loc[missing]
+            new_hashes, first = np.unique(hashes[missing], return_index=True)
+            new_df = new_df.iloc[first]
+            new_rows = pd.DataFrame({
+                "row_hash": new_hashes,
+                "clean_text": clean_fn(new_df["ingredients_text"]).to_numpy(),
+                "labels": list(np.packbits(label_fn(new_df), axis=1)),
+            })
+            store = pd.concat([store, new_rows], ignore_index=True)
+            store.to_parquet(self.path, index=False)
+            known = pd.Index(store["row_hash"].to_numpy(dtype=np.uint64))
+
+        pos = known.get_indexer(hashes)
+        clean = store["clean_text"].to_numpy(dtype=object)[pos]
+        packed = np.stack(store["labels"].to_numpy()[pos]) if len(pos) else np.empty((0, 1), dtype=np.uint8)
+        Y = np.unpackbits(packed.astype(np.uint8), axis=1)[:, : self.n_labels]
+        return clean, Y, int(missing.sum())
+
+
+def _matrix_dir(key: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"tfidf_{key}")
+
+
+def save_matrices(key: str, bundle: Dict[str, Any], meta: Dict[str, Any], cache_dir: str = CACHE_DIR) -> None:
+    """
+    Persist a split: X_train/X_val (CSR .npz), Y_train/Y_val and the row
+    hashes of each side (.npy), and the fitted vectorizer (joblib).
+    """
+    path = _matrix_dir(key, cache_dir)
+    os.makedirs(path, exist_ok=True)
+    sp.save_npz(os.path.join(path, "X_train.npz"), sp.csr_matrix(bundle["X_train"]))
+    sp.save_npz(os.path.join(path, "X_val.npz"), sp.csr_matrix(bundle["X_val"]))
+    for name in ("Y_train", "Y_val", "h_train", "h_val"):
+        np.save(os.path.join(path, f"{name}.npy"), bundle[name])
+    dump(bundle["vectorizer"], os.path.join(path, "vectorizer.joblib"))
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2, default=str)
+    with open(os.path.join(cache_dir, LATEST_FILE), "w") as f:
+        json.dump({"key": key, **meta}, f, indent=2, default=str)
+
+
+def load_matrices(key: str, cache_dir: str = CACHE_DIR) -> Optional[Dict[str, Any]]:
+    path = _matrix_dir(key, cache_dir)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    bundle = {
+        "X_train": sp.load_npz(os.path.join(path, "X_train.npz")),
+        "X_val": sp.load_npz(os.path.join(path, "X_val.npz")),
+        "vectorizer": load(os.path.join(path, "vectorizer.joblib")),
+    }
+    for name in ("Y_train", "Y_val", "h_train", "h_val"):
+        bundle[name] = np.load(os.path.join(path, f"{name}.npy"))
+    return bundle
+
+
+def latest_key(cache_dir: str = CACHE_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(cache_dir, LATEST_FILE)) as f:
+            return json.load(f).get("key")
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,76 @@
+# gunicorn_conf.py
+# gunicorn -c gunicorn_conf.py wsgi:app
+#
+# Everything can be overridden from the environment:
+#   WEB_CONCURRENCY        worker processes (default: CPU count)
+#   GUNICORN_WORKER_CLASS  sync | gthread | gevent ... (default: gthread)
+#   GUNICORN_THREADS       request threads per gthread worker (default: 8)
+#   GUNICORN_PRELOAD       1 = load models once in the master before fork (default: 1)
+#                          set 0 for gevent/eventlet, which must patch before app import
+#   CPU_WORKERS / LLM_WORKERS  per-worker pool sizes (see app.py WORKER POOLS)
+#   METRICS_DIR            shared directory for per-worker metric snapshots, summed by
+#                          /metrics (default with several workers: a temp dir per port)
+#   LLM_PROVIDER           llama_cpp / openai_compatible are warmed up in each worker after fork;
+#                          llama_cpp holds one model copy per worker, so prefer few workers
+#                          or run llama.cpp as a sidecar (openai_compatible) instead
+import multiprocessing
+import os
+import tempfile
+
+_cpus = multiprocessing.cpu_count()
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(_cpus)))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# OCR of a multi-panel scan can take a while; graceful_timeout is how long
+# a worker gets on SIGTERM to finish in-flight requests and pool work.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+# Split the cores between the workers so N workers x CPU_WORKERS OCR threads
+# do not oversubscribe the machine. Set before the app is imported.
+os.environ.setdefault("CPU_WORKERS", str(max(1, _cpus // max(1, workers))))
+# Each worker has its own counters; /metrics sums them from this directory
+if workers > 1:
+    os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"allergy-metrics-{bind.rsplit(':', 1)[-1]}"))
+
+
+def on_starting(server):
+    # Counts from a previous run of the server would be added to this one
+    import metrics
+
+    metrics.clear_snapshots()
+
+
+def post_fork(server, worker):
+    import metrics
+
+    metrics.start_snapshot_thread()
+    # Load a local model per worker before it takes traffic (not in the master:
+    # the llama.cpp worker thread would not survive the fork)
+    if os.getenv("LLM_PROVIDER", "huggingface").strip().lower() == "huggingface":
+        return
+    from llm_service import LLMServiceError, get_provider
+
+    try:
+        get_provider().warm_up()
+    except LLMServiceError as e:
+        server.log.warning(f"LLM warm-up failed: {e}")
+
+
+def worker_exit(server, worker):
+    # Let queued scan jobs, OCR and LLM calls finish before the process exits
+    import metrics
+    from app import shutdown_executors
+
+    shutdown_executors(wait=True)
+    metrics.write_snapshot()
@@ -0,0 +1,308 @@
+# hf_stub_server.py
+# Local stand-in for the Hugging Face router, for offline / CI load tests of
+# the /llm/* endpoints. Implements:
+#   POST /models/<model_id>                 hf-inference text generation
+#   POST /hf-inference/models/<model_id>    same, router-style path
+#   POST /v1/chat/completions               chat completions, "stream": true -> SSE
+#   GET  /stub/stats                        request counts by route and outcome
+#   POST /stub/config                       change latency / error rates at runtime
+#   POST /stub/reset                        zero the counters
+#
+#   python hf_stub_server.py --port 8008 --latency-ms 300 --latency-dist lognormal --rate-429 0.05
+#   HUGGINGFACE_API_BASE=http://127.0.0.1:8008/models HUGGINGFACE_API_KEY=stub python app.py
+#
+# Replies are valid JSON for each llm_service prompt type (advice,
+# alternatives, emergency guidance, FAQ), so the app parses them normally.
+# Outcomes are drawn from a seeded RNG, so a run is reproducible.
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+CONFIG = {
+    "latency_ms": 200.0,       # mean latency
+    "latency_dist": "fixed",   # fixed | normal | lognormal | exponential
+    "latency_jitter": 0.3,     # relative spread for normal / lognormal
+    "stream_chunk_ms": 15.0,   # delay between SSE chunks
+    "token_ms": 0.0,           # non-streaming: extra latency per generated word
+    "prompt_token_ms": 0.0,    # prefill: extra latency per prompt word
+    "trailing_words": 0,       # prose the "model" keeps writing after the JSON object
+    "rate_404": 0.0,
+    "rate_410": 0.0,
+    "rate_429": 0.0,
+    "rate_500": 0.0,
+    "rate_503": 0.0,
+    "rate_malformed": 0.0,     # HTTP 200 with a body that is not JSON
+    "rate_bad_content": 0.0,   # valid response whose generated text is not JSON
+    "hf_models_404": False,    # /models/<id> always 404 -> app falls back to chat completions
+}
+ERROR_STATUSES = (404, 410, 429, 500, 503)
+
+_rng = random.Random(0)
+_lock = threading.Lock()
+_stats = {}
+
+REPLIES = {
+    "advice": {
+        "verdict_summary": "Not safe for your allergy profile.",
+        "risk_explanation": "The product lists an allergen that matches your saved allergies.",
+        "hidden_ingredient_watchouts": ["whey", "casein", "natural flavors"],
+        "safer_next_step": "Pick a certified allergen-free alternative.",
+    },
+    "alternatives": {
+        "alternatives": [
+            {"alternative_name": "Oat-based bar", "why_safer": "No milk or nuts listed", "caution_note": "Check for cross-contact"},
+            {"alternative_name": "Rice crackers", "why_safer": "Simple ingredient list", "caution_note": "Some flavours contain soy"},
+            {"alternative_name": "Fruit cup", "why_safer": "Single-ingredient product", "caution_note": "Verify facility warnings"},
+        ]
+    },
+    "emergency": {
+        "severity_level": "moderate",
+        "immediate_actions": ["Stop eating the food", "Take an antihistamine if advised", "Monitor breathing"],
+        "when_to_seek_emergency": "Call emergency services for throat swelling or breathing difficulty.",
+        "follow_up_actions": ["See an allergist", "Keep the label"],
+    },
+    "faq": {
+        "answer": "Cross-contact happens when traces of an allergen transfer to another food.",
+        "safety_disclaimer": "Educational information only.",
+    },
+}
+
+
+def _reply_for(prompt):
+    if "shopping assistant" in prompt:
+        return REPLIES["alternatives"]
+    if "triage assistant" in prompt:
+        return REPLIES["emergency"]
+    if "education assistant" in prompt:
+        return REPLIES["faq"]
+    return REPLIES["advice"]
+
+
+def _count(route, outcome):
+    with _lock:
+        key = f"{route}:{outcome}"
+        _stats[key] = _stats.get(key, 0) + 1
+
+
+def _draw():
+    """Pick (latency seconds, outcome) for one request under the lock-protected RNG."""
+    with _lock:
+        mean = CONFIG["latency_ms"] / 1000.0
+        dist = CONFIG["latency_dist"]
+        if dist == "normal":
+            latency = max(0.0, _rng.gauss(mean, mean * CONFIG["latency_jitter"]))
+        elif dist == "lognormal":
+            sigma = CONFIG["latency_jitter"]
+            latency = _rng.lognormvariate(0, sigma) * mean if mean else 0.0
+        elif dist == "exponential":
+            latency = _rng.expovariate(1 / mean) if mean else 0.0
+        else:
+            latency = mean
+
+        roll = _rng.random()
+        outcome = "ok"
+        for status in ERROR_STATUSES:
+            roll -= CONFIG[f"rate_{status}"]
+            if roll < 0:
+                outcome = status
+                break
+        else:
+            for name in ("malformed", "bad_content"):
+                roll -= CONFIG[f"rate_{name}"]
+                if roll < 0:
+                    outcome = name
+                    break
+    return latency, outcome
+
+
+def _error_response(status):
+    messages = {
+        404: "Model not found",
+        410: "This endpoint is deprecated",
+        429: "Rate limit reached",
+        500: "Internal error",
+        503: "Model is currently loading",
+    }
+    response = jsonify({"error": messages[status]})
+    response.status_code = status
+    if status == 429:
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+TRAILING_PROSE = ("I hope this helps. Remember to always read the label carefully and consult "
+                  "a healthcare professional for personal medical advice about food allergies. ")
+
+
+def _generated_text(prompt, outcome, stop=None):
+    """Reply text; like real servers, generation ends at the first stop sequence (not included)."""
+    if outcome == "bad_content":
+        return "Sorry, I can only answer in prose today."
+    text = json.dumps(_reply_for(prompt), indent=1)
+    if CONFIG["trailing_words"]:
+        words = (TRAILING_PROSE.split() * (CONFIG["trailing_words"] // 20 + 1))[:CONFIG["trailing_words"]]
+        text += "\n\n" + " ".join(words)
+    cut = [text.find(s) for s in (stop or []) if s and s in text]
+    return text[:min(cut)] if cut else text
+
+
+def _token_delay(text):
+    if CONFIG["token_ms"]:
+        time.sleep(len(text.split()) * CONFIG["token_ms"] / 1000.0)
+
+
+def _prompt_delay(prompt):
+    if CONFIG["prompt_token_ms"]:
+        time.sleep(len(str(prompt).split()) * CONFIG["prompt_token_ms"] / 1000.0)
+
+
+@app.route("/models/<path:model_id>", methods=["POST"])
+@app.route("/hf-inference/models/<path:model_id>", methods=["POST"])
+def hf_inference(model_id):
+    route = "hf_inference"
+    if CONFIG["hf_models_404"]:
+        _count(route, 404)
+        return _error_response(404)
+
+    latency, outcome = _draw()
+    time.sleep(latency)
+    _count(route, outcome)
+    if outcome in ERROR_STATUSES:
+        return _error_response(outcome)
+    if outcome == "malformed":
+        return Response('[{"generated_text": "{\\"verdict', mimetype="application/json")
+
+    body = request.get_json(silent=True) or {}
+    _prompt_delay(body.get("inputs", ""))
+    text = _generated_text(body.get("inputs", ""), outcome, (body.get("parameters") or {}).get("stop"))
+    _token_delay(text)
+    return jsonify([{"generated_text": text}])
+
+
+def _sse_chunks(model, text, chunk_ms):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        piece = word if i == 0 else " " + word
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        if chunk_ms:
+            time.sleep(chunk_ms / 1000.0)
+    done = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    yield f"data: {json.dumps(done)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    body = request.get_json(silent=True) or {}
+    stream = bool(body.get("stream"))
+    route = "chat_stream" if stream else "chat"
+
+    latency, outcome = _draw()
+    time.sleep(latency)
+    _count(route, outcome)
+    if outcome in ERROR_STATUSES:
+        return _error_response(outcome)
+    if outcome == "malformed":
+        return Response('{"choices": [{"message": {"content": ', mimetype="application/json")
+
+    messages = body.get("messages") or [{}]
+    prompt = str(messages[-1].get("content", ""))
+    model = body.get("model", "stub-model")
+    _prompt_delay(prompt)
+    text = _generated_text(prompt, outcome, body.get("stop"))
+
+    if stream:
+        return Response(_sse_chunks(model, text, CONFIG["stream_chunk_ms"]), mimetype="text/event-stream")
+    _token_delay(text)
+    return jsonify({
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split())},
+    })
+
+
+@app.route("/stub/stats", methods=["GET"])
+def stub_stats():
+    with _lock:
+        return jsonify({"config": CONFIG, "counts": dict(_stats)})
+
+
+@app.route("/stub/reset", methods=["POST"])
+def stub_reset():
+    with _lock:
+        _stats.clear()
+    return jsonify({"success": True})
+
+
+def _coerce(current, value):
+    """value converted to the type of the current setting; bool("false") would be True."""
+    if isinstance(current, bool):
+        return value.strip().lower() in ("1", "true", "yes") if isinstance(value, str) else bool(value)
+    return type(current)(value)
+
+
+@app.route("/stub/config", methods=["POST"])
+def stub_config():
+    updates = request.get_json(silent=True) or {}
+    unknown = [k for k in updates if k not in CONFIG and k != "seed"]
+    if unknown:
+        return jsonify({"success": False, "message": f"Unknown keys: {', '.join(unknown)}"}), 400
+    with _lock:
+        if "seed" in updates:
+            _rng.seed(updates.pop("seed"))
+        for key, value in updates.items():
+            CONFIG[key] = _coerce(CONFIG[key], value)
+    return jsonify({"success": True, "config": CONFIG})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Hugging Face router stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=CONFIG["latency_ms"])
+    parser.add_argument("--latency-dist", choices=["fixed", "normal", "lognormal", "exponential"],
+                        default=CONFIG["latency_dist"])
+    parser.add_argument("--latency-jitter", type=float, default=CONFIG["latency_jitter"])
+    parser.add_argument("--stream-chunk-ms", type=float, default=CONFIG["stream_chunk_ms"])
+    parser.add_argument("--token-ms", type=float, default=CONFIG["token_ms"],
+                        help="Non-streaming latency per generated word")
+    parser.add_argument("--prompt-token-ms", type=float, default=CONFIG["prompt_token_ms"],
+                        help="Latency per prompt word (prefill)")
+    parser.add_argument("--trailing-words", type=int, default=CONFIG["trailing_words"],
+                        help="Prose appended after the JSON object (tests early stop)")
+    for status in ERROR_STATUSES:
+        parser.add_argument(f"--rate-{status}", type=float, default=0.0, help=f"Fraction of requests answered {status}")
+    parser.add_argument("--rate-malformed", type=float, default=0.0, help="Fraction answered with invalid JSON")
+    parser.add_argument("--rate-bad-content", type=float, default=0.0, help="Fraction whose generated text is not JSON")
+    parser.add_argument("--hf-models-404", action="store_true", help="Force the chat-completions fallback route")
+    args = parser.parse_args()
+
+    _rng.seed(args.seed)
+    for key in CONFIG:
+        CONFIG[key] = getattr(args, key)
+
+    print(f"HF stub on http://{args.host}:{args.port}  "
+          f"(HUGGINGFACE_API_BASE=http://{args.host}:{args.port}/models)")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
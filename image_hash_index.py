@@ -0,0 +1,382 @@
+"""
+Perceptual-hash index of scanned label images, recognizing a new photo of
+packaging that was already scanned (another angle, other lighting).
+
+A match is a hint, not proof of the same text: the hashes describe the
+layout of the text block, so the same label with one ingredient swapped
+("maize starch" -> "peanuts") lands as close as a re-shot of it (see the
+variant rows of bench_image_hash.py). Callers must not use a match in
+place of OCR.
+
+    python image_hash_index.py hash label.jpg
+    python image_hash_index.py lookup label.jpg
+    python image_hash_index.py compact               # drop evicted entries from the file
+
+Images are normalized before hashing, since a label's text block looks much
+the same from photo to photo apart from lighting, tilt and framing: the
+grayscale thumbnail is divided by its blurred background (uneven light),
+deskewed by the projection-profile angle and cropped to the ink. Then two
+hashes are taken: a 256-bit dHash (signs of horizontal gradients on a
+16x16 grid), which is what is indexed, and a 64-bit pHash (signs of the
+low-frequency DCT coefficients), which a match must also be close in.
+
+Lookups use multi-index hashing: the dHash is split into CHUNKS 16-bit
+chunks, each with its own table. Two hashes within MAX_DISTANCE bits have
+at least one chunk within MAX_DISTANCE // CHUNKS bits, so probing every
+chunk value that close finds all candidates, which are then verified on
+the full hashes. (A BK-tree over the same hashes visits nearly every node
+at this radius.) See bench_image_hash.py for recognition / false-match
+rates and latency.
+
+Entries are kept in memory up to max_entries (LRU) and appended to a JSONL
+file, so several gunicorn workers can add entries; load() keeps the newest
+max_entries lines. Once a worker has seen COMPACT_FACTOR * max_entries
+lines the file is rewritten with the newest max_entries in a background
+thread, so it stays bounded.
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+INDEX_PATH = "models/image_hash_index.jsonl"
+
+WORK_SIZE = 256
+DHASH_SIZE = 16
+PHASH_SIZE = 8
+DCT_SIZE = 32
+CHUNKS = 16
+CHUNK_BITS = DHASH_SIZE * DHASH_SIZE // CHUNKS
+MAX_DISTANCE = 40
+PHASH_MAX_DISTANCE = 14
+# Ink darker than this fraction of the local background
+INK_LEVEL = 0.75
+# Below this many ink pixels (of the thumbnail) there is no label to recognize
+MIN_INK_PIXELS = 200
+DESKEW_ANGLES = np.arange(-8.0, 8.01, 0.5)
+# File lines (as a multiple of max_entries) at which the file is compacted
+COMPACT_FACTOR = 2
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def _skew_angle(ys: np.ndarray, xs: np.ndarray) -> float:
+    """Rotation (degrees) that makes the text lines horizontal: the sharpest row profile of the ink."""
+    cy, cx = ys.mean(), xs.mean()
+    best_score, best_angle = -1.0, 0.0
+    for angle in DESKEW_ANGLES:
+        t = np.deg2rad(angle)
+        rows = np.round((ys - cy) * np.cos(t) - (xs - cx) * np.sin(t)).astype(np.int64)
+        profile = np.bincount(rows - rows.min()).astype(np.float64)
+        score = float(profile @ profile)
+        if score > best_score:
+            best_score, best_angle = score, float(angle)
+    return best_angle
+
+
+def normalize_image(image) -> Optional[np.ndarray]:
+    """
+    Path, PIL image or array -> flat-lit, deskewed, ink-cropped grayscale
+    thumbnail (float, 1 = background). None if it shows too little ink.
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    if isinstance(image, Image.Image):
+        gray = image.convert("L")
+    else:
+        with Image.open(image) as img:
+            # JPEG can decode straight to 1/2../1/8 scale
+            img.draft("L", (WORK_SIZE, WORK_SIZE))
+            gray = img.convert("L")
+    gray.thumbnail((WORK_SIZE, WORK_SIZE), Image.BILINEAR)
+
+    background = gray.filter(ImageFilter.BoxBlur(WORK_SIZE // 16))
+    flat = np.clip(np.asarray(gray, dtype=np.float64) / np.maximum(np.asarray(background, dtype=np.float64), 1.0),
+                   0.0, 1.0)
+    ys, xs = np.nonzero(flat < INK_LEVEL)
+    if len(xs) < MIN_INK_PIXELS:
+        return None
+
+    angle = _skew_angle(ys, xs)
+    if angle:
+        rotated = Image.fromarray((flat * 255).astype(np.uint8)).rotate(
+            angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+        flat = np.asarray(rotated, dtype=np.float64) / 255
+        ys, xs = np.nonzero(flat < INK_LEVEL)
+    # Percentiles so a few specks at the edges don't widen the crop
+    x0, x1 = np.percentile(xs, [0.5, 99.5]).astype(int)
+    y0, y1 = np.percentile(ys, [0.5, 99.5]).astype(int)
+    return flat[y0:y1 + 1, x0:x1 + 1]
+
+
+def _resized(norm: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    img = Image.fromarray((norm * 255).astype(np.uint8)).resize(size, Image.BILINEAR)
+    return np.asarray(img, dtype=np.float64)
+
+
+def image_hashes(image) -> Optional[Tuple[int, int]]:
+    """(dHash, pHash) of an image path, PIL image or array; None if it has no label to hash."""
+    norm = normalize_image(image)
+    if norm is None:
+        return None
+    pixels = _resized(norm, (DHASH_SIZE + 1, DHASH_SIZE))
+    dhash = _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+    coeffs = (_DCT @ _resized(norm, (DCT_SIZE, DCT_SIZE)) @ _DCT.T)[:PHASH_SIZE, :PHASH_SIZE].ravel()
+    # The DC term is overall brightness; leaving it out of the median makes lighting matter less
+    phash = _bits_to_int(coeffs > np.median(coeffs[1:]))
+    return dhash, phash
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """Hamming-radius search over CHUNKS * CHUNK_BITS-bit hashes (multi-index hashing)."""
+
+    def __init__(self, radius: int, chunks: int = CHUNKS, chunk_bits: int = CHUNK_BITS):
+        self.radius = radius
+        self.chunks = chunks
+        self.chunk_bits = chunk_bits
+        self._chunk_mask = (1 << chunk_bits) - 1
+        # Every chunk value within radius // chunks bits is probed: this many XOR masks per chunk
+        sub_radius = radius // chunks
+        self._probes = [sum(1 << b for b in bits)
+                        for r in range(sub_radius + 1) for bits in itertools.combinations(range(chunk_bits), r)]
+        self._tables = [{} for _ in range(chunks)]
+
+    def _chunks(self, key: int) -> List[int]:
+        return [(key >> (i * self.chunk_bits)) & self._chunk_mask for i in range(self.chunks)]
+
+    def add(self, key: int, item: Any) -> None:
+        for table, chunk in zip(self._tables, self._chunks(key)):
+            table.setdefault(chunk, []).append(item)
+
+    def remove(self, key: int, item: Any) -> None:
+        for table, chunk in zip(self._tables, self._chunks(key)):
+            items = table.get(chunk)
+            if items and item in items:
+                items.remove(item)
+                if not items:
+                    del table[chunk]
+
+    def candidates(self, key: int) -> set:
+        """Superset of the items within radius of key."""
+        found = set()
+        for table, chunk in zip(self._tables, self._chunks(key)):
+            for probe in self._probes:
+                items = table.get(chunk ^ probe)
+                if items:
+                    found.update(items)
+        return found
+
+
+class ImageHashIndex:
+    def __init__(self, path: Optional[str] = None, max_distance: int = MAX_DISTANCE,
+                 phash_max_distance: int = PHASH_MAX_DISTANCE, max_entries: int = 5000):
+        self.path = path
+        self.max_distance = max_distance
+        self.phash_max_distance = phash_max_distance
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> (dhash, phash, payload), LRU order
+        self._mih = MultiIndexHash(max_distance)
+        self._file = None
+        self._lines = 0  # lines in the file, as far as this process knows
+        self._compactor: Optional[threading.Thread] = None
+        self.hits = self.misses = self.evictions = 0
+
+    ###################################
+    # LOOKUP / ADD
+    ###################################
+    def lookup(self, hashes: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """Closest stored image within both radii: {"id", "distance", "phash_distance", "payload"} or None."""
+        dhash, phash = hashes
+        with self._lock:
+            best = None
+            for entry_id in self._mih.candidates(dhash):
+                stored_d, stored_p, _ = self._entries[entry_id]
+                distance = hamming(dhash, stored_d)
+                if distance > self.max_distance:
+                    continue
+                p_distance = hamming(phash, stored_p)
+                if p_distance > self.phash_max_distance:
+                    continue
+                if best is None or distance < best[0]:
+                    best = (distance, p_distance, entry_id)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best[2])
+            return {"id": best[2], "distance": best[0], "phash_distance": best[1],
+                    "payload": self._entries[best[2]][2]}
+
+    def add(self, hashes: Tuple[int, int], payload: Dict[str, Any]) -> int:
+        """Store an image's hashes with a JSON-serializable payload. Returns the entry id."""
+        with self._lock:
+            # random ids stay unique across workers sharing one file
+            entry_id = int.from_bytes(os.urandom(8), "big") >> 1
+            self._add(entry_id, hashes[0], hashes[1], payload)
+            self._append(self._record(entry_id, hashes[0], hashes[1], payload))
+        return entry_id
+
+    def _add(self, entry_id: int, dhash: int, phash: int, payload: Dict[str, Any]) -> None:
+        if entry_id in self._entries:
+            return
+        if len(self._entries) >= self.max_entries:
+            old_id, (old_d, _, _) = self._entries.popitem(last=False)
+            self._mih.remove(old_d, old_id)
+            self.evictions += 1
+        self._entries[entry_id] = (dhash, phash, payload)
+        self._mih.add(dhash, entry_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "phash_max_distance": self.phash_max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    ###################################
+    # PERSISTENCE
+    ###################################
+    @staticmethod
+    def _record(entry_id: int, dhash: int, phash: int, payload: Dict[str, Any]) -> str:
+        return json.dumps({"id": entry_id, "dhash": f"{dhash:064x}", "phash": f"{phash:016x}", "payload": payload},
+                          separators=(",", ":")) + "\n"
+
+    def _append(self, line: str) -> None:
+        if not self.path:
+            return
+        if self._file is not None and not self._same_file():
+            # another worker compacted (replaced) the file
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        # one write per line keeps lines from concurrent workers intact (O_APPEND)
+        self._file.write(line)
+        self._file.flush()
+        self._lines += 1
+        if (self._lines >= COMPACT_FACTOR * self.max_entries
+                and (self._compactor is None or not self._compactor.is_alive())):
+            self._compactor = threading.Thread(target=self.compact, daemon=True)
+            self._compactor.start()
+
+    def _same_file(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except OSError:
+            return False
+
+    def load(self) -> int:
+        """Read the newest max_entries entries from the file. Returns the number loaded."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with self._lock, open(self.path, encoding="utf-8") as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line after a crash
+                self._add(record["id"], int(record["dhash"], 16), int(record["phash"], 16), record["payload"])
+            self.evictions = 0
+            return len(self._entries)
+
+    def compact(self) -> int:
+        """
+        Rewrite the file (atomically) with its newest max_entries entries.
+        Reads the file rather than this process's entries, so entries other
+        workers appended are kept (lines they append during the rewrite can
+        be lost, which a cache tolerates). Returns the entries written.
+        """
+        if not self.path:
+            return 0
+        fresh = ImageHashIndex(self.path, max_entries=self.max_entries)
+        fresh.load()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry_id, (dhash, phash, payload) in fresh._entries.items():
+                f.write(self._record(entry_id, dhash, phash, payload))
+        with self._lock:
+            os.replace(tmp_path, self.path)
+            # The old handle points at the replaced file
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._lines = len(fresh)
+        return len(fresh)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash label images or inspect the image hash index.")
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--max-entries", type=int, default=5000)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("hash", help="Print the dHash / pHash of images").add_argument("images", nargs="+")
+    sub.add_parser("lookup", help="Find the stored scan matching images").add_argument("images", nargs="+")
+    sub.add_parser("compact", help="Rewrite the index file without evicted entries")
+    args = parser.parse_args()
+
+    if args.command == "hash":
+        for path in args.images:
+            hashes = image_hashes(path)
+            print(f"{path}: " + ("no label found" if hashes is None else f"dhash={hashes[0]:064x} phash={hashes[1]:016x}"))
+        return
+
+    index = ImageHashIndex(args.index, max_entries=args.max_entries)
+    start = time.perf_counter()
+    loaded = index.load()
+    print(f"Loaded {loaded} entries in {time.perf_counter() - start:.2f}s")
+    if args.command == "compact":
+        print(f"Rewrote {args.index} with {index.compact()} entries")
+        return
+    for path in args.images:
+        hashes = image_hashes(path)
+        if hashes is None:
+            print(f"{path}: no label found")
+            continue
+        start = time.perf_counter()
+        match = index.lookup(hashes)
+        ms = (time.perf_counter() - start) * 1000
+        if match is None:
+            print(f"{path}: no match ({ms:.2f} ms)")
+        else:
+            text = match["payload"].get("text", "")
+            print(f"{path}: distance {match['distance']}/{match['phash_distance']} ({ms:.2f} ms): {text[:80]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 import json
 import os
+import queue
 import re
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from typing import Any, Dict, List, Optional
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit
 
 import requests
 
+from metrics import LLM_JSON_RESULTS, LLM_ROUTE_CALLS
+from prompt_compactor import compact_ingredients
+
 
 class LLMServiceError(Exception):
     pass
@@ -39,14 +45,23 @@ def _get_hf_config() -> Dict[str, Any]:
     if base_url.startswith("https://api-inference.huggingface.co"):
         base_url = "https://router.huggingface.co/hf-inference/models"
 
+    # Chat-completions fallback lives on the same host as the inference API
+    # (so a local stub server can stand in for both); override if it does not.
+    chat_url = os.getenv("HUGGINGFACE_CHAT_URL", "").strip()
+    if not chat_url:
+        parts = urlsplit(base_url)
+        chat_url = f"{parts.scheme}://{parts.netloc}/v1/chat/completions"
+
     return {
         "api_key": api_key,
         "model_id": os.getenv("HUGGINGFACE_MODEL_ID", "mistralai/Mistral-7B-Instruct-v0.3").strip(),
         "chat_model_id": os.getenv("HUGGINGFACE_CHAT_MODEL_ID", "Qwen/Qwen2.5-7B-Instruct").strip(),
         "base_url": base_url,
+        "chat_url": chat_url,
         "timeout_seconds": _get_env_int("HUGGINGFACE_TIMEOUT_SECONDS", 20),
         "max_new_tokens": _get_env_int("HUGGINGFACE_MAX_NEW_TOKENS", 240),
         "temperature": _get_env_float("HUGGINGFACE_TEMPERATURE", 0.2),
+        "stream": os.getenv("LLM_STREAM", "1") == "1",
     }
 
 
@@ -75,6 +90,131 @@ def _extract_generated_text(response_json: Any) -> str:
     raise LLMServiceError("No generated text returned by Hugging Face")
 
 
+###################################
+# JSON SCANNING
+###################################
+# Every prompt asks for a single JSON object. Generation stops as soon as
+# that object is closed: stop sequences for non-streaming calls, and with
+# streaming the connection is dropped once JsonObjectScanner sees the
+# closing brace. Servers drop the matched stop sequence from the output,
+# so the final brace is usually missing; _extract_json_object closes it.
+JSON_STOP_SEQUENCES = ["}\n\n", "}\n```", "```\n\n"]
+
+_JSON_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+
+
+class JsonObjectScanner:
+    """
+    Incremental scanner for the first top-level JSON object in a text
+    stream. feed() returns True once the object is balanced; braces inside
+    strings and escaped quotes are handled. Only structural characters are
+    visited, so feeding a whole reply costs one regex pass.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> bool:
+        self.text += chunk
+        if self.end is not None:
+            return True
+        pos = self._pos
+        while True:
+            match = _JSON_STRUCTURAL.search(self.text, pos)
+            if match is None:
+                break
+            i, ch = match.start(), match.group()
+            pos = i + 1
+            if self._in_string:
+                if ch == "\\":
+                    if pos >= len(self.text):  # escaped char not received yet
+                        pos = i
+                        break
+                    pos += 1
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if self.start is None:
+                if ch == "{":
+                    self.start = i
+                    self._stack.append("}")
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append("}" if ch == "{" else "]")
+            elif ch in "}]":
+                if self._stack and self._stack[-1] == ch:
+                    self._stack.pop()
+                if not self._stack:
+                    self.end = i + 1
+                    pos = self.end
+                    break
+        self._pos = pos
+        return self.end is not None
+
+    def object_text(self) -> Optional[str]:
+        """The complete object, or None if it has not been closed yet."""
+        return self.text[self.start:self.end] if self.end is not None else None
+
+    def repaired_text(self) -> Optional[str]:
+        """An unfinished object (e.g. cut by max_tokens) closed off, for a best-effort parse."""
+        if self.start is None or self.end is not None:
+            return self.object_text()
+        tail = self.text[self.start:].rstrip()
+        if self._in_string:
+            tail += '"'
+        tail = tail.rstrip(",:")
+        return tail + "".join(reversed(self._stack))
+
+
+def _read_chat_stream(response: requests.Response) -> str:
+    """Read an SSE chat-completions stream until the JSON object is complete, then hang up."""
+    scanner = JsonObjectScanner()
+    response.encoding = response.encoding or "utf-8"
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(chunk, dict) and chunk.get("error"):
+                raise LLMServiceError(f"Hugging Face error: {chunk['error']}")
+            choices = chunk.get("choices") if isinstance(chunk, dict) else None
+            content = (choices[0].get("delta") or {}).get("content") if choices else None
+            if content and scanner.feed(content):
+                break  # closing the connection cancels the rest of the generation
+    except requests.RequestException as exc:
+        raise LLMServiceError(f"Stream interrupted: {exc}") from exc
+    finally:
+        response.close()
+    text = scanner.object_text() or scanner.text.strip()
+    if not text:
+        raise LLMServiceError("No generated text returned by Hugging Face")
+    return text
+
+
+def _chat_response_text(response: requests.Response) -> str:
+    """Generated text from a chat-completions response, streamed (SSE) or not. Raises ValueError on bad JSON."""
+    if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+        return _read_chat_stream(response)
+    return _extract_generated_text(response.json())
+
+
 def _call_huggingface(prompt: str, max_new_tokens: Optional[int] = None, temperature: Optional[float] = None) -> str:
     cfg = _get_hf_config()
     headers = {"Authorization": f"Bearer {cfg['api_key']}"}
@@ -84,6 +224,7 @@ def _call_huggingface(prompt: str, max_new_tokens: Optional[int] = None, tempera
             "max_new_tokens": max_new_tokens if max_new_tokens is not None else cfg["max_new_tokens"],
             "temperature": temperature if temperature is not None else cfg["temperature"],
             "return_full_text": False,
+            "stop": JSON_STOP_SEQUENCES,
         },
     }
 
@@ -107,46 +248,59 @@ def _call_huggingface(prompt: str, max_new_tokens: Optional[int] = None, tempera
         try:
             response = requests.post(url, headers=headers, json=generation_payload, timeout=timeout)
         except requests.exceptions.Timeout as exc:
+            LLM_ROUTE_CALLS.inc(route="hf_inference", outcome="timeout")
             raise LLMServiceError("Hugging Face request timed out") from exc
         except requests.RequestException as exc:
+            LLM_ROUTE_CALLS.inc(route="hf_inference", outcome="network_error")
             raise LLMServiceError(f"Network error while calling Hugging Face: {exc}") from exc
 
         if response.status_code == 410:
+            LLM_ROUTE_CALLS.inc(route="hf_inference", outcome="error")
             raise LLMServiceError(
                 "Hugging Face endpoint is deprecated. Use HUGGINGFACE_API_BASE=https://router.huggingface.co/hf-inference/models"
             )
 
         if response.status_code == 404:
+            LLM_ROUTE_CALLS.inc(route="hf_inference", outcome="not_found")
             last_error = f"Hugging Face API failed (404) at {url}: {response.text[:200]}"
             continue
 
         if response.status_code >= 400:
+            LLM_ROUTE_CALLS.inc(route="hf_inference", outcome="error")
             short_body = response.text[:300]
             raise LLMServiceError(f"Hugging Face API failed ({response.status_code}): {short_body}")
 
         try:
             response_json = response.json()
         except ValueError as exc:
+            LLM_ROUTE_CALLS.inc(route="hf_inference", outcome="error")
             raise LLMServiceError("Invalid JSON response from Hugging Face") from exc
+        LLM_ROUTE_CALLS.inc(route="hf_inference", outcome="ok")
         return _extract_generated_text(response_json)
 
     # Fallback for Inference Providers tokens via chat-completions router endpoint.
-    chat_url = "https://router.huggingface.co/v1/chat/completions"
+    chat_url = cfg["chat_url"]
     chat_model = cfg["chat_model_id"] or raw_model
     chat_payload = {
         "model": chat_model,
         "messages": [{"role": "user", "content": prompt}],
         "max_tokens": max_new_tokens if max_new_tokens is not None else cfg["max_new_tokens"],
         "temperature": temperature if temperature is not None else cfg["temperature"],
+        "stop": JSON_STOP_SEQUENCES,
+        "stream": cfg["stream"],
     }
     try:
-        chat_response = requests.post(chat_url, headers=headers, json=chat_payload, timeout=timeout)
+        chat_response = requests.post(chat_url, headers=headers, json=chat_payload, timeout=timeout,
+                                      stream=cfg["stream"])
     except requests.exceptions.Timeout as exc:
+        LLM_ROUTE_CALLS.inc(route="chat_completions", outcome="timeout")
         raise LLMServiceError("Hugging Face chat-completions request timed out") from exc
     except requests.RequestException as exc:
+        LLM_ROUTE_CALLS.inc(route="chat_completions", outcome="network_error")
         raise LLMServiceError(f"Network error while calling Hugging Face chat-completions: {exc}") from exc
 
     if chat_response.status_code >= 400:
+        LLM_ROUTE_CALLS.inc(route="chat_completions", outcome="error")
         # If the configured model is not chat-compatible, retry once with fallback chat model.
         try:
             err_json = chat_response.json()
@@ -155,33 +309,247 @@ def _call_huggingface(prompt: str, max_new_tokens: Optional[int] = None, tempera
 
         err_text = json.dumps(err_json) if err_json else chat_response.text
         if chat_response.status_code == 400 and "model_not_supported" in err_text and chat_model != "Qwen/Qwen2.5-7B-Instruct":
-            retry_payload = {
-                "model": "Qwen/Qwen2.5-7B-Instruct",
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": max_new_tokens if max_new_tokens is not None else cfg["max_new_tokens"],
-                "temperature": temperature if temperature is not None else cfg["temperature"],
-            }
+            retry_payload = {**chat_payload, "model": "Qwen/Qwen2.5-7B-Instruct"}
             try:
-                retry_response = requests.post(chat_url, headers=headers, json=retry_payload, timeout=timeout)
+                retry_response = requests.post(chat_url, headers=headers, json=retry_payload, timeout=timeout,
+                                               stream=cfg["stream"])
                 if retry_response.status_code < 400:
                     try:
-                        retry_json = retry_response.json()
+                        retry_text = _chat_response_text(retry_response)
                     except ValueError as exc:
+                        LLM_ROUTE_CALLS.inc(route="chat_fallback_model", outcome="error")
                         raise LLMServiceError("Invalid JSON response from Hugging Face chat-completions fallback") from exc
-                    return _extract_generated_text(retry_json)
+                    LLM_ROUTE_CALLS.inc(route="chat_fallback_model", outcome="ok")
+                    return retry_text
+                LLM_ROUTE_CALLS.inc(route="chat_fallback_model", outcome="error")
             except requests.RequestException:
-                pass
+                LLM_ROUTE_CALLS.inc(route="chat_fallback_model", outcome="network_error")
 
         short_body = chat_response.text[:300]
         suffix = f" Previous error: {last_error}" if last_error else ""
         raise LLMServiceError(f"Hugging Face API failed ({chat_response.status_code}): {short_body}{suffix}")
 
     try:
-        chat_json = chat_response.json()
+        chat_text = _chat_response_text(chat_response)
     except ValueError as exc:
+        LLM_ROUTE_CALLS.inc(route="chat_completions", outcome="error")
         raise LLMServiceError("Invalid JSON response from Hugging Face chat-completions") from exc
 
-    return _extract_generated_text(chat_json)
+    LLM_ROUTE_CALLS.inc(route="chat_completions", outcome="ok")
+    return chat_text
+
+
+###################################
+# PROVIDERS
+###################################
+# LLM_PROVIDER selects the backend:
+#   huggingface        remote HF inference / router API (default)
+#   llama_cpp          local quantized GGUF model in-process (pip install llama-cpp-python)
+#   openai_compatible  sidecar with an OpenAI-style /v1/chat/completions
+#                      (llama.cpp server, vLLM, Ollama, hf_stub_server.py ...)
+class LLMProvider:
+    """Backend interface: complete() returns {"text", "completion_tokens"} (tokens may be None)."""
+
+    name = "base"
+
+    def complete(self, prompt: str, max_new_tokens: int, temperature: float) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Load whatever the backend needs so the first request is not slow."""
+
+
+class HuggingFaceProvider(LLMProvider):
+    name = "huggingface"
+
+    def complete(self, prompt: str, max_new_tokens: int, temperature: float) -> Dict[str, Any]:
+        return {"text": _call_huggingface(prompt, max_new_tokens, temperature), "completion_tokens": None}
+
+
+def _chat_completion_result(response: requests.Response) -> Dict[str, Any]:
+    if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+        return {"text": _read_chat_stream(response), "completion_tokens": None}
+    response_json = response.json()
+    usage = response_json.get("usage") if isinstance(response_json, dict) else None
+    return {
+        "text": _extract_generated_text(response_json),
+        "completion_tokens": (usage or {}).get("completion_tokens"),
+    }
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    name = "openai_compatible"
+
+    def __init__(self, url: str, model: str, timeout_seconds: int, api_key: str = "", stream: bool = True):
+        self.url = url
+        self.model = model
+        self.timeout_seconds = timeout_seconds
+        self.stream = stream
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.session = requests.Session()
+
+    def complete(self, prompt: str, max_new_tokens: int, temperature: float) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_new_tokens,
+            "temperature": temperature,
+            "stop": JSON_STOP_SEQUENCES,
+            "stream": self.stream,
+        }
+        try:
+            response = self.session.post(self.url, headers=self.headers, json=payload,
+                                         timeout=self.timeout_seconds, stream=self.stream)
+        except requests.exceptions.Timeout as exc:
+            LLM_ROUTE_CALLS.inc(route=self.name, outcome="timeout")
+            raise LLMServiceError("Local LLM sidecar timed out") from exc
+        except requests.RequestException as exc:
+            LLM_ROUTE_CALLS.inc(route=self.name, outcome="network_error")
+            raise LLMServiceError(f"Network error while calling local LLM sidecar: {exc}") from exc
+        if response.status_code >= 400:
+            LLM_ROUTE_CALLS.inc(route=self.name, outcome="error")
+            raise LLMServiceError(f"Local LLM sidecar failed ({response.status_code}): {response.text[:300]}")
+        try:
+            result = _chat_completion_result(response)
+        except ValueError as exc:
+            LLM_ROUTE_CALLS.inc(route=self.name, outcome="error")
+            raise LLMServiceError("Invalid JSON response from local LLM sidecar") from exc
+        LLM_ROUTE_CALLS.inc(route=self.name, outcome="ok")
+        return result
+
+
+class LlamaCppProvider(LLMProvider):
+    """
+    Quantized GGUF model run in-process with llama-cpp-python. The model is
+    loaded once and kept warm; a llama.cpp context is not thread-safe, so
+    requests go through a bounded queue served by one worker thread.
+    """
+
+    name = "llama_cpp"
+
+    def __init__(self, model_path: str, n_ctx: int, n_threads: int, max_queue: int, timeout_seconds: int):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.timeout_seconds = timeout_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._llm = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def warm_up(self) -> None:
+        with self._lock:
+            if self._llm is None:
+                try:
+                    from llama_cpp import Llama
+                except ImportError as exc:
+                    raise LLMServiceError("llama-cpp-python is not installed (pip install llama-cpp-python)") from exc
+                if not self.model_path or not os.path.exists(self.model_path):
+                    raise LLMServiceError(f"LLAMA_MODEL_PATH not found: {self.model_path or '(not set)'}")
+                self._llm = Llama(model_path=self.model_path, n_ctx=self.n_ctx,
+                                  n_threads=self.n_threads, verbose=False)
+                # Touch the weights once so the first real request does not pay for paging them in
+                self._llm.create_chat_completion(messages=[{"role": "user", "content": "Hi"}], max_tokens=1)
+            # Not alive after a fork (gunicorn worker), so it is started per process
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._serve, name="llama-cpp", daemon=True)
+                self._worker.start()
+
+    def _serve(self) -> None:
+        while True:
+            future, messages, max_tokens, temperature = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._generate(messages, max_tokens, temperature))
+            except Exception as exc:
+                future.set_exception(exc)
+
+    def _generate(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> Dict[str, Any]:
+        # Stream token by token and stop as soon as the JSON object is closed
+        scanner = JsonObjectScanner()
+        tokens = 0
+        stream = self._llm.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=temperature,
+                                                  stop=JSON_STOP_SEQUENCES, stream=True)
+        try:
+            for chunk in stream:
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if not content:
+                    continue
+                tokens += 1
+                if scanner.feed(content):
+                    break
+        finally:
+            stream.close()
+        return {"text": scanner.object_text() or scanner.text.strip(), "completion_tokens": tokens}
+
+    def complete(self, prompt: str, max_new_tokens: int, temperature: float) -> Dict[str, Any]:
+        self.warm_up()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((future, [{"role": "user", "content": prompt}], max_new_tokens, temperature))
+        except queue.Full as exc:
+            LLM_ROUTE_CALLS.inc(route=self.name, outcome="queue_full")
+            raise LLMServiceError("Local model is busy. Please try again shortly.") from exc
+        try:
+            result = future.result(timeout=self.timeout_seconds)
+        except FutureTimeoutError as exc:
+            future.cancel()
+            LLM_ROUTE_CALLS.inc(route=self.name, outcome="timeout")
+            raise LLMServiceError("Local model request timed out") from exc
+        except Exception as exc:
+            LLM_ROUTE_CALLS.inc(route=self.name, outcome="error")
+            raise LLMServiceError(f"Local model failed: {exc}") from exc
+        LLM_ROUTE_CALLS.inc(route=self.name, outcome="ok")
+        return result
+
+
+def _build_provider(name: str) -> LLMProvider:
+    if name == "huggingface":
+        return HuggingFaceProvider()
+    if name == "llama_cpp":
+        return LlamaCppProvider(
+            model_path=os.getenv("LLAMA_MODEL_PATH", "").strip(),
+            n_ctx=_get_env_int("LLAMA_N_CTX", 2048),
+            n_threads=_get_env_int("LLAMA_N_THREADS", os.cpu_count() or 1),
+            max_queue=_get_env_int("LLAMA_MAX_QUEUE", 16),
+            timeout_seconds=_get_env_int("LLAMA_TIMEOUT_SECONDS", 60),
+        )
+    if name == "openai_compatible":
+        return OpenAICompatibleProvider(
+            url=os.getenv("LLM_SIDECAR_URL", "http://127.0.0.1:8080/v1/chat/completions").strip(),
+            model=os.getenv("LLM_SIDECAR_MODEL", "local").strip(),
+            timeout_seconds=_get_env_int("LLM_SIDECAR_TIMEOUT_SECONDS", 60),
+            api_key=os.getenv("LLM_SIDECAR_API_KEY", "").strip(),
+            stream=os.getenv("LLM_STREAM", "1") == "1",
+        )
+    raise LLMServiceError(f"Unknown LLM_PROVIDER '{name}'. Use huggingface, llama_cpp or openai_compatible")
+
+
+_providers: Dict[str, LLMProvider] = {}
+_providers_lock = threading.Lock()
+_provider_override: Optional[LLMProvider] = None
+
+
+def get_provider() -> LLMProvider:
+    """The configured provider; one instance per name, so local models stay loaded."""
+    if _provider_override is not None:
+        return _provider_override
+    name = os.getenv("LLM_PROVIDER", "huggingface").strip().lower()
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = _build_provider(name)
+        return _providers[name]
+
+
+def set_provider(provider: Optional[LLMProvider]) -> None:
+    """Force a provider instance (benchmarks, tests); None goes back to LLM_PROVIDER."""
+    global _provider_override
+    _provider_override = provider
+
+
+def _generate(prompt: str, max_new_tokens: int, temperature: float) -> str:
+    return get_provider().complete(prompt, max_new_tokens, temperature)["text"]
 
 
 def _extract_json_object(text: str) -> Dict[str, Any]:
@@ -194,19 +562,88 @@ def _extract_json_object(text: str) -> Dict[str, Any]:
     except json.JSONDecodeError:
         pass
 
-    match = re.search(r"\{[\s\S]*\}", cleaned)
-    if match:
-        candidate = match.group(0)
+    # First balanced object after any leading prose; a reply cut off by
+    # max_tokens is closed off and tried as a last resort.
+    offset = 0
+    for _ in range(3):
+        scanner = JsonObjectScanner()
+        scanner.feed(cleaned[offset:])
+        if scanner.start is None:
+            break
+        candidate = scanner.object_text() or scanner.repaired_text()
         try:
             parsed = json.loads(candidate)
             if isinstance(parsed, dict):
                 return parsed
         except json.JSONDecodeError:
             pass
+        if not scanner.complete:
+            break
+        offset += scanner.start + 1
 
     raise LLMServiceError("Model response did not contain valid JSON")
 
 
+# Required keys and accepted types of each endpoint's reply
+RESPONSE_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "advice": {
+        "verdict_summary": str,
+        "risk_explanation": str,
+        "hidden_ingredient_watchouts": (list, str),
+        "safer_next_step": str,
+    },
+    "alternatives": {"alternatives": list},
+    "emergency": {
+        "severity_level": str,
+        "immediate_actions": (list, str),
+        "when_to_seek_emergency": str,
+        "follow_up_actions": (list, str),
+    },
+    "faq": {"answer": str},
+}
+
+
+def _schema_errors(parsed: Dict[str, Any], schema: Dict[str, Any]) -> List[str]:
+    errors = []
+    for key, types in schema.items():
+        if key not in parsed:
+            errors.append(f"missing {key}")
+        elif not isinstance(parsed[key], types):
+            errors.append(f"{key} has type {type(parsed[key]).__name__}")
+    return errors
+
+
+def _generate_json(kind: str, prompt: str, max_new_tokens: int, temperature: float) -> Dict[str, Any]:
+    """
+    Generate and parse a JSON reply, validated against RESPONSE_SCHEMAS[kind].
+    Unparseable or invalid replies are retried (LLM_JSON_RETRIES, default 1);
+    if every attempt is invalid, the best partial object is returned and the
+    callers' defaults fill the gaps. Raises only if nothing parsed at all.
+    """
+    attempts = 1 + max(0, _get_env_int("LLM_JSON_RETRIES", 1))
+    best: Optional[Dict[str, Any]] = None
+    best_errors: Optional[int] = None
+    last_error = "Model response did not contain valid JSON"
+    for _ in range(attempts):
+        raw = _generate(prompt, max_new_tokens=max_new_tokens, temperature=temperature)
+        try:
+            parsed = _extract_json_object(raw)
+        except LLMServiceError as exc:
+            LLM_JSON_RESULTS.inc(endpoint=kind, outcome="parse_error")
+            last_error = str(exc)
+            continue
+        errors = _schema_errors(parsed, RESPONSE_SCHEMAS[kind])
+        if not errors:
+            LLM_JSON_RESULTS.inc(endpoint=kind, outcome="ok")
+            return parsed
+        LLM_JSON_RESULTS.inc(endpoint=kind, outcome="schema_invalid")
+        if best_errors is None or len(errors) < best_errors:
+            best, best_errors = parsed, len(errors)
+    if best is not None:
+        return best
+    raise LLMServiceError(last_error)
+
+
 def _normalize_list(value: Any) -> List[str]:
     if isinstance(value, list):
         return [str(v).strip() for v in value if str(v).strip()]
@@ -219,6 +656,65 @@ def _med_disclaimer() -> str:
     return "This guidance is informational only and not a medical diagnosis. For severe symptoms, seek emergency care immediately."
 
 
+def _label_excerpt(ingredients_text: str, allergens: List[str]) -> str:
+    """Allergen-relevant clauses of the OCR text (LLM_PROMPT_TOKEN_BUDGET, 0 = raw first 1200 chars)."""
+    budget = _get_env_int("LLM_PROMPT_TOKEN_BUDGET", 120)
+    if budget <= 0:
+        return ingredients_text[:1200]
+    return compact_ingredients(ingredients_text, allergens, token_budget=budget)
+
+
+def _advice_prompt(product_name: str, detected_allergens: List[str], user_allergies: List[str],
+                   ingredients_text: str) -> str:
+    excerpt = _label_excerpt(ingredients_text, detected_allergens + user_allergies) if ingredients_text else ""
+    return (
+        "You are a food-allergy safety assistant. Return only JSON.\n"
+        "Task: Explain personal risk from scanned food.\n"
+        f"Product: {product_name}\n"
+        f"Detected allergens: {', '.join(detected_allergens)}\n"
+        f"User allergies: {', '.join(user_allergies) if user_allergies else 'not provided'}\n"
+        f"Label text (allergen-relevant parts): {excerpt or 'not available'}\n\n"
+        "Return strict JSON object with keys:\n"
+        "verdict_summary (string), risk_explanation (string), hidden_ingredient_watchouts (array of short strings), safer_next_step (string).\n"
+        "Keep risk_explanation practical and concise."
+    )
+
+
+def _alternatives_prompt(product_name: str, detected_allergens: List[str], user_allergies: List[str]) -> str:
+    return (
+        "You are a food-allergy shopping assistant. Return only JSON.\n"
+        f"Product to avoid: {product_name}\n"
+        f"Detected allergens: {', '.join(detected_allergens) if detected_allergens else 'unknown'}\n"
+        f"User allergies: {', '.join(user_allergies) if user_allergies else 'not provided'}\n\n"
+        "Return strict JSON with key alternatives as an array of 3 to 5 items.\n"
+        "Each item keys: alternative_name, why_safer, caution_note.\n"
+        "Do not claim guaranteed safety."
+    )
+
+
+def _emergency_prompt(suspected_allergen: str, symptoms: str, has_epinephrine: str, age_group: str) -> str:
+    return (
+        "You are an emergency allergy triage assistant. Return only JSON.\n"
+        f"Suspected allergen: {suspected_allergen}\n"
+        f"Symptoms: {symptoms}\n"
+        f"Epinephrine available: {has_epinephrine}\n"
+        f"Age group: {age_group}\n\n"
+        "Return strict JSON object with keys:\n"
+        "severity_level (string: mild/moderate/severe), immediate_actions (array of step strings), when_to_seek_emergency (string), follow_up_actions (array of step strings).\n"
+        "Prioritize calling emergency services for severe breathing/swelling symptoms."
+    )
+
+
+def _faq_prompt(question: str, user_allergies: List[str]) -> str:
+    return (
+        "You are a food allergy education assistant. Return only JSON.\n"
+        f"User allergies: {', '.join(user_allergies) if user_allergies else 'not provided'}\n"
+        f"Question: {question}\n\n"
+        "Return strict JSON object with keys: answer, safety_disclaimer.\n"
+        "Use concise educational language. No diagnosis. No medication dosage."
+    )
+
+
 def generate_personalized_advice(
     product_name: str,
     detected_allergens: List[str],
@@ -234,20 +730,8 @@ def generate_personalized_advice(
             "disclaimer": _med_disclaimer(),
         }
 
-    prompt = (
-        "You are a food-allergy safety assistant. Return only JSON.\n"
-        "Task: Explain personal risk from scanned food.\n"
-        f"Product: {product_name}\n"
-        f"Detected allergens: {', '.join(detected_allergens)}\n"
-        f"User allergies: {', '.join(user_allergies) if user_allergies else 'not provided'}\n"
-        f"OCR ingredients text: {ingredients_text[:1200] if ingredients_text else 'not available'}\n\n"
-        "Return strict JSON object with keys:\n"
-        "verdict_summary (string), risk_explanation (string), hidden_ingredient_watchouts (array of short strings), safer_next_step (string).\n"
-        "Keep risk_explanation practical and concise."
-    )
-
-    raw = _call_huggingface(prompt, max_new_tokens=260, temperature=0.1)
-    parsed = _extract_json_object(raw)
+    prompt = _advice_prompt(product_name, detected_allergens, user_allergies, ingredients_text)
+    parsed = _generate_json("advice", prompt, max_new_tokens=260, temperature=0.1)
 
     return {
         "verdict_summary": str(parsed.get("verdict_summary", "Potentially unsafe for your allergy profile.")).strip(),
@@ -263,18 +747,8 @@ def generate_alternatives(
     detected_allergens: List[str],
     user_allergies: List[str],
 ) -> Dict[str, Any]:
-    prompt = (
-        "You are a food-allergy shopping assistant. Return only JSON.\n"
-        f"Product to avoid: {product_name}\n"
-        f"Detected allergens: {', '.join(detected_allergens) if detected_allergens else 'unknown'}\n"
-        f"User allergies: {', '.join(user_allergies) if user_allergies else 'not provided'}\n\n"
-        "Return strict JSON with key alternatives as an array of 3 to 5 items.\n"
-        "Each item keys: alternative_name, why_safer, caution_note.\n"
-        "Do not claim guaranteed safety."
-    )
-
-    raw = _call_huggingface(prompt, max_new_tokens=300, temperature=0.3)
-    parsed = _extract_json_object(raw)
+    prompt = _alternatives_prompt(product_name, detected_allergens, user_allergies)
+    parsed = _generate_json("alternatives", prompt, max_new_tokens=300, temperature=0.3)
     items = parsed.get("alternatives", [])
 
     results = []
@@ -308,19 +782,8 @@ def generate_emergency_guidance(
     has_epinephrine: str,
     age_group: str,
 ) -> Dict[str, Any]:
-    prompt = (
-        "You are an emergency allergy triage assistant. Return only JSON.\n"
-        f"Suspected allergen: {suspected_allergen}\n"
-        f"Symptoms: {symptoms}\n"
-        f"Epinephrine available: {has_epinephrine}\n"
-        f"Age group: {age_group}\n\n"
-        "Return strict JSON object with keys:\n"
-        "severity_level (string: mild/moderate/severe), immediate_actions (array of step strings), when_to_seek_emergency (string), follow_up_actions (array of step strings).\n"
-        "Prioritize calling emergency services for severe breathing/swelling symptoms."
-    )
-
-    raw = _call_huggingface(prompt, max_new_tokens=320, temperature=0.1)
-    parsed = _extract_json_object(raw)
+    prompt = _emergency_prompt(suspected_allergen, symptoms, has_epinephrine, age_group)
+    parsed = _generate_json("emergency", prompt, max_new_tokens=320, temperature=0.1)
 
     return {
         "severity_level": str(parsed.get("severity_level", "unknown")).strip().lower(),
@@ -334,16 +797,8 @@ def generate_emergency_guidance(
 
 
 def answer_faq_question(question: str, user_allergies: List[str]) -> Dict[str, str]:
-    prompt = (
-        "You are a food allergy education assistant. Return only JSON.\n"
-        f"User allergies: {', '.join(user_allergies) if user_allergies else 'not provided'}\n"
-        f"Question: {question}\n\n"
-        "Return strict JSON object with keys: answer, safety_disclaimer.\n"
-        "Use concise educational language. No diagnosis. No medication dosage."
-    )
-
-    raw = _call_huggingface(prompt, max_new_tokens=220, temperature=0.2)
-    parsed = _extract_json_object(raw)
+    prompt = _faq_prompt(question, user_allergies)
+    parsed = _generate_json("faq", prompt, max_new_tokens=220, temperature=0.2)
 
     return {
         "answer": str(parsed.get("answer", "I could not generate an answer right now.")).strip(),
@@ -0,0 +1,188 @@
+# load_test.py
+# Drive the prediction and /llm/* endpoints on a running server and report
+# throughput, latency percentiles and status codes.
+#
+#   gunicorn -c gunicorn_conf.py wsgi:app          # or: python app.py
+#   python load_test.py --requests 500 --concurrency 16
+#   python load_test.py --endpoints predict_image --image test_img.png --requests 50
+#
+# /llm/* against the local Hugging Face stub (no network, no cost):
+#   python hf_stub_server.py --latency-ms 300 --latency-dist lognormal --rate-429 0.05
+#   HUGGINGFACE_API_BASE=http://127.0.0.1:8008/models HUGGINGFACE_API_KEY=stub python app.py
+#   python load_test.py --endpoints llm --stub-url http://127.0.0.1:8008 --concurrency 16
+#
+# LLM endpoints log in as --username (registered on first use). /llm/faq is
+# rate limited per user, so expect 429s there at high request counts.
+# Without Tesseract installed, /predict_image answers 500 and is reported as errors.
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+DEFAULT_TEXTS = [
+    "Ingredients: milk powder, sugar, wheat flour, soy lecithin",
+    "Water, tomatoes, salt, spices. May contain traces of peanuts and tree nuts.",
+    "Enriched flour (wheat flour, niacin, iron), eggs, butter (cream, salt), almonds",
+    "Rice, sunflower oil, sea salt",
+    "Sugar, cocoa butter, whole milk powder, hazelnuts, emulsifier (soy lecithin), vanilla",
+    "Chickpeas, tahini (sesame), lemon juice, garlic",
+    "Salmon, shrimp, wheat, soybeans, salt, sugar",
+]
+
+_local = threading.local()
+
+
+def _session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _call_predict(url, index, texts, verbose):
+    params = {} if verbose else {"verbose": "false"}
+    return _session().post(f"{url}/predict", params=params,
+                           json={"ingredients_text": texts[index % len(texts)]}, timeout=60)
+
+
+def _call_predict_image(url, index, image_bytes, verbose):
+    params = {} if verbose else {"verbose": "false"}
+    files = {"image": ("label.png", image_bytes, "image/png")}
+    return _session().post(f"{url}/predict_image", params=params, files=files, timeout=120)
+
+
+LLM_CALLS = {
+    "llm_advice": ("/llm/personalized_advice", lambda i: {
+        "product_name": "Choco Bar", "detected_allergens": ["milk", "hazelnut"],
+        "ingredients_text": DEFAULT_TEXTS[i % len(DEFAULT_TEXTS)]}),
+    "llm_alternatives": ("/llm/alternatives", lambda i: {
+        "product_name": "Choco Bar", "detected_allergens": ["milk"]}),
+    "llm_emergency": ("/llm/emergency_guidance", lambda i: {
+        "suspected_allergen": "peanut", "symptoms": "itchy mouth and hives", "has_epinephrine": "yes"}),
+    "llm_faq": ("/llm/faq", lambda i: {"question": f"What does 'may contain' mean on label {i}?"}),
+}
+
+
+def _login(url, username, password):
+    """Thread initializer: log this thread's session in (password hashing is slow, keep it out of the timings)."""
+    credentials = {"username": username, "password": password}
+    _session().post(f"{url}/register", json=credentials, timeout=60)
+    _session().post(f"{url}/login", json=credentials, timeout=60)
+
+
+def _call_llm(url, index, name):
+    path, body = LLM_CALLS[name]
+    return _session().post(f"{url}{path}", json=body(index), timeout=120)
+
+
+def run_endpoint(name, call, total, concurrency, initializer=None):
+    def one(i):
+        start = time.perf_counter()
+        try:
+            response = call(i)
+            status = response.status_code
+            # LLM endpoints report handled provider errors as success: false
+            try:
+                failed = response.json().get("success") is False
+            except ValueError:
+                failed = False
+        except requests.RequestException:
+            status, failed = "connection_error", True
+        return (time.perf_counter() - start) * 1000, status, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, initializer=initializer) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    latencies = np.array([ms for ms, _, _ in results])
+    errors = sum(1 for _, status, failed in results if status != 200 or failed)
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok_latencies = [ms for ms, status, failed in results if status == 200 and not failed]
+    return {
+        "endpoint": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": statuses,
+        "ok_p95_ms": float(np.percentile(ok_latencies, 95)) if ok_latencies else None,
+        "throughput_rps": total / wall if wall else 0.0,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the prediction and /llm/* endpoints.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--endpoints", default="predict,predict_image",
+                        help=f"predict, predict_image, {', '.join(LLM_CALLS)} or 'llm' for all four")
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--stub-url", help="hf_stub_server.py URL; its counters are reset and reported")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--texts", help="File with one ingredient text per line (default: built-in samples)")
+    parser.add_argument("--image", default="test_img.png")
+    parser.add_argument("--compact", action="store_true", help="Send verbose=false")
+    parser.add_argument("--out", help="Write results as JSON here")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    texts = DEFAULT_TEXTS
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    verbose = not args.compact
+
+    names = []
+    for name in [e.strip() for e in args.endpoints.split(",") if e.strip()]:
+        names.extend(LLM_CALLS if name == "llm" else [name])
+
+    calls = {}
+    for name in names:
+        if name == "predict":
+            calls[name] = lambda i: _call_predict(url, i, texts, verbose)
+        elif name == "predict_image":
+            with open(args.image, "rb") as f:
+                image_bytes = f.read()
+            calls[name] = lambda i: _call_predict_image(url, i, image_bytes, verbose)
+        elif name in LLM_CALLS:
+            calls[name] = lambda i, name=name: _call_llm(url, i, name)
+        else:
+            raise SystemExit(f"Unknown endpoint {name}; use predict, predict_image, llm or {', '.join(LLM_CALLS)}")
+
+    if args.stub_url:
+        requests.post(f"{args.stub_url.rstrip('/')}/stub/reset", timeout=10)
+
+    results = []
+    for name, call in calls.items():
+        print(f"{name}: {args.requests} requests, concurrency {args.concurrency} ...")
+        initializer = (lambda: _login(url, args.username, args.password)) if name in LLM_CALLS else None
+        results.append(run_endpoint(name, call, args.requests, args.concurrency, initializer))
+
+    print(f"\n{'endpoint':<18}{'rps':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for r in results:
+        print(f"{r['endpoint']:<18}{r['throughput_rps']:>8.1f}{r['errors']:>8}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}  {r['statuses']}")
+
+    if args.stub_url:
+        stub = requests.get(f"{args.stub_url.rstrip('/')}/stub/stats", timeout=10).json()
+        print(f"\nStub upstream calls (route:outcome): {stub['counts']}")
+        results.append({"stub": stub})
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Lightweight latency histograms and counters with Prometheus text output.
+No Flask or prometheus_client dependency; used by app.py and llm_service.py.
+
+Metrics are kept per process. With METRICS_DIR set (gunicorn_conf.py sets
+it when running several workers) every process also writes a snapshot of
+its metrics to METRICS_DIR/<pid>.json, every METRICS_FLUSH_SECONDS and on
+each scrape, and /metrics sums the snapshots of all processes: counters
+and histograms over every process that ever ran (so they stay monotonic
+across worker restarts), gauges over live processes only.
+"""
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds; covers a cached /predict (~1 ms) to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.label_names, key)), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        out = []
+        for key, row in items:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                out.append((self.name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            out.append((self.name + "_bucket", {**labels, "le": "+Inf"}, row[-1]))
+            out.append((self.name + "_sum", labels, row[-2]))
+            out.append((self.name + "_count", labels, row[-1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        """fn() -> [(name, type, help, samples)], evaluated at scrape time (e.g. cache stats)."""
+        self._collectors.append(fn)
+
+    def collect(self) -> List[Family]:
+        families = [(m.name, m.kind, m.help, m.samples()) for m in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+        return families
+
+    def render(self) -> str:
+        return _format_families(self.collect())
+
+
+def _format_families(families: Iterable[Family]) -> str:
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "allergy_request_duration_seconds", "HTTP request latency by endpoint.", ["endpoint", "method", "status"]))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "allergy_stage_duration_seconds", "Latency of pipeline stages (ocr, clean_text, predict_proba, llm ...).", ["stage"]))
+LLM_ROUTE_CALLS = REGISTRY.register(Counter(
+    "allergy_llm_route_calls_total", "LLM calls by route taken and outcome.", ["route", "outcome"]))
+LLM_JSON_RESULTS = REGISTRY.register(Counter(
+    "allergy_llm_json_results_total", "LLM replies by endpoint: ok, parse_error or schema_invalid.",
+    ["endpoint", "outcome"]))
+BARCODE_LOOKUPS = REGISTRY.register(Counter(
+    "allergy_barcode_lookups_total", "Local barcode index lookups by outcome (hit / miss).", ["outcome"]))
+NEAR_DUP_REUSE = REGISTRY.register(Counter(
+    "allergy_near_duplicate_reuse_total", "LLM advice reused from a near-duplicate text.", ["kind"]))
+IMAGE_HASH_HITS = REGISTRY.register(Counter(
+    "allergy_image_hash_hit_outcomes_total", "Image index hits whose stored OCR matched the fresh OCR or not.",
+    ["outcome"]))
+
+
+###################################
+# PER-REQUEST SPANS
+###################################
+_local = threading.local()
+
+
+def start_request() -> None:
+    """Begin collecting stage timings for Server-Timing on this thread."""
+    _local.timings = []
+
+
+def finish_request() -> List[Tuple[str, float]]:
+    """Stop collecting and return [(stage, ms)] recorded since start_request()."""
+    timings = getattr(_local, "timings", None) or []
+    _local.timings = None
+    return timings
+
+
+def observe_stage(stage: str, ms: float) -> None:
+    """Record a stage duration (ms) in the histogram and the current request, if any."""
+    STAGE_LATENCY.observe(ms / 1000.0, stage=stage)
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings.append((stage, ms))
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, (time.perf_counter() - start) * 1000)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total_ms: Optional[float] = None) -> str:
+    """Server-Timing value; repeated stages (e.g. one OCR per panel) are summed."""
+    totals: Dict[str, float] = {}
+    for stage, ms in timings:
+        totals[stage] = totals.get(stage, 0.0) + ms
+    if total_ms is not None:
+        totals["total"] = total_ms
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in totals.items())
+
+
+###################################
+# MULTI-PROCESS (gunicorn workers)
+###################################
+def _snapshot_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"{pid}.json")
+
+
+def write_snapshot(directory: Optional[str] = None, registry: Optional[Registry] = None) -> None:
+    """Write this process's metrics to <directory>/<pid>.json (atomically)."""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory, os.getpid())
+    with open(path + ".tmp", "w") as f:
+        json.dump((registry or REGISTRY).collect(), f)
+    os.replace(path + ".tmp", path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge_snapshots(directory: str) -> List[Family]:
+    """Sum the snapshots in directory sample by sample (gauges: live processes only)."""
+    families: Dict[str, list] = {}  # name -> [kind, help, {(sample, labels): value}]
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            pid = int(os.path.basename(path)[:-len(".json")])
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = None
+        for name, kind, help_text, samples in snapshot:
+            if kind == "gauge":
+                alive = _alive(pid) if alive is None else alive
+                if not alive:
+                    continue
+            family = families.setdefault(name, [kind, help_text, {}])
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(labels.items()))
+                family[2][key] = family[2].get(key, 0.0) + value
+    return [(name, kind, help_text, [(s, dict(labels), v) for (s, labels), v in values.items()])
+            for name, (kind, help_text, values) in families.items()]
+
+
+def clear_snapshots(directory: Optional[str] = None) -> None:
+    """Remove old snapshots (gunicorn master, before the workers start)."""
+    directory = directory or METRICS_DIR
+    for path in glob.glob(os.path.join(directory, "*.json*")) if directory else []:
+        os.remove(path)
+
+
+def start_snapshot_thread(directory: Optional[str] = None, interval: float = METRICS_FLUSH_SECONDS) -> None:
+    """Write this process's snapshot every interval seconds (call after fork)."""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(directory)
+            except OSError as e:
+                print(f"metrics snapshot failed: {e}")
+
+    threading.Thread(target=loop, name="metrics-snapshot", daemon=True).start()
+
+
+def render() -> str:
+    if not METRICS_DIR:
+        return REGISTRY.render()
+    write_snapshot(METRICS_DIR)
+    return _format_families(merge_snapshots(METRICS_DIR))
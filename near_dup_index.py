@@ -0,0 +1,354 @@
+"""
+MinHash / LSH index of cleaned ingredient texts, so a re-photographed
+label whose OCR differs by a few characters still finds the earlier
+product match and LLM advice that an exact-text cache would miss.
+
+    python near_dup_index.py build food.parquet      # seed with OFF products
+    python near_dup_index.py query "sugar, hazelnuts, skimmed milk powder"
+    python near_dup_index.py compact                 # fold the insert log into the snapshot
+
+Texts are shingled into character 4-grams, hashed and reduced to a
+NUM_PERM-value MinHash signature; the signature is split into BANDS bands
+and two texts become candidates when any band matches exactly. Candidates
+are verified with the signature similarity (an estimate of the shingle
+Jaccard similarity) against the threshold. A query is one signature plus
+BANDS dict lookups and one vectorized comparison, well under a millisecond.
+
+Memory is bounded by max_entries (LRU) and MAX_BUCKET_IDS per band bucket.
+Persistence is a snapshot (.npz) plus an append-only JSONL log of inserts
+and updates, so several gunicorn workers can add entries without
+rewriting the snapshot; load() replays the log on top of the snapshot.
+Once the log passes compact_log_bytes it is folded into the snapshot in a
+background thread (the compact command does the same on demand).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+INDEX_PATH = "models/near_dup_index.npz"
+
+SHINGLE_CHARS = 4
+NUM_PERM = 64
+BANDS = 16
+MAX_BUCKET_IDS = 32
+# Texts shorter than this have too few shingles for a reliable estimate
+MIN_TEXT_CHARS = 30
+# Log size at which it is folded into the snapshot
+COMPACT_LOG_BYTES = 32 * 1024 * 1024
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def log_path_for(path: str) -> str:
+    return os.path.splitext(path)[0] + ".log.jsonl"
+
+
+class NearDuplicateIndex:
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.8, max_entries: int = 50_000,
+                 num_perm: int = NUM_PERM, bands: int = BANDS, shingle_chars: int = SHINGLE_CHARS, seed: int = 1,
+                 compact_log_bytes: int = COMPACT_LOG_BYTES):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_chars = shingle_chars
+        self.seed = seed
+        self.compact_log_bytes = compact_log_bytes
+
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: ((a * x + b) mod 2^64) >> 32, a odd
+        self._a = (rng.integers(1, 2**62, num_perm, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._powers = np.array([257 ** i for i in range(shingle_chars - 1, -1, -1)], dtype=np.uint64)
+
+        # Signatures live in one matrix (grown up to max_entries) so candidates
+        # are verified in a single vectorized comparison.
+        self._sigs = np.zeros((min(1024, self.max_entries), num_perm), dtype=np.uint32)
+        self._payloads: List[Optional[Dict[str, Any]]] = [None] * len(self._sigs)
+        self._free = list(range(len(self._sigs) - 1, -1, -1))
+        self._slots: "OrderedDict[int, int]" = OrderedDict()  # id -> slot, oldest first
+        self._buckets: List[Dict[bytes, List[int]]] = [dict() for _ in range(bands)]
+        self._lock = threading.Lock()
+        self._log = None
+        self._compactor: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    ###################################
+    # SIGNATURES
+    ###################################
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature (uint32[num_perm]) of a cleaned text; None if the text is too short."""
+        if not text or len(text) < MIN_TEXT_CHARS:
+            return None
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.shingle_chars)
+        shingles = np.unique(windows @ self._powers)
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> np.uint64(32)
+        return (hashed.min(axis=1) & _MASK32).astype(np.uint32)
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    ###################################
+    # QUERY / INSERT
+    ###################################
+    def query(self, text: str, signature: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        """Best stored entry with similarity >= threshold: {"id", "similarity", "payload"} or None."""
+        sig = signature if signature is not None else self.signature(text)
+        if sig is None:
+            return None
+        with self._lock:
+            candidates = set()
+            for bucket, key in zip(self._buckets, self._band_keys(sig)):
+                ids = bucket.get(key)
+                if ids:
+                    candidates.update(ids)
+            if candidates:
+                ids = list(candidates)
+                slots = [self._slots[i] for i in ids]
+                sims = np.count_nonzero(self._sigs[slots] == sig, axis=1)
+                best = int(sims.argmax())
+                similarity = float(sims[best]) / self.num_perm
+                if similarity >= self.threshold:
+                    self._slots.move_to_end(ids[best])
+                    self.hits += 1
+                    return {"id": ids[best], "similarity": similarity, "payload": self._payloads[slots[best]]}
+            self.misses += 1
+            return None
+
+    def insert(self, text: str, payload: Dict[str, Any], signature: Optional[np.ndarray] = None) -> Optional[int]:
+        """Add a text with its JSON-serializable payload. Returns the entry id (None if too short)."""
+        sig = signature if signature is not None else self.signature(text)
+        if sig is None:
+            return None
+        with self._lock:
+            # random ids stay unique across workers sharing one log
+            entry_id = int.from_bytes(os.urandom(8), "big") >> 1
+            self._add(entry_id, sig, payload)
+            self._append_log({"op": "insert", "id": entry_id, "sig": sig.tolist(), "payload": payload})
+        return entry_id
+
+    def update(self, entry_id: int, fields: Dict[str, Any]) -> bool:
+        """Merge fields into an entry's payload (e.g. cached advice). False if it was evicted."""
+        with self._lock:
+            slot = self._slots.get(entry_id)
+            if slot is None:
+                return False
+            self._payloads[slot].update(fields)
+            self._append_log({"op": "update", "id": entry_id, "fields": fields})
+        return True
+
+    def _add(self, entry_id: int, sig: np.ndarray, payload: Dict[str, Any]) -> None:
+        if entry_id in self._slots:
+            return
+        if len(self._slots) >= self.max_entries:
+            self._evict_oldest()
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._sigs[slot] = sig
+        self._payloads[slot] = payload
+        self._slots[entry_id] = slot
+        for bucket, key in zip(self._buckets, self._band_keys(sig)):
+            ids = bucket.setdefault(key, [])
+            # Many near-identical texts add nothing; capping buckets bounds query time
+            if len(ids) < MAX_BUCKET_IDS:
+                ids.append(entry_id)
+
+    def _evict_oldest(self) -> None:
+        old_id, slot = self._slots.popitem(last=False)
+        for bucket, key in zip(self._buckets, self._band_keys(self._sigs[slot])):
+            ids = bucket.get(key)
+            if ids and old_id in ids:
+                ids.remove(old_id)
+                if not ids:
+                    del bucket[key]
+        self._payloads[slot] = None
+        self._free.append(slot)
+        self.evictions += 1
+
+    def _grow(self) -> None:
+        old = len(self._sigs)
+        new = min(self.max_entries, old * 2)
+        self._sigs = np.concatenate([self._sigs, np.zeros((new - old, self.num_perm), dtype=np.uint32)])
+        self._payloads.extend([None] * (new - old))
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._slots),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    ###################################
+    # PERSISTENCE
+    ###################################
+    def _params(self) -> Dict[str, int]:
+        return {"num_perm": self.num_perm, "bands": self.bands, "shingle_chars": self.shingle_chars,
+                "seed": self.seed}
+
+    def _append_log(self, record: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        if self._log is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._log = open(log_path_for(self.path), "a", encoding="utf-8")
+        # one write per line keeps lines from concurrent workers intact (O_APPEND)
+        self._log.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._log.flush()
+        if (self.compact_log_bytes and os.fstat(self._log.fileno()).st_size >= self.compact_log_bytes
+                and (self._compactor is None or not self._compactor.is_alive())):
+            self._compactor = threading.Thread(target=self.compact, daemon=True)
+            self._compactor.start()
+
+    def load(self) -> int:
+        """Read the snapshot and replay the log. Returns the number of entries."""
+        if not self.path:
+            return 0
+        with self._lock:
+            if os.path.exists(self.path):
+                with np.load(self.path, allow_pickle=False) as snap:
+                    params = json.loads(snap["params"].tobytes())
+                    if params == self._params():
+                        payloads = json.loads(snap["payloads"].tobytes())
+                        for entry_id, sig, payload in zip(snap["ids"].tolist(), snap["signatures"], payloads):
+                            self._add(entry_id, sig, payload)
+                    else:
+                        print(f"Ignoring {self.path}: built with {params}, expected {self._params()}")
+            log_path = log_path_for(self.path)
+            if os.path.exists(log_path):
+                with open(log_path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # torn last line after a crash
+                        if record.get("op") == "insert" and len(record["sig"]) == self.num_perm:
+                            self._add(record["id"], np.array(record["sig"], dtype=np.uint32), record["payload"])
+                        elif record.get("op") == "update" and record["id"] in self._slots:
+                            self._payloads[self._slots[record["id"]]].update(record["fields"])
+            return len(self._slots)
+
+    def save(self) -> None:
+        """Write a snapshot of the in-memory entries atomically and truncate the log."""
+        if not self.path:
+            return
+        with self._lock:
+            slots = list(self._slots.values())
+            payloads = json.dumps([self._payloads[s] for s in slots], separators=(",", ":")).encode("utf-8")
+            params = json.dumps(self._params()).encode("utf-8")
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                ids=np.array(list(self._slots), dtype=np.int64),
+                signatures=self._sigs[slots] if slots else np.empty((0, self.num_perm), dtype=np.uint32),
+                payloads=np.frombuffer(payloads, dtype=np.uint8),
+                params=np.frombuffer(params, dtype=np.uint8),
+            )
+            os.replace(tmp_path, self.path)
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            open(log_path_for(self.path), "w").close()
+
+
+    def compact(self) -> int:
+        """
+        Fold the log into the snapshot from what is on disk, so entries other
+        workers appended are kept (lines they append during the rewrite can
+        be lost, which a cache tolerates). Returns the entries written.
+        """
+        if not self.path:
+            return 0
+        fresh = NearDuplicateIndex(self.path, threshold=self.threshold, max_entries=self.max_entries,
+                                   compact_log_bytes=0, **self._params())
+        entries = fresh.load()
+        fresh.save()
+        return entries
+
+
+def _build_from_parquet(index: NearDuplicateIndex, parquet_path: str) -> int:
+    from barcode_index import normalize_code, parse_allergen_tags
+    from data_loader import iter_record_batches
+    from text_normalizer import clean_texts
+
+    columns = {"code": "code", "product_name": "product_name", "ingredients_text": "ingredients_text",
+               "allergens": "allergens_tags"}
+    added = 0
+    log_path, index.path = index.path, None  # bulk load: no per-insert log lines
+    try:
+        for batch in iter_record_batches(parquet_path, columns):
+            data = batch.to_pydict()
+            for code, name, cleaned, allergens in zip(data["code"], data["product_name"],
+                                                      clean_texts(data["ingredients_text"]), data["allergens"]):
+                payload = {"source": "off", "barcode": normalize_code(code), "product_name": name or "",
+                           "declared_allergens": parse_allergen_tags(allergens)}
+                if index.insert(cleaned, payload) is not None:
+                    added += 1
+    finally:
+        index.path = log_path
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, query or compact the near-duplicate text index.")
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--max-entries", type=int, default=200_000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Add OFF products from the Parquet dump")
+    build.add_argument("parquet", nargs="?", default="food.parquet")
+    query = sub.add_parser("query", help="Look up ingredient texts")
+    query.add_argument("texts", nargs="+")
+    sub.add_parser("compact", help="Fold the insert log into the snapshot")
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(args.index, threshold=args.threshold, max_entries=args.max_entries)
+    start = time.perf_counter()
+    loaded = index.load()
+    print(f"Loaded {loaded:,} entries in {time.perf_counter() - start:.1f}s")
+
+    if args.command == "build":
+        start = time.perf_counter()
+        added = _build_from_parquet(index, args.parquet)
+        index.save()
+        print(f"Added {added:,} texts in {time.perf_counter() - start:.1f}s; {len(index):,} entries, "
+              f"{os.path.getsize(args.index) / 1e6:.1f} MB on disk")
+    elif args.command == "compact":
+        index.save()
+        print(f"Snapshot written: {len(index):,} entries")
+    else:
+        from text_normalizer import clean_text
+
+        for text in args.texts:
+            start = time.perf_counter()
+            match = index.query(clean_text(text))
+            ms = (time.perf_counter() - start) * 1000
+            print(f"{text[:60]!r}: {match if match else 'no near-duplicate'}  ({ms:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
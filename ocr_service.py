@@ -0,0 +1,230 @@
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+pytesseract.pytesseract.tesseract_cmd = os.getenv(
+    "TESSERACT_CMD", r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+)
+
+
+class OCRQualityError(Exception):
+    """Raised when an image is rejected as unreadable before running OCR."""
+
+    def __init__(self, message: str, quality: Dict[str, Any]):
+        super().__init__(message)
+        self.quality = quality
+
+
+def _get_env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Laplacian variance below this = too blurry to read (measured on the
+# image scaled to QUALITY_CHECK_SIDE px, so it does not depend on resolution)
+OCR_MIN_SHARPNESS = _get_env_float("OCR_MIN_SHARPNESS", 40.0)
+# Grayscale standard deviation below this = washed out / too dark
+OCR_MIN_CONTRAST = _get_env_float("OCR_MIN_CONTRAST", 15.0)
+# Tesseract word confidence (0-100) below this is dropped as noise
+OCR_MIN_WORD_CONFIDENCE = _get_env_float("OCR_MIN_WORD_CONFIDENCE", 50.0)
+QUALITY_CHECK_SIDE = 800
+
+TESSERACT_CONFIG = "--oem 3 --psm 6"
+UPSCALE = 2
+
+# Denoising profiles, cheapest first. 'quality' is the original pipeline.
+OCR_PROFILES = ("fast", "balanced", "quality")
+# Deployment default; 'auto' picks a profile from the measured noise level
+OCR_DEFAULT_PROFILE = os.getenv("OCR_PROFILE", "quality").strip().lower()
+if OCR_DEFAULT_PROFILE not in OCR_PROFILES + ("auto",):
+    # Checked once here; otherwise every scan would fail on it
+    print(f"Warning: unknown OCR_PROFILE '{OCR_DEFAULT_PROFILE}' (use one of: auto, {', '.join(OCR_PROFILES)}); "
+          "using the default 'quality'.")
+    OCR_DEFAULT_PROFILE = "quality"
+# Estimated noise sigma thresholds for 'auto': below FAST -> fast, below BALANCED -> balanced
+OCR_AUTO_FAST_MAX_NOISE = _get_env_float("OCR_AUTO_FAST_MAX_NOISE", 2.5)
+OCR_AUTO_BALANCED_MAX_NOISE = _get_env_float("OCR_AUTO_BALANCED_MAX_NOISE", 6.0)
+
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
+def assess_image_quality(gray: np.ndarray) -> Dict[str, Any]:
+    """
+    Cheap readability check (a few ms): Laplacian variance for focus and
+    grayscale std-dev for contrast, on a downscaled copy.
+    """
+    h, w = gray.shape[:2]
+    scale = QUALITY_CHECK_SIDE / max(h, w)
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    sharpness = float(cv2.Laplacian(small, cv2.CV_64F).var())
+    contrast = float(small.std())
+    reasons = []
+    if sharpness < OCR_MIN_SHARPNESS:
+        reasons.append("blurry")
+    if contrast < OCR_MIN_CONTRAST:
+        reasons.append("low_contrast")
+
+    return {
+        "sharpness": round(sharpness, 2),
+        "contrast": round(contrast, 2),
+        "width": int(w),
+        "height": int(h),
+        "readable": not reasons,
+        "reasons": reasons,
+    }
+
+
+def estimate_noise(gray: np.ndarray) -> float:
+    """
+    Fast noise sigma estimate (Immerkaer 1996): the kernel cancels image
+    structure up to second order, what is left is mostly sensor noise.
+    """
+    h, w = gray.shape[:2]
+    if h < 3 or w < 3:
+        return 0.0
+    response = cv2.filter2D(gray.astype(np.float32), -1, _NOISE_KERNEL)[1:-1, 1:-1]
+    return float(np.sqrt(np.pi / 2) * np.abs(response).sum() / (6 * (w - 2) * (h - 2)))
+
+
+def resolve_profile(profile: Optional[str], gray: np.ndarray) -> Tuple[str, Optional[float]]:
+    """Map a requested profile (or 'auto' / None = deployment default) to a concrete one."""
+    profile = (profile or OCR_DEFAULT_PROFILE).strip().lower()
+    if profile in OCR_PROFILES:
+        return profile, None
+    if profile != "auto":
+        raise ValueError(f"Unknown OCR profile '{profile}'. Use one of: auto, {', '.join(OCR_PROFILES)}")
+    noise = estimate_noise(gray)
+    if noise < OCR_AUTO_FAST_MAX_NOISE:
+        return "fast", noise
+    if noise < OCR_AUTO_BALANCED_MAX_NOISE:
+        return "balanced", noise
+    return "quality", noise
+
+
+def _denoise(gray: np.ndarray, profile: str) -> np.ndarray:
+    if profile == "fast":
+        return cv2.medianBlur(gray, 3)
+    if profile == "balanced":
+        return cv2.bilateralFilter(gray, 7, 40, 7)
+    return cv2.fastNlMeansDenoising(gray, h=10)
+
+
+def preprocess_for_ocr(gray: np.ndarray, profile: str = "quality") -> np.ndarray:
+    # Step 2: Light denoise (cost depends on profile)
+    denoised = _denoise(gray, profile)
+
+    # Step 3: Adaptive threshold
+    th = cv2.adaptiveThreshold(
+        denoised, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY,
+        31, 3
+    )
+
+    # Step 4: Upscale
+    return cv2.resize(th, None, fx=UPSCALE, fy=UPSCALE, interpolation=cv2.INTER_LINEAR)
+
+
+def _words_from_data(data: Dict[str, List[Any]], min_confidence: float):
+    """Split Tesseract word rows into kept / dropped, with boxes in original-image pixels."""
+    kept, dropped = [], 0
+    for i, raw in enumerate(data["text"]):
+        word = str(raw).strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:  # conf -1 = block/line rows, not words
+            continue
+        if conf < min_confidence:
+            dropped += 1
+            continue
+        kept.append({
+            "text": word,
+            "confidence": round(conf, 1),
+            "box": [int(data[k][i]) // UPSCALE for k in ("left", "top", "width", "height")],
+            "line": (int(data["block_num"][i]), int(data["par_num"][i]), int(data["line_num"][i])),
+        })
+    return kept, dropped
+
+
+def _join_lines(words: List[Dict[str, Any]]) -> str:
+    lines, current, last = [], [], None
+    for w in words:
+        if last is not None and w["line"] != last:
+            lines.append(" ".join(current))
+            current = []
+        current.append(w["text"])
+        last = w["line"]
+    if current:
+        lines.append(" ".join(current))
+    return "\n".join(lines)
+
+
+def ocr_image_detailed(
+    image_path: str,
+    min_confidence: Optional[float] = None,
+    check_quality: bool = True,
+    profile: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    OCR with per-word confidences and boxes.
+
+    Unreadable images (blur / contrast) are rejected with OCRQualityError
+    before the expensive denoise + Tesseract pass. Words below
+    min_confidence are dropped so OCR garbage does not reach clean_text.
+    profile: 'fast' | 'balanced' | 'quality' | 'auto' (None = OCR_PROFILE).
+    """
+    if min_confidence is None:
+        min_confidence = OCR_MIN_WORD_CONFIDENCE
+
+    img = cv2.imread(image_path)
+    if img is None:
+        return {"text": "", "words": [], "mean_confidence": 0.0, "dropped_words": 0, "quality": None,
+                "profile": None, "noise_sigma": None, "preprocess_ms": 0.0, "tesseract_ms": 0.0}
+
+    # Step 1: Convert
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    quality = assess_image_quality(gray)
+    if check_quality and not quality["readable"]:
+        raise OCRQualityError(
+            "Image is too " + " and ".join(r.replace("_", " ") for r in quality["reasons"])
+            + " to read. Try a sharper, well-lit ingredient label photo.",
+            quality,
+        )
+
+    start = time.perf_counter()
+    used_profile, noise = resolve_profile(profile, gray)
+    up = preprocess_for_ocr(gray, used_profile)
+    preprocess_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    data = pytesseract.image_to_data(up, config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+    tesseract_ms = (time.perf_counter() - start) * 1000
+    words, dropped = _words_from_data(data, min_confidence)
+
+    text = _join_lines(words)
+    mean_conf = sum(w["confidence"] for w in words) / len(words) if words else 0.0
+    for w in words:
+        w.pop("line")
+    return {
+        "text": text,
+        "words": words,
+        "mean_confidence": round(mean_conf, 1),
+        "dropped_words": dropped,
+        "quality": quality,
+        "profile": used_profile,
+        "noise_sigma": None if noise is None else round(noise, 2),
+        "preprocess_ms": round(preprocess_ms, 1),
+        "tesseract_ms": round(tesseract_ms, 1),
+    }
+
+
+def ocr_image(image_path: str, profile: Optional[str] = None) -> str:
+    """Text-only OCR (high-confidence words), kept for existing callers."""
+    return ocr_image_detailed(image_path, profile=profile)["text"]
@@ -0,0 +1,440 @@
+"""
+Spelling correction for OCR text ("rnilk" -> "milk", "s0y" -> "soy"),
+applied between OCR and clean_text so the TF-IDF vocabulary and the
+rule-based allergen checks see real words.
+
+    python ocr_spelling.py build                     # -> models/ocr_spelling.idx
+    python ocr_spelling.py correct "Whey (rnilk), s0y lecithin, hazeInuts"
+
+Symmetric-delete lookup (SymSpell): every dictionary word is indexed under
+all strings obtained by deleting up to MAX_DISTANCE characters from its
+first PREFIX_LENGTH characters. A token is looked up under its own deletes
+in the same way; any word within MAX_DISTANCE edits shares at least one of
+those keys. The number of probes depends only on the token length, not on
+the dictionary size (see lookup_keys() for short tokens). Candidates are
+then scored with an edit distance in which common OCR confusions (rn/m,
+I/l, q/g, ...) cost half an edit. A token only takes a single look-alike
+fix unless it shows signs of OCR damage (a digit, a capital inside a
+lowercase word, vv, ii); the dictionary is small, so a real word missing
+from it ("custard", "lemons") must not be turned into a near one
+("mustard", "lemon").
+
+The dictionary is the classifier's TF-IDF vocabulary (frequency estimated
+from idf) plus the allergen synonyms from prompt_compactor, which win ties.
+An optional general word list (--words, e.g. /usr/share/dict/words) adds
+known words that are never corrected but are not correction targets either.
+It is built offline into one file:
+
+    header | slot keys (u64) | slot posting offsets (u32) | slot posting counts (u32)
+           | postings (u32 word ids) | word offsets (u32) | word scores (f32)
+           | word flags (u8) | word bytes
+
+The slots are an open-addressing hash table keyed by an 8-byte blake2b of
+the delete string (0 = empty). The server maps the file read-only with mmap
+and reads it through memoryviews, so nothing is parsed at startup and
+gunicorn workers share the pages.
+"""
+import argparse
+import hashlib
+import itertools
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from allergen_predictor import MODEL_PATHS
+from prompt_compactor import ALLERGEN_SYNONYMS
+
+INDEX_PATH = "models/ocr_spelling.idx"
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+MIN_TOKEN = 3
+
+# What Tesseract reads (left) for what is printed (right); costs half an edit
+OCR_CONFUSIONS = {
+    ("rn", "m"), ("m", "rn"), ("nn", "m"), ("cl", "d"), ("vv", "w"), ("ii", "u"), ("li", "h"), ("ri", "n"),
+    ("i", "l"), ("l", "i"), ("e", "c"), ("c", "e"), ("q", "g"), ("g", "q"), ("u", "v"), ("v", "u"),
+    ("n", "u"), ("u", "n"), ("h", "b"), ("b", "h"), ("f", "t"), ("t", "f"), ("o", "a"), ("a", "o"),
+}
+CONFUSION_COST = 0.5
+_CONFUSIONS_BY_END = {}
+for _seen, _meant in OCR_CONFUSIONS:
+    _CONFUSIONS_BY_END.setdefault((_seen[-1], _meant[-1]), []).append((len(_seen), len(_meant), _seen, _meant))
+# Confusions that are two plain edits (rn -> m)
+_WIDE_CONFUSIONS = [(a, b) for a, b in OCR_CONFUSIONS if len(a) != len(b)]
+# Largest weighted cost accepted by token length for a token that looks
+# misread; short tokens only take a look-alike fix
+MAX_COST = ((5, 0.5), (8, 1.0), (None, 1.5))
+# Any other token only takes one look-alike fix ("suqar" -> "sugar", not "custard" -> "mustard")
+LOOKALIKE_COST = CONFUSION_COST
+# Signs of a misread that printed words rarely have: digits, a capital inside a lowercase word (hazeInuts)
+_DAMAGE_RE = re.compile(r"\d|[a-z][A-Z]|vv|ii")
+
+# Word flags
+ALLERGEN = 1
+KNOWN_ONLY = 2  # from the general word list: stops a correction, never replaces a token
+
+_MAGIC = b"OCRSPEL1"
+_HEADER = struct.Struct("<8sIIIIII")  # magic, max_distance, prefix_length, words, slots, postings, word bytes
+
+# Digits Tesseract reads for letters, applied to tokens that start with a letter ("s0y", "a1mond")
+OCR_DIGITS = str.maketrans({"0": "o", "1": "l", "3": "e", "4": "a", "5": "s", "6": "b", "7": "t", "8": "b"})
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+# E numbers are left alone
+_CODE_RE = re.compile(r"e\d{3,4}[a-z]?")
+
+
+def _key(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def deletes(word: str, max_distance: int = MAX_DISTANCE, prefix_length: int = PREFIX_LENGTH) -> set:
+    """word[:prefix_length] and every string made by deleting up to max_distance characters from it."""
+    prefix = word[:prefix_length]
+    found = {prefix}
+    for n in range(1, min(max_distance, len(prefix) - 1) + 1):
+        for drop in itertools.combinations(range(len(prefix)), n):
+            found.add("".join(ch for i, ch in enumerate(prefix) if i not in drop))
+    return found
+
+
+def ocr_cost(seen: str, word: str, limit: float = float("inf")) -> float:
+    """
+    Edit distance (adjacent swaps count once) where OCR_CONFUSIONS,
+    including rn -> m, cost CONFUSION_COST. Stops early with inf once every
+    alignment costs more than limit.
+    """
+    inf = float("inf")
+    dist = [[inf] * (len(word) + 1) for _ in range(len(seen) + 1)]
+    dist[0] = [float(j) for j in range(len(word) + 1)]
+    for i in range(1, len(seen) + 1):
+        row = dist[i]
+        row[0] = float(i)
+        for j in range(1, len(word) + 1):
+            best = min(dist[i - 1][j] + 1, row[j - 1] + 1,
+                       dist[i - 1][j - 1] + (0 if seen[i - 1] == word[j - 1] else 1))
+            for la, lb, a, b in _CONFUSIONS_BY_END.get((seen[i - 1], word[j - 1]), ()):
+                if i >= la and j >= lb and seen[i - la:i] == a and word[j - lb:j] == b:
+                    best = min(best, dist[i - la][j - lb] + CONFUSION_COST)
+            if i > 1 and j > 1 and seen[i - 1] == word[j - 2] and seen[i - 2] == word[j - 1]:
+                best = min(best, dist[i - 2][j - 2] + 1)
+            row[j] = best
+        # A wide confusion reaches back two rows, so both must be over the limit
+        if min(row) > limit and min(dist[i - 1]) > limit:
+            return inf
+    return dist[-1][-1]
+
+
+def looks_misread(token: str) -> bool:
+    """True if the token as read (before lowercasing) shows signs of OCR damage."""
+    return _DAMAGE_RE.search(token) is not None
+
+
+def max_cost(token: str, misread: bool = False) -> float:
+    """Largest correction cost accepted for a lowercase token; misread as given by looks_misread()."""
+    for length, cost in MAX_COST:
+        if length is None or len(token) <= length:
+            return cost if misread else min(cost, LOOKALIKE_COST)
+
+
+def lookup_keys(token: str, max_distance: int = MAX_DISTANCE, prefix_length: int = PREFIX_LENGTH,
+                misread: bool = False) -> set:
+    """
+    Delete keys to probe for token. Tokens that may only take one
+    look-alike fix are probed one edit deep, plus their wide-confusion
+    rewrites ("rnilk" -> "milk") directly; short keys two deletes deep match
+    too many words in a large dictionary.
+    """
+    if max_cost(token, misread) >= 1:
+        return deletes(token, max_distance, prefix_length)
+    keys = deletes(token, 1, prefix_length)
+    for seen, meant in _WIDE_CONFUSIONS:
+        start = token.find(seen)
+        while start != -1:
+            keys.add((token[:start] + meant + token[start + len(seen):])[:prefix_length])
+            start = token.find(seen, start + 1)
+    return keys
+
+
+###################################
+# BUILD
+###################################
+def dictionary_from_vectorizer(vectorizer) -> Dict[str, float]:
+    """Single alphabetic vocabulary words -> estimated document frequency (from idf), plus allergen terms."""
+    import math
+
+    words = {}
+    for term, column in vectorizer.vocabulary_.items():
+        if " " not in term and term.isalpha() and len(term) >= MIN_TOKEN:
+            # idf = ln((1 + n) / (1 + df)) + 1, so exp(1 - idf) is df / n up to smoothing
+            words[term] = math.exp(1.0 - float(vectorizer.idf_[column]))
+    return words
+
+
+def allergen_terms() -> List[str]:
+    terms = set()
+    for allergen, synonyms in ALLERGEN_SYNONYMS.items():
+        for term in (allergen, *synonyms):
+            terms.update(w for w in term.split() if w.isalpha() and len(w) >= MIN_TOKEN)
+    return sorted(terms)
+
+
+def general_words(path: str) -> List[str]:
+    """Lowercase alphabetic words from a one-word-per-line list such as /usr/share/dict/words."""
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return sorted({w for w in (line.strip().lower() for line in f) if w.isalpha() and len(w) >= MIN_TOKEN})
+
+
+def build_index(words: Dict[str, float], allergen_words: Iterable[str], out_path: str = INDEX_PATH,
+                max_distance: int = MAX_DISTANCE, prefix_length: int = PREFIX_LENGTH,
+                known_words: Iterable[str] = ()) -> Dict[str, int]:
+    """
+    Write the symmetric-delete index for words (word -> frequency score).
+    known_words are left alone when read but never suggested. Returns counts.
+    """
+    import numpy as np
+
+    allergen_words = set(allergen_words)
+    targets = set(words) | allergen_words
+    known_only = set(known_words) - targets
+    vocab = sorted(targets | known_only)
+    postings_by_key = {}
+    for word_id, word in enumerate(vocab):
+        # A known-only word is only matched exactly, which its undeleted prefix key finds
+        for d in deletes(word, 0 if word in known_only else max_distance, prefix_length):
+            postings_by_key.setdefault(_key(d), []).append(word_id)
+
+    n_slots = 1 << max(4, (2 * len(postings_by_key) - 1).bit_length())  # load factor <= 0.5
+    slot_keys = np.zeros(n_slots, dtype=np.uint64)
+    slot_offsets = np.zeros(n_slots, dtype=np.uint32)
+    slot_counts = np.zeros(n_slots, dtype=np.uint32)
+    postings = []
+    for key, ids in postings_by_key.items():
+        slot = key & (n_slots - 1)
+        while slot_keys[slot]:
+            slot = (slot + 1) & (n_slots - 1)
+        slot_keys[slot] = key
+        slot_offsets[slot] = len(postings)
+        slot_counts[slot] = len(ids)
+        postings.extend(ids)
+
+    encoded = [w.encode("utf-8") for w in vocab]
+    word_offsets = np.zeros(len(vocab) + 1, dtype=np.uint32)
+    word_offsets[1:] = np.cumsum([len(w) for w in encoded])
+    # Allergen terms missing from the vocabulary still need a score
+    top = max(words.values(), default=1.0)
+    scores = np.array([words.get(w, 0.0 if w in known_only else top) for w in vocab], dtype=np.float32)
+    flags = np.array([ALLERGEN * (w in allergen_words) + KNOWN_ONLY * (w in known_only) for w in vocab],
+                     dtype=np.uint8)
+    blob = b"".join(encoded)
+
+    tmp_path = out_path + ".tmp"
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, max_distance, prefix_length, len(vocab), n_slots, len(postings), len(blob)))
+        f.write(b"\0" * (-f.tell() % 8))  # the u64 keys start 8-aligned
+        for array in (slot_keys, slot_offsets, slot_counts, np.array(postings, dtype=np.uint32),
+                      word_offsets, scores, flags):
+            f.write(array.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, out_path)
+    return {"words": len(vocab), "allergen_words": len(allergen_words), "known_words": len(known_only),
+            "delete_keys": len(postings_by_key),
+            "slots": n_slots, "bytes": os.path.getsize(out_path)}
+
+
+###################################
+# LOOKUP
+###################################
+class _MappedIndex:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_distance, self.prefix_length, n_words, self.n_slots, n_postings, n_bytes = \
+            _HEADER.unpack_from(self._mm)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not an OCR spelling index")
+        view = memoryview(self._mm)
+        offset = _HEADER.size + (-_HEADER.size % 8)
+
+        def take(n, fmt, size):
+            nonlocal offset
+            section = view[offset:offset + n * size].cast(fmt)
+            offset += n * size
+            return section
+
+        self.slot_keys = take(self.n_slots, "Q", 8)
+        self.slot_offsets = take(self.n_slots, "I", 4)
+        self.slot_counts = take(self.n_slots, "I", 4)
+        self.postings = take(n_postings, "I", 4)
+        self.word_offsets = take(n_words + 1, "I", 4)
+        self.scores = take(n_words, "f", 4)
+        self.flags = take(n_words, "B", 1)
+        self.words = view[offset:offset + n_bytes]
+        self.n_words = n_words
+
+    def word_length(self, word_id: int) -> int:
+        return self.word_offsets[word_id + 1] - self.word_offsets[word_id]
+
+    def word(self, word_id: int) -> str:
+        return bytes(self.words[self.word_offsets[word_id]:self.word_offsets[word_id + 1]]).decode("utf-8")
+
+    def postings_for(self, s: str):
+        key = _key(s)
+        mask = self.n_slots - 1
+        slot = key & mask
+        while True:
+            stored = self.slot_keys[slot]
+            if stored == key:
+                start = self.slot_offsets[slot]
+                return self.postings[start:start + self.slot_counts[slot]]
+            if stored == 0:
+                return ()
+            slot = (slot + 1) & mask
+
+
+class SpellingIndex:
+    """
+    Read-only corrections from an index file built by build_index(). A
+    missing file means no corrections; a rebuilt file is picked up on the
+    next call.
+    """
+
+    def __init__(self, path: str = INDEX_PATH, cache_size: int = 50_000):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = None
+        self._mtime = None
+        self._cache_size = cache_size
+        self.correct_word = lru_cache(maxsize=cache_size)(self._correct_word)
+
+    @property
+    def available(self) -> bool:
+        return self._mapped() is not None
+
+    def _mapped(self) -> Optional[_MappedIndex]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._index = _MappedIndex(self.path)
+                    self._mtime = mtime
+                    self.correct_word.cache_clear()
+        return self._index
+
+    def _correct_word(self, token: str, misread: bool = False) -> Optional[str]:
+        """
+        Best dictionary word for a lowercase token (the token itself if it is
+        known); None if nothing is close enough. misread allows more than
+        one look-alike fix (see looks_misread()).
+        """
+        index = self._mapped()
+        if index is None:
+            return None
+        limit = index.max_distance
+        allowed = max_cost(token, misread)
+        best = None
+        seen = set()
+        for d in lookup_keys(token, limit, index.prefix_length, misread):
+            for word_id in index.postings_for(d):
+                if word_id in seen:
+                    continue
+                seen.add(word_id)
+                if abs(index.word_length(word_id) - len(token)) > limit:
+                    continue
+                word = index.word(word_id)
+                if word == token:
+                    return word
+                if index.flags[word_id] & KNOWN_ONLY:
+                    continue
+                cost = ocr_cost(token, word, allowed)
+                if cost > allowed:
+                    continue
+                # Cheapest fix, then allergen terms, then the more common word
+                rank = (cost, -(index.flags[word_id] & ALLERGEN), -index.scores[word_id])
+                if best is None or rank < best[0]:
+                    best = (rank, word)
+        return best[1] if best else None
+
+    def correct_text(self, text: str) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Text with misread words replaced (lowercase) and the list of
+        {"from", "to"} corrections. Numbers, quantities ("100g") and codes
+        ("e322") are left alone, as are words with no close match.
+        """
+        if not text or self._mapped() is None:
+            return text, []
+        corrections = []
+
+        def fix(match):
+            token = match.group(0)
+            lower = token.lower()
+            if lower[0].isdigit() or _CODE_RE.fullmatch(lower):
+                return token
+            candidate = lower.translate(OCR_DIGITS)
+            if len(candidate) < MIN_TOKEN or not candidate.isalpha():
+                return token
+            word = self.correct_word(candidate, looks_misread(token))
+            if word is None or word == lower:
+                return token
+            corrections.append({"from": token, "to": word})
+            return word
+
+        return _TOKEN_RE.sub(fix, text), corrections
+
+    def stats(self) -> Dict[str, object]:
+        index = self._mapped()
+        if index is None:
+            return {"available": False, "path": self.path}
+        cache = self.correct_word.cache_info()
+        return {"available": True, "path": self.path, "bytes": os.path.getsize(self.path), "words": index.n_words,
+                "max_distance": index.max_distance, "cached_words": cache.currsize,
+                "cache_hits": cache.hits, "cache_misses": cache.misses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or try the OCR spelling-correction index.")
+    parser.add_argument("--index", default=INDEX_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build the index from the TF-IDF vocabulary and allergen synonyms")
+    build.add_argument("--vectorizer", default=MODEL_PATHS["vectorizer"])
+    build.add_argument("--words", help="General word list (one per line) whose words are never corrected")
+    correct = sub.add_parser("correct", help="Correct texts")
+    correct.add_argument("texts", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        import joblib
+
+        start = time.perf_counter()
+        words = dictionary_from_vectorizer(joblib.load(args.vectorizer))
+        known = general_words(args.words) if args.words else ()
+        stats = build_index(words, allergen_terms(), args.index, known_words=known)
+        print(f"{stats['words']:,} words ({stats['allergen_words']} allergen terms, "
+              f"{stats['known_words']:,} known only), "
+              f"{stats['delete_keys']:,} delete keys, {stats['bytes'] / 1e6:.1f} MB "
+              f"in {time.perf_counter() - start:.1f}s -> {args.index}")
+        return
+
+    index = SpellingIndex(args.index)
+    if not index.available:
+        raise SystemExit(f"No index at {args.index}; run: python ocr_spelling.py build")
+    for text in args.texts:
+        start = time.perf_counter()
+        corrected, corrections = index.correct_text(text)
+        ms = (time.perf_counter() - start) * 1000
+        print(f"{corrected}  ({ms:.2f} ms)")
+        for c in corrections:
+            print(f"  {c['from']} -> {c['to']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def model_version(paths: Iterable[str]) -> str:
+    """Cheap fingerprint of the model artifacts (path, size, mtime)."""
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path}:missing")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache for the user-independent part of a prediction,
+    keyed on hash(model_version + cleaned text). Bounded by entry count;
+    changing the model version drops every entry. put() takes the version
+    read before predicting, so a result from a model that was swapped out
+    meanwhile is not stored under the new version.
+    """
+
+    def __init__(self, max_entries: int = 4096, version: str = ""):
+        self.max_entries = max(0, max_entries)
+        self.version = version
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def _key(self, cleaned_text: str, version: str) -> str:
+        return hashlib.sha1(f"{version}\0{cleaned_text}".encode()).hexdigest()
+
+    def get(self, cleaned_text: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            key = self._key(cleaned_text, self.version)
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, cleaned_text: str, value: Dict[str, Any], version: Optional[str] = None) -> None:
+        """Store value; dropped if version (default: current) is no longer the current one."""
+        if not self.max_entries:
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                self.stale_puts += 1
+                return
+            key = self._key(cleaned_text, self.version)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def set_version(self, version: str) -> None:
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._data.clear()
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.version,
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
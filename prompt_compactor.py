@@ -0,0 +1,148 @@
+"""
+Shrinks raw label OCR text before it goes into an LLM prompt.
+
+The advice prompt only needs the parts of the label that bear on the
+user's allergens. The text is split into clauses (top-level commas,
+semicolons, full stops and line breaks; parentheses are kept together),
+and a clause is kept only if it names a detected or user allergen, one of
+its synonyms, or is an allergen statement ("contains ...", "may contain
+...", "made in a facility ..."). Kept clauses stay in label order and are
+cut to a token budget, allergen statements first. Nutrition tables and
+OCR garbage rarely match, so they drop out.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+# Label terms that indicate each allergen class (labels of the classifier)
+ALLERGEN_SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    "milk": ("milk", "dairy", "whey", "casein", "caseinate", "lactose", "lactalbumin", "butter", "buttermilk",
+             "cream", "cheese", "yogurt", "yoghurt", "ghee", "curd", "milkfat", "lactoglobulin"),
+    "egg": ("egg", "eggs", "albumin", "albumen", "ovalbumin", "lysozyme", "mayonnaise", "meringue", "ovomucoid"),
+    "peanut": ("peanut", "peanuts", "groundnut", "groundnuts", "arachis", "monkey nuts"),
+    "tree_nut": ("tree nut", "tree nuts", "nut", "nuts", "almond", "almonds", "hazelnut", "hazelnuts", "walnut",
+                 "walnuts", "cashew", "cashews", "pecan", "pecans", "pistachio", "pistachios", "brazil nut",
+                 "brazil nuts", "macadamia", "praline", "marzipan", "gianduja", "nougat"),
+    "soy": ("soy", "soya", "soybean", "soybeans", "soja", "edamame", "tofu", "miso", "tempeh", "lecithin"),
+    "wheat": ("wheat", "flour", "semolina", "durum", "spelt", "farina", "bulgur", "couscous", "kamut", "einkorn"),
+    "gluten": ("gluten", "wheat", "barley", "rye", "oat", "oats", "malt", "spelt", "triticale", "seitan"),
+    "sesame": ("sesame", "tahini", "tahina", "gomasio", "benne"),
+    "fish": ("fish", "salmon", "tuna", "cod", "anchovy", "anchovies", "sardine", "sardines", "haddock", "pollock",
+             "mackerel", "trout", "hake", "tilapia"),
+    "shellfish": ("shellfish", "crustacean", "crustaceans", "shrimp", "prawn", "prawns", "crab", "lobster",
+                  "crayfish", "mollusc", "molluscs", "mussel", "mussels", "oyster", "oysters", "clam", "clams",
+                  "scallop", "scallops", "squid"),
+    "mustard": ("mustard",),
+}
+
+# Free-text spellings of user allergies that map onto a class
+ALLERGY_ALIASES = {
+    "dairy": "milk", "lactose": "milk", "eggs": "egg", "peanuts": "peanut", "nuts": "tree_nut",
+    "tree nuts": "tree_nut", "tree nut": "tree_nut", "soya": "soy", "soybean": "soy", "crustaceans": "shellfish",
+    "seafood": "shellfish", "celiac": "gluten", "coeliac": "gluten",
+}
+
+# Allergen statements are kept even if they name no known allergen
+STATEMENT_RE = re.compile(
+    r"\b(?:may\s+contain|contains?|traces?\s+of|allergens?|allergy\s+advice|produced\s+in|processed\s+in|"
+    r"manufactured\s+in|made\s+in\s+a|packed\s+in|facility|same\s+(?:line|equipment))\b",
+    re.IGNORECASE,
+)
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SPLIT_CHARS = ",;.\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE-like count: words and punctuation marks."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def split_clauses(text: str) -> List[str]:
+    """Split label text at top-level , ; . and line breaks; "(...)" stays with its clause."""
+    clauses = []
+    depth = 0
+    current: List[str] = []
+    for i, ch in enumerate(text):
+        if ch in "([":
+            depth += 1
+        elif ch in ")]" and depth:
+            depth -= 1
+        elif ch == "\n" or (depth == 0 and ch in _SPLIT_CHARS):
+            # keep decimals such as "2.5%" together
+            if ch == "." and 0 < i < len(text) - 1 and text[i - 1].isdigit() and text[i + 1].isdigit():
+                current.append(ch)
+                continue
+            clauses.append("".join(current))
+            current = []
+            depth = 0
+            continue
+        current.append(ch)
+    clauses.append("".join(current))
+    return [" ".join(c.split()) for c in clauses if c.strip()]
+
+
+def allergen_terms(allergens: Iterable[str]) -> Tuple[str, ...]:
+    """Search terms for allergen names (class labels or free text such as 'tree nuts')."""
+    terms = set()
+    for name in allergens:
+        key = " ".join(str(name).lower().replace("_", " ").split())
+        if not key:
+            continue
+        key = ALLERGY_ALIASES.get(key, key.replace(" ", "_"))
+        terms.update(ALLERGEN_SYNONYMS.get(key, (key.replace("_", " "),)))
+    return tuple(sorted(terms))
+
+
+@lru_cache(maxsize=256)
+def _terms_regex(terms: Tuple[str, ...]) -> "re.Pattern[str]":
+    alternatives = "|".join(re.escape(t).replace(r"\ ", r"\s+") for t in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+
+def _truncate_tokens(text: str, budget: int) -> str:
+    matches = list(_TOKEN_RE.finditer(text))
+    if len(matches) <= budget:
+        return text
+    return text[:matches[budget - 1].end()] + " ..." if budget > 0 else ""
+
+
+def compact_ingredients(text: str, allergens: Iterable[str], token_budget: int = 120) -> str:
+    """
+    The allergen-relevant clauses of text, in label order, within
+    token_budget (estimated) tokens. If no clause is relevant, the start of
+    the text within the budget is returned instead.
+    """
+    if not text or not text.strip():
+        return ""
+    clauses = split_clauses(text)
+    terms = allergen_terms(allergens)
+    term_re = _terms_regex(terms) if terms else None
+
+    scored = []
+    for index, clause in enumerate(clauses):
+        statement = STATEMENT_RE.search(clause) is not None
+        mentions = term_re is not None and term_re.search(clause) is not None
+        if statement or mentions:
+            # allergen statements first, then clauses that name an allergen
+            scored.append((0 if statement and mentions else 1 if statement else 2, index, clause))
+    if not scored:
+        return _truncate_tokens(" ".join(text.split()), token_budget)
+
+    kept = []
+    used = 0
+    for _, index, clause in sorted(scored):
+        cost = estimate_tokens(clause) + 1  # separator
+        if used + cost > token_budget:
+            if not kept:  # always keep something from the best clause
+                kept.append((index, _truncate_tokens(clause, token_budget - 1)))
+            continue
+        kept.append((index, clause))
+        used += cost
+    seen = set()
+    ordered = []
+    for _, clause in sorted(kept):
+        if clause.lower() not in seen:
+            seen.add(clause.lower())
+            ordered.append(clause)
+    return "; ".join(ordered)
@@ -0,0 +1,213 @@
+"""
+Offline allergen screening for supplier catalogs (no Flask, no sessions).
+
+Streams records from CSV, JSONL or Parquet, runs the same ML + rule-based
+logic as the /predict endpoint in batches across worker processes, and
+writes results incrementally as JSONL or Parquet. Memory stays bounded:
+only `--workers x 2` batches are in flight at any time.
+
+Usage:
+    python screen_catalog.py catalog.csv results.jsonl
+    python screen_catalog.py food.parquet results.parquet --id-columns code,product_name --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from allergen_predictor import MODEL_PATHS, load_models, predict_batch
+from text_normalizer import clean_texts
+
+BATCH_SIZE = 2000
+PROGRESS_INTERVAL_SECONDS = 5
+
+_worker_models = None
+
+
+def _detect_format(path: str, explicit: str = None) -> str:
+    if explicit:
+        return explicit
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    return "csv"
+
+
+def iter_input_batches(path: str, fmt: str, columns: List[str], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of row dicts, batch_size rows at a time, without loading the whole file."""
+    if fmt == "parquet":
+        parquet = pq.ParquetFile(path)
+        present = [c for c in columns if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=present):
+            yield batch.to_pylist()
+    elif fmt == "jsonl":
+        batch = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                batch.append({c: record.get(c) for c in columns})
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        present = [c for c in columns if c in header]
+        for chunk in pd.read_csv(path, usecols=present, chunksize=batch_size, dtype=str, keep_default_na=False):
+            yield chunk.to_dict("records")
+
+
+def _init_worker(model_paths):
+    # Each worker loads the artifacts once and keeps them for every batch
+    global _worker_models
+    _worker_models = load_models(model_paths)
+
+
+def screen_batch(rows: List[Dict[str, Any]], text_column: str, id_columns: List[str]) -> List[Dict[str, Any]]:
+    model, vectorizer, allergen_list = _worker_models
+    cleaned = clean_texts(row.get(text_column) for row in rows)
+    predictions = predict_batch(cleaned, model, vectorizer, allergen_list)
+
+    out = []
+    for row, pred in zip(rows, predictions):
+        record = {c: (None if row.get(c) is None else str(row.get(c))) for c in id_columns}
+        record.update({
+            "ml_flagged_allergens": pred["ml_flagged_allergens"],
+            "rule_based_hits": pred["rule_based_hits"],
+            "strong_contains_allergens": pred["strong_contains_allergens"],
+            "advisory_allergens": pred["advisory_allergens"],
+            "combined_allergens": pred["combined_allergens"],
+            "probabilities": {p["allergen"]: round(p["probability"], 4) for p in pred["all_allergens_with_probs"]},
+        })
+        out.append(record)
+    return out
+
+
+class _JsonlWriter:
+    def __init__(self, path):
+        self.f = open(path, "w", encoding="utf-8")
+
+    def write(self, records):
+        for record in records:
+            self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.f.close()
+
+
+class _ParquetWriter:
+    """One row group per batch; the schema is fixed from the first record."""
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    @staticmethod
+    def _schema(record):
+        # Explicit types: inference would give list<null> for lists that
+        # happen to be empty throughout the first batch.
+        fields = []
+        for key, value in record.items():
+            if isinstance(value, list):
+                fields.append(pa.field(key, pa.list_(pa.string())))
+            elif isinstance(value, dict):
+                fields.append(pa.field(key, pa.struct([pa.field(k, pa.float64()) for k in value])))
+            else:
+                fields.append(pa.field(key, pa.string()))
+        return pa.schema(fields)
+
+    def write(self, records):
+        if not records:
+            return
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self._schema(records[0]))
+        self.writer.write_table(pa.Table.from_pylist(records, schema=self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _open_writer(path: str, fmt: str):
+    return _ParquetWriter(path) if fmt == "parquet" else _JsonlWriter(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen a product catalog for allergens offline.")
+    parser.add_argument("input", help="CSV, JSONL or Parquet file")
+    parser.add_argument("output", help="JSONL or Parquet output file")
+    parser.add_argument("--input-format", choices=["csv", "jsonl", "parquet"])
+    parser.add_argument("--output-format", choices=["jsonl", "parquet"])
+    parser.add_argument("--text-column", default="ingredients_text")
+    parser.add_argument("--id-columns", default="code,product_name",
+                        help="Columns copied to the output (missing ones are ignored)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many rows (0 = all)")
+    args = parser.parse_args(argv)
+
+    in_fmt = _detect_format(args.input, args.input_format)
+    out_fmt = args.output_format or ("parquet" if _detect_format(args.output) == "parquet" else "jsonl")
+    id_columns = [c.strip() for c in args.id_columns.split(",") if c.strip()]
+    columns = id_columns + [args.text_column]
+
+    batches = iter_input_batches(args.input, in_fmt, columns, args.batch_size)
+    writer = _open_writer(args.output, out_fmt)
+    max_in_flight = max(1, args.workers) * 2
+
+    rows_done, started, last_report = 0, time.perf_counter(), time.perf_counter()
+    submitted = 0
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        rate = rows_done / elapsed if elapsed else 0.0
+        label = "Done" if final else "Progress"
+        print(f"{label}: {rows_done:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(MODEL_PATHS,)) as pool:
+            pending = deque()
+            for rows in batches:
+                if args.limit and submitted >= args.limit:
+                    break
+                if args.limit:
+                    rows = rows[: args.limit - submitted]
+                submitted += len(rows)
+                pending.append(pool.submit(screen_batch, rows, args.text_column, id_columns))
+
+                # Bounded window; results are written in input order
+                while len(pending) >= max_in_flight:
+                    results = pending.popleft().result()
+                    writer.write(results)
+                    rows_done += len(results)
+                    if time.perf_counter() - last_report >= PROGRESS_INTERVAL_SECONDS:
+                        report()
+                        last_report = time.perf_counter()
+
+            while pending:
+                results = pending.popleft().result()
+                writer.write(results)
+                rows_done += len(results)
+    finally:
+        writer.close()
+
+    report(final=True)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
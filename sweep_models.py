@@ -0,0 +1,199 @@
+"""
+Hyperparameter sweep for the allergen classifier.
+
+Runs a grid of TfidfVectorizer x LogisticRegression settings in parallel on
+one fixed train/val split and writes a leaderboard (JSON + CSV) with
+macro-F1, model size on disk, load time and inference latency, so the
+serving config can be picked on accuracy *and* speed.
+
+Usage:
+    python sweep_models.py --data food.parquet --sample-size 50000
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from joblib import Parallel, delayed, dump, load
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.multiclass import OneVsRestClassifier
+
+import train_model
+
+# -------------------------
+# Grid
+# -------------------------
+VECTORIZER_GRID = {
+    "max_features": [5000, 20000, 50000],
+    "ngram_range": [(1, 1), (1, 2)],
+    "min_df": [2, 5],
+}
+CLASSIFIER_GRID = {
+    "C": [0.5, 1.0, 4.0],
+    "max_iter": [200],
+}
+LATENCY_ROWS = 200       # single-row predictions timed per config
+BATCH_SIZE = 256         # rows per batched prediction
+
+OUT_DIR = os.path.join("models", "sweep")
+
+
+def _grid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def _time_inference(vectorizer, clf, texts):
+    single = []
+    for text in texts[:LATENCY_ROWS]:
+        t0 = time.perf_counter()
+        clf.predict_proba(vectorizer.transform([text]))
+        single.append(time.perf_counter() - t0)
+
+    batch = texts[:BATCH_SIZE]
+    t0 = time.perf_counter()
+    clf.predict_proba(vectorizer.transform(batch))
+    batch_total = time.perf_counter() - t0
+
+    single_ms = np.array(single) * 1000
+    return {
+        "single_p50_ms": float(np.percentile(single_ms, 50)),
+        "single_p95_ms": float(np.percentile(single_ms, 95)),
+        "batch_per_row_ms": batch_total * 1000 / max(len(batch), 1),
+    }
+
+
+def evaluate_vectorizer_config(vec_params, clf_grid, X_train, X_val, Y_train, Y_val):
+    """Fit one vectorizer, then every classifier setting on top of it. Runs in a worker process."""
+    results = []
+    t0 = time.perf_counter()
+    vectorizer = TfidfVectorizer(**vec_params)
+    X_train_vec = vectorizer.fit_transform(X_train)
+    X_val_vec = vectorizer.transform(X_val)
+    vec_fit_s = time.perf_counter() - t0
+
+    for clf_params in clf_grid:
+        t0 = time.perf_counter()
+        # n_jobs=1: parallelism comes from the sweep itself
+        clf = OneVsRestClassifier(LogisticRegression(n_jobs=1, **clf_params))
+        clf.fit(X_train_vec, Y_train)
+        fit_s = time.perf_counter() - t0
+
+        Y_pred = clf.predict(X_val_vec)
+        macro_f1 = f1_score(Y_val, Y_pred, average="macro", zero_division=0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            vec_path = os.path.join(tmp, "vectorizer.joblib")
+            clf_path = os.path.join(tmp, "classifier.joblib")
+            dump(vectorizer, vec_path)
+            dump(clf, clf_path)
+            size_bytes = os.path.getsize(vec_path) + os.path.getsize(clf_path)
+            t0 = time.perf_counter()
+            loaded_vec, loaded_clf = load(vec_path), load(clf_path)
+            load_ms = (time.perf_counter() - t0) * 1000
+
+        results.append({
+            "max_features": vec_params["max_features"],
+            "ngram_range": f"{vec_params['ngram_range'][0]}-{vec_params['ngram_range'][1]}",
+            "min_df": vec_params["min_df"],
+            **clf_params,
+            "vocab_size": len(vectorizer.vocabulary_),
+            "macro_f1": float(macro_f1),
+            "model_size_kb": size_bytes / 1024,
+            "load_ms": load_ms,
+            "vectorizer_fit_s": vec_fit_s,
+            "classifier_fit_s": fit_s,
+            **_time_inference(loaded_vec, loaded_clf, list(X_val)),
+        })
+    return results
+
+
+def mark_pareto(rows, quality="macro_f1", cost="single_p50_ms"):
+    """Flag configs that no other config beats on both F1 and latency."""
+    for row in rows:
+        row["pareto"] = not any(
+            other[quality] >= row[quality] and other[cost] <= row[cost]
+            and (other[quality] > row[quality] or other[cost] < row[cost])
+            for other in rows
+        )
+    return rows
+
+
+def write_leaderboard(rows, out_dir, meta):
+    os.makedirs(out_dir, exist_ok=True)
+    json_path = os.path.join(out_dir, "leaderboard.json")
+    csv_path = os.path.join(out_dir, "leaderboard.csv")
+    with open(json_path, "w") as f:
+        json.dump({"meta": meta, "results": rows}, f, indent=2)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return json_path, csv_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep for the allergen classifier.")
+    parser.add_argument("--data", default=train_model.DATA_PATH)
+    parser.add_argument("--sample-size", type=int, default=train_model.SAMPLE_SIZE, help="0 = use every row")
+    parser.add_argument("--sampling", choices=["reservoir", "stratified", "none"], default="reservoir")
+    parser.add_argument("--country", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Worker processes (-1 = all cores)")
+    parser.add_argument("--out-dir", default=OUT_DIR)
+    args = parser.parse_args(argv)
+
+    print(f"Loading data from {args.data} ...")
+    df = train_model.load_data(args)
+    if "allergens" not in df.columns and "allergens_tags" in df.columns:
+        df = df.rename(columns={"allergens_tags": "allergens"})
+    df = df[df["ingredients_text"].notnull()].reset_index(drop=True)
+    X, Y, _ = train_model.prepare_rows(df)
+
+    # One fixed split for every config so scores are comparable
+    X_train, X_val, Y_train, Y_val = train_test_split(
+        X, Y, test_size=train_model.TEST_SIZE, random_state=train_model.SPLIT_SEED
+    )
+
+    vec_grid, clf_grid = _grid(VECTORIZER_GRID), _grid(CLASSIFIER_GRID)
+    print(f"Sweeping {len(vec_grid) * len(clf_grid)} configs on {len(X_train)} train / {len(X_val)} val rows...")
+    t0 = time.perf_counter()
+    per_vec = Parallel(n_jobs=args.n_jobs, verbose=5)(
+        delayed(evaluate_vectorizer_config)(vec_params, clf_grid, X_train, X_val, Y_train, Y_val)
+        for vec_params in vec_grid
+    )
+    elapsed = time.perf_counter() - t0
+
+    rows = [r for group in per_vec for r in group]
+    rows = mark_pareto(rows)
+    rows.sort(key=lambda r: (-r["macro_f1"], r["single_p50_ms"]))
+
+    meta = {
+        "data": args.data,
+        "rows_train": len(X_train),
+        "rows_val": len(X_val),
+        "split_seed": train_model.SPLIT_SEED,
+        "sample_seed": args.seed,
+        "sweep_seconds": elapsed,
+    }
+    json_path, csv_path = write_leaderboard(rows, args.out_dir, meta)
+
+    print(f"\nSweep finished in {elapsed:.1f}s. Top configs:")
+    for r in rows[:5]:
+        print(
+            f"  F1={r['macro_f1']:.4f}  p50={r['single_p50_ms']:.2f}ms  size={r['model_size_kb']:.0f}KB  "
+            f"max_features={r['max_features']} ngram={r['ngram_range']} min_df={r['min_df']} C={r['C']}"
+            f"{'  [pareto]' if r['pareto'] else ''}"
+        )
+    print(f"Leaderboard written to {json_path} and {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# synth_labels.py
+# Render ingredient lists into synthetic label images with controlled
+# distortions, keeping the ground-truth text, for OCR testing
+# (see bench_ocr_synthetic.py).
+#
+#   python synth_labels.py                                    # seed texts, all buckets
+#   python synth_labels.py --csv off_sample_10k.csv --count 40 --out synth_labels
+#   python synth_labels.py --buckets clean,blur_heavy,skew_8 --seed 7
+#
+# Writes <out>/<bucket>/<n>.png plus <out>/manifest.jsonl with one line per
+# image: {"image", "bucket", "text", "params"}.
+import argparse
+import json
+import os
+import random
+import textwrap
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+SEED_TEXTS = [
+    "Ingredients: Wheat flour, sugar, palm oil, whole milk powder, hazelnuts (5%), cocoa, emulsifier (soy lecithin), salt. May contain peanuts.",
+    "Water, tomatoes, onions, sunflower oil, salt, garlic, celery, mustard seeds, spices.",
+    "Enriched flour (wheat flour, niacin, reduced iron, thiamin mononitrate), eggs, butter (cream, salt), almonds, baking soda.",
+    "Rice, corn, sugar, salt, barley malt extract. Contains: barley. Produced in a facility that handles tree nuts.",
+    "Chickpeas, tahini (sesame), lemon juice, garlic, olive oil, sea salt, cumin.",
+    "Salmon (fish), shrimp (crustacean), wheat, soybeans, salt, sugar, rice vinegar.",
+    "Oat flakes, raisins, sunflower seeds, cashews, brazil nuts, honey, skimmed milk powder.",
+    "Potatoes, vegetable oil, salt, dextrose, cheese powder (milk), yeast extract, onion powder.",
+]
+
+# Named distortion buckets. Keys of each entry:
+#   width     rendered label width in px (resolution)
+#   font      font size in px
+#   blur      Gaussian blur radius
+#   skew      rotation in degrees
+#   light     brightness gradient strength (0 = even lighting)
+#   contrast  ink/paper contrast (1 = black on white)
+#   noise     Gaussian sensor noise sigma (0-255 scale)
+BASE_PARAMS = {"width": 1200, "font": 28, "blur": 0.0, "skew": 0.0, "light": 0.0, "contrast": 1.0, "noise": 0.0}
+BUCKETS = {
+    "clean": {},
+    "low_res": {"width": 600, "font": 14},
+    "small_font": {"font": 18},
+    "blur_light": {"blur": 1.0},
+    "blur_heavy": {"blur": 2.5},
+    "skew_3": {"skew": 3.0},
+    "skew_8": {"skew": 8.0},
+    "uneven_light": {"light": 0.6},
+    "low_contrast": {"contrast": 0.35},
+    "noisy": {"noise": 18.0},
+    "phone_photo": {"blur": 1.0, "skew": 2.0, "light": 0.4, "noise": 8.0},
+}
+
+FONT_CANDIDATES = ["DejaVuSans.ttf", "arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf"]
+
+
+def load_font(size, font_path=None):
+    for name in ([font_path] if font_path else []) + FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def load_texts(csv_path=None, count=None, seed=0, min_chars=40, max_chars=600):
+    """Ingredient texts from the training CSV (ingredients_text) or the seed list."""
+    if not csv_path:
+        texts = list(SEED_TEXTS)
+    else:
+        df = pd.read_csv(csv_path, usecols=["ingredients_text"])
+        series = df["ingredients_text"].dropna().astype(str).str.strip()
+        texts = series[(series.str.len() >= min_chars)].str.slice(0, max_chars).tolist()
+    rng = random.Random(seed)
+    rng.shuffle(texts)
+    return texts[:count] if count else texts
+
+
+def render_label(text, params, rng, font_path=None):
+    """Render text as a label and apply the bucket's distortions. Returns a grayscale PIL image."""
+    p = {**BASE_PARAMS, **params}
+    font = load_font(int(p["font"]), font_path)
+    margin = int(p["font"] * 1.5)
+    char_w = max(1.0, font.getlength("abcdefghijklmnopqrstuvwxyz") / 26)
+    lines = textwrap.wrap(text, width=max(10, int((p["width"] - 2 * margin) / char_w)))
+    line_h = int(p["font"] * 1.35)
+    height = 2 * margin + line_h * len(lines)
+
+    paper = 255
+    ink = int(round(paper - 255 * p["contrast"]))
+    img = Image.new("L", (int(p["width"]), height), color=paper)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * line_h), line, fill=ink, font=font)
+
+    if p["skew"]:
+        angle = p["skew"] * rng.choice((-1, 1))
+        img = img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=paper)
+    if p["blur"]:
+        img = img.filter(ImageFilter.GaussianBlur(p["blur"]))
+
+    arr = np.asarray(img, dtype=np.float32)
+    if p["light"]:
+        # Linear shadow across the label at a random angle
+        h, w = arr.shape
+        theta = rng.uniform(0, 2 * np.pi)
+        yy, xx = np.mgrid[0:h, 0:w]
+        ramp = (np.cos(theta) * xx / w + np.sin(theta) * yy / h)
+        ramp = (ramp - ramp.min()) / max(1e-6, ramp.max() - ramp.min())
+        arr = arr * (1 - p["light"] * ramp)
+    if p["noise"]:
+        arr = arr + np.random.default_rng(rng.randrange(2**32)).normal(0, p["noise"], arr.shape)
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8), mode="L")
+
+
+_EAN_L = ["0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011"]
+_EAN_R = ["".join("1" if b == "0" else "0" for b in code) for code in _EAN_L]
+_EAN_G = [code[::-1] for code in _EAN_R]
+_EAN_PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG", "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+
+
+def render_ean13(code, module_px=3, height=120, canvas=(1200, 900), offset=None):
+    """
+    Render a 13-digit EAN (check digit included) onto a blank label-sized
+    canvas (width, height), at offset (x, y) or centred. Grayscale PIL image,
+    for barcode detection tests.
+    """
+    digits = [int(d) for d in code]
+    bits = "101"
+    for digit, parity in zip(digits[1:7], _EAN_PARITY[digits[0]]):
+        bits += (_EAN_L if parity == "L" else _EAN_G)[digit]
+    bits += "01010" + "".join(_EAN_R[d] for d in digits[7:]) + "101"
+    bits = "0" * 11 + bits + "0" * 11  # quiet zones
+    row = np.array([0 if b == "1" else 255 for b in bits], dtype=np.uint8).repeat(module_px)
+    width, canvas_h = canvas
+    x, y = offset if offset else ((width - len(row)) // 2, (canvas_h - height) // 2)
+    arr = np.full((canvas_h, width), 255, dtype=np.uint8)
+    arr[y:y + height, x:x + len(row)] = row
+    return Image.fromarray(arr, mode="L")
+
+
+def generate(texts, buckets, out_dir, seed=0, font_path=None):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.jsonl")
+    rng = random.Random(seed)
+    written = 0
+    with open(manifest_path, "w", encoding="utf-8") as manifest:
+        for bucket in buckets:
+            bucket_dir = os.path.join(out_dir, bucket)
+            os.makedirs(bucket_dir, exist_ok=True)
+            for i, text in enumerate(texts):
+                path = os.path.join(bucket_dir, f"{i:04d}.png")
+                render_label(text, BUCKETS[bucket], rng, font_path).save(path)
+                manifest.write(json.dumps({
+                    "image": path,
+                    "bucket": bucket,
+                    "text": text,
+                    "params": {**BASE_PARAMS, **BUCKETS[bucket]},
+                }) + "\n")
+                written += 1
+    return manifest_path, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic ingredient-label images.")
+    parser.add_argument("--csv", help="Training CSV with an ingredients_text column (default: seed list)")
+    parser.add_argument("--count", type=int, default=None, help="Texts per bucket (default: all seed texts / 20 from CSV)")
+    parser.add_argument("--buckets", default=",".join(BUCKETS), help="Comma-separated bucket names")
+    parser.add_argument("--font", help="TrueType font file (default: DejaVuSans / Arial)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="synth_labels")
+    args = parser.parse_args()
+
+    buckets = [b.strip() for b in args.buckets.split(",") if b.strip()]
+    unknown = [b for b in buckets if b not in BUCKETS]
+    if unknown:
+        raise SystemExit(f"Unknown bucket(s): {', '.join(unknown)}. Available: {', '.join(BUCKETS)}")
+
+    count = args.count or (20 if args.csv else None)
+    texts = load_texts(args.csv, count, args.seed)
+    if not texts:
+        raise SystemExit("No ingredient texts to render")
+
+    manifest_path, written = generate(texts, buckets, args.out, args.seed, args.font)
+    print(f"Wrote {written} images ({len(texts)} texts x {len(buckets)} buckets); manifest: {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# test_barcode_index.py
+# Barcode normalization, building the SQLite index from Parquet, lookups
+# and detection on a rendered EAN-13.
+# Run: python test_barcode_index.py  (or pytest test_barcode_index.py)
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from barcode_index import (BarcodeIndex, build_index, detect_barcodes, normalize_code, parse_allergen_tags,
+                           valid_checksum)
+from synth_labels import render_ean13
+
+
+def test_normalize_and_checksum():
+    assert normalize_code("3017620422003") == "3017620422003"
+    assert normalize_code("0 12345 67890 5") == "0012345678905"  # UPC-A -> EAN-13
+    assert normalize_code("96385074") == "96385074"  # EAN-8 kept
+    assert normalize_code("n/a") is None
+    assert valid_checksum("3017620422003") and valid_checksum("96385074")
+    assert not valid_checksum("3017620422004")
+
+
+def test_allergen_tags():
+    assert parse_allergen_tags("en:milk,en:nuts,en:soybeans,fr:unknown") == ["milk", "soy", "tree_nut"]
+    assert parse_allergen_tags(None) == []
+
+
+def test_build_and_lookup():
+    with tempfile.TemporaryDirectory() as tmp:
+        parquet_path = os.path.join(tmp, "food.parquet")
+        pq.write_table(pa.table({
+            "code": ["3017620422003", "012345678905", "42", "", "3017620422003"],
+            "product_name": ["Spread", "Crackers", "Empty", "No code", "Spread v2"],
+            "ingredients_text": ["sugar, hazelnuts, milk", "wheat flour, salt", None, "water", "sugar, hazelnuts"],
+            "allergens_tags": [["en:milk", "en:nuts"], ["en:gluten"], [], [], ["en:nuts"]],
+        }), parquet_path)
+        index_path = os.path.join(tmp, "barcode_index.db")
+        stats = build_index(parquet_path, index_path)
+        assert stats["products"] == 2  # no code / nothing to answer from are skipped
+
+        index = BarcodeIndex(index_path)
+        product = index.lookup("3017620422003")
+        assert product["product_name"] == "Spread v2"  # last duplicate wins
+        assert product["declared_allergens"] == ["tree_nut"]
+        assert index.lookup("12345678905")["product_name"] == "Crackers"
+        assert index.lookup("42") is None
+        assert BarcodeIndex(os.path.join(tmp, "missing.db")).lookup("3017620422003") is None
+
+
+def test_detect_rendered_ean13():
+    assert detect_barcodes(np.asarray(render_ean13("4006381333931"))) == ["4006381333931"]
+    assert detect_barcodes(np.full((600, 800), 255, dtype=np.uint8)) == []
+
+
+if __name__ == "__main__":
+    test_normalize_and_checksum()
+    test_allergen_tags()
+    test_build_and_lookup()
+    test_detect_rendered_ean13()
+    print("OK")
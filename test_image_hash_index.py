@@ -0,0 +1,115 @@
+# test_image_hash_index.py
+# Perceptual hashes of rendered labels, multi-index hashing search against
+# brute force, the image index's LRU bound, file round trip and compaction,
+# and that a label with one ingredient swapped is still OCR'd in app.py.
+# Run: python test_image_hash_index.py  (or pytest test_image_hash_index.py)
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from image_hash_index import COMPACT_FACTOR, ImageHashIndex, MultiIndexHash, hamming, image_hashes
+from synth_labels import BUCKETS, SEED_TEXTS, render_label
+
+
+def test_reshot_label_matches_and_other_label_does_not():
+    rng = random.Random(0)
+    index = ImageHashIndex()
+    first = index.add(image_hashes(render_label(SEED_TEXTS[0], {}, rng)), {"text": "first"})
+    index.add(image_hashes(render_label(SEED_TEXTS[1], {}, rng)), {"text": "second"})
+
+    match = index.lookup(image_hashes(render_label(SEED_TEXTS[0], BUCKETS["phone_photo"], rng)))
+    assert match["id"] == first and match["payload"] == {"text": "first"}
+    assert index.lookup(image_hashes(render_label(SEED_TEXTS[4], {}, rng))) is None
+    assert image_hashes(np.full((600, 800), 255, dtype=np.uint8)) is None  # nothing to recognize
+
+
+def test_multi_index_hash_finds_everything_within_radius():
+    rng = random.Random(1)
+    keys = [rng.getrandbits(256) for _ in range(300)]
+    query = keys[0]
+    # Near neighbours of the query at known distances
+    for flips in (5, 20, 40, 41, 60):
+        key = query
+        for bit in rng.sample(range(256), flips):
+            key ^= 1 << bit
+        keys.append(key)
+    mih = MultiIndexHash(radius=40)
+    for i, key in enumerate(keys):
+        mih.add(key, i)
+    within = {i for i, key in enumerate(keys) if hamming(query, key) <= 40}
+    assert within <= mih.candidates(query)
+    assert len(within) == 4  # itself, 5, 20 and 40 flips
+
+    mih.remove(keys[0], 0)
+    assert 0 not in mih.candidates(query)
+
+
+def test_lru_bound_and_file_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image_hash_index.jsonl")
+        index = ImageHashIndex(path, max_entries=2)
+        hashes = [(random.Random(i).getrandbits(256), random.Random(i).getrandbits(64)) for i in range(3)]
+        for i, h in enumerate(hashes):
+            index.add(h, {"n": i})
+        assert len(index) == 2 and index.stats()["evictions"] == 1
+        assert index.lookup(hashes[0]) is None and index.lookup(hashes[2])["payload"] == {"n": 2}
+
+        reloaded = ImageHashIndex(path, max_entries=2)
+        assert reloaded.load() == 2  # the newest two lines
+        assert reloaded.lookup(hashes[1])["payload"] == {"n": 1}
+        reloaded.compact()
+        with open(path) as f:
+            assert len(f.readlines()) == 2
+
+
+def test_file_compacts_automatically():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image_hash_index.jsonl")
+        index = ImageHashIndex(path, max_entries=5)
+        for i in range(COMPACT_FACTOR * 5 * 3):
+            index.add((random.Random(i).getrandbits(256), random.Random(i).getrandbits(64)), {"n": i})
+            if index._compactor is not None:
+                index._compactor.join()
+        with open(path) as f:
+            assert len(f.readlines()) < COMPACT_FACTOR * 5
+        reloaded = ImageHashIndex(path, max_entries=5)
+        assert reloaded.load() == 5
+        assert reloaded.lookup(
+            (random.Random(29).getrandbits(256), random.Random(29).getrandbits(64)))["payload"] == {"n": 29}
+
+
+def test_single_ingredient_variant_is_ocrd():
+    import app
+
+    text = "Rice flour, sugar, palm oil, maize starch, salt, dextrose, natural flavouring, rosemary extract."
+    swapped = text.replace("dextrose", "sesame")
+    rng = random.Random(2)
+    saved = app.IMAGE_HASH_ENABLED, app.image_hash_index, app._timed_ocr
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for name, label in (("original", text), ("variant", swapped)):
+            paths[name] = os.path.join(tmp, f"{name}.png")
+            render_label(label, {}, rng).save(paths[name])
+        printed = {paths["original"]: text, paths["variant"]: swapped}
+        try:
+            app.IMAGE_HASH_ENABLED, app.image_hash_index = True, ImageHashIndex()
+            # Tesseract stand-in: the text each image was rendered from
+            app._timed_ocr = lambda path, profile=None: ({"text": printed[path], "profile": "fast",
+                                                          "rejected": None}, 1.0)
+            assert app._panel_ocr(paths["original"])[3] is None
+            ocr, _, _, match = app._panel_ocr(paths["variant"])
+            assert ocr["text"] == swapped
+            assert match is not None and match["same_text"] is False  # the hashes can't tell them apart
+        finally:
+            app.IMAGE_HASH_ENABLED, app.image_hash_index, app._timed_ocr = saved
+
+
+if __name__ == "__main__":
+    test_reshot_label_matches_and_other_label_does_not()
+    test_multi_index_hash_finds_everything_within_radius()
+    test_lru_bound_and_file_round_trip()
+    test_file_compacts_automatically()
+    test_single_ingredient_variant_is_ocrd()
+    print("OK")
@@ -1,7 +1,7 @@
 # test_img_api.py
 import requests, json, os, sys
 
-url = "http://127.0.0.1:5000/predict_from_image"
+url = "http://127.0.0.1:5000/predict_image"
 image_path = "test_img.png"   # update if different
 
 # basic checks
@@ -10,7 +10,7 @@ if not os.path.exists(image_path):
     sys.exit(1)
 
 with open(image_path, "rb") as f:
-    files = {"file": (os.path.basename(image_path), f, "image/png")}
+    files = {"image": (os.path.basename(image_path), f, "image/png")}
     try:
         r = requests.post(url, files=files, timeout=30)
     except Exception as e:
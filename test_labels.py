@@ -0,0 +1,87 @@
+# test_labels.py
+# Checks that the vectorized build_label_matrix() matches the row-by-row
+# build_labels() + MultiLabelBinarizer path it replaced in train_model.py.
+# Run: python test_labels.py  (or pytest test_labels.py)
+import os
+import random
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from train_model import (
+    KEYWORD_RULES,
+    TARGET_ALLERGENS,
+    TREE_NUT_TAGS,
+    build_label_matrix,
+    build_labels,
+    clean_series,
+    prepare_rows,
+)
+
+
+def _reference_matrix(df):
+    mlb = MultiLabelBinarizer(classes=TARGET_ALLERGENS)
+    return mlb.fit_transform(df.apply(build_labels, axis=1))
+
+
+def _random_frame(n, seed=0):
+    rng = random.Random(seed)
+    words = [k for kws in KEYWORD_RULES.values() for k in kws] + [
+        "sugar", "water", "salt", "Milk", "SOYA", "cocoa", "e322", "codfish",
+    ]
+    tags = TARGET_ALLERGENS + TREE_NUT_TAGS + ["eggs", "peanuts", "crustaceans", "milk-x"]
+    prefixes = ["en:", "fr:", "", "EN:", "en: ", "x:y:", " "]
+    rows = []
+    for _ in range(n):
+        text = ", ".join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+        tag_list = [
+            rng.choice(prefixes) + rng.choice(tags) + rng.choice(["", " ", "\xa0"])
+            for _ in range(rng.randint(0, 3))
+        ]
+        allergens = rng.choice([",".join(tag_list), " , ".join(tag_list), None])
+        rows.append({"ingredients_text": text, "allergens": allergens})
+    return pd.DataFrame(rows)
+
+
+def test_matches_reference_on_random_rows():
+    df = _random_frame(5000)
+    assert np.array_equal(build_label_matrix(df), _reference_matrix(df))
+
+
+def test_edge_cases():
+    df = pd.DataFrame({
+        "ingredients_text": ["", "Whole MILK", "peanut oil", "water", "water", "water"],
+        "allergens": [None, "", "en:nuts", "en: milk", "en:walnut ,fr:gluten", "en:milk:soy"],
+    })
+    assert np.array_equal(build_label_matrix(df), _reference_matrix(df))
+
+
+def test_missing_allergens_column():
+    df = pd.DataFrame({"ingredients_text": ["wheat flour, sesame", "rice"]})
+    expected = _reference_matrix(df.assign(allergens=None))
+    assert np.array_equal(build_label_matrix(df), expected)
+
+
+def test_prepare_rows_with_cache():
+    df = _random_frame(200, seed=1).dropna(subset=["ingredients_text"]).reset_index(drop=True)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the row cache lives under models/feature_cache
+        try:
+            clean, Y, n_new = prepare_rows(df)
+            assert n_new == len(df)
+            assert list(clean) == list(clean_series(df["ingredients_text"]))
+            assert np.array_equal(Y, build_label_matrix(df))
+            assert prepare_rows(df)[2] == 0  # second run is served from the cache
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    test_matches_reference_on_random_rows()
+    test_edge_cases()
+    test_missing_allergens_column()
+    test_prepare_rows_with_cache()
+    print("All label tests passed.")
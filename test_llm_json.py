@@ -0,0 +1,117 @@
+# test_llm_json.py
+# Incremental JSON scanning, early-stopped streams and per-endpoint reply
+# validation in llm_service.py. No network: providers and responses are fakes.
+# Run: python test_llm_json.py  (or pytest test_llm_json.py)
+import json
+
+import llm_service
+from llm_service import JsonObjectScanner, LLMProvider, LLMServiceError
+
+
+def test_scanner_completes_on_closing_brace_across_chunks():
+    reply = 'Sure! {"answer": "use {braces} and \\"quotes\\"", "list": [1, {"x": "]"}]} and then more prose'
+    scanner = JsonObjectScanner()
+    done_at = None
+    for i, ch in enumerate(reply):
+        if scanner.feed(ch):
+            done_at = i
+            break
+    assert done_at == reply.index("]}") + 1
+    assert json.loads(scanner.object_text())["list"][1] == {"x": "]"}
+
+
+def test_scanner_repairs_truncated_object():
+    scanner = JsonObjectScanner()
+    scanner.feed('{"severity_level": "mild", "immediate_actions": ["Stop eating", "Rins')
+    assert not scanner.complete
+    assert json.loads(scanner.repaired_text()) == {
+        "severity_level": "mild", "immediate_actions": ["Stop eating", "Rins"]}
+
+
+def test_extract_json_object():
+    # Stop sequence "}\n\n" consumed the final brace
+    assert llm_service._extract_json_object('{"answer": {"text": "x"}') == {"answer": {"text": "x"}}
+    # Prose with braces after the object no longer breaks the parse
+    assert llm_service._extract_json_object('```json\n{"answer": "a"}\n```\nNote: {not json}') == {"answer": "a"}
+    # A broken first object is skipped
+    assert llm_service._extract_json_object('{oops} {"answer": "b"}') == {"answer": "b"}
+    try:
+        llm_service._extract_json_object("I cannot help with that.")
+    except LLMServiceError:
+        pass
+    else:
+        raise AssertionError("expected LLMServiceError")
+
+
+class _ScriptedProvider(LLMProvider):
+    name = "scripted"
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def complete(self, prompt, max_new_tokens, temperature):
+        self.calls += 1
+        return {"text": self.replies.pop(0), "completion_tokens": None}
+
+
+def test_invalid_reply_is_retried_once():
+    provider = _ScriptedProvider(['{"answer": 42}', '{"answer": "Cross-contact means ..."}'])
+    llm_service.set_provider(provider)
+    try:
+        result = llm_service.answer_faq_question("What is cross-contact?", [])
+    finally:
+        llm_service.set_provider(None)
+    assert provider.calls == 2
+    assert result["answer"] == "Cross-contact means ..."
+
+
+def test_partial_reply_used_when_retries_exhausted():
+    provider = _ScriptedProvider(['{"severity_level": "high"}', "no json", "no json"])
+    llm_service.set_provider(provider)
+    try:
+        result = llm_service.generate_emergency_guidance("peanut", "hives", "yes", "adult")
+    finally:
+        llm_service.set_provider(None)
+    assert result["severity_level"] == "high"
+    assert provider.calls == 2
+    assert "breathing" in result["when_to_seek_emergency"]  # missing keys fall back to the defaults
+
+
+class _FakeStream:
+    headers = {"Content-Type": "text/event-stream"}
+    encoding = "utf-8"
+
+    def __init__(self, pieces):
+        self.lines = []
+        for piece in pieces:
+            self.lines += ["data: " + json.dumps({"choices": [{"delta": {"content": piece}}]}), ""]
+        self.lines.append("data: [DONE]")
+        self.read = 0
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            self.read += 1
+            yield line
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_stops_at_end_of_object():
+    response = _FakeStream(['{"answer": ', '"ok"', "}", "\n\nI hope", " this helps", "."])
+    text = llm_service._read_chat_stream(response)
+    assert json.loads(text) == {"answer": "ok"}
+    assert response.closed
+    assert response.read == 5  # the trailing prose was never read
+
+
+if __name__ == "__main__":
+    test_scanner_completes_on_closing_brace_across_chunks()
+    test_scanner_repairs_truncated_object()
+    test_extract_json_object()
+    test_invalid_reply_is_retried_once()
+    test_partial_reply_used_when_retries_exhausted()
+    test_stream_stops_at_end_of_object()
+    print("OK")
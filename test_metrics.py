@@ -0,0 +1,84 @@
+# test_metrics.py
+# Prometheus text output, Server-Timing spans and the multi-process
+# snapshot merge of metrics.py.
+# Run: python test_metrics.py  (or pytest test_metrics.py)
+import json
+import os
+import tempfile
+
+import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram("t_seconds", "test", ["stage"], buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 2.0):
+        h.observe(value, stage="ocr")
+    samples = {(name, labels.get("le")): value for name, labels, value in h.samples()}
+    assert samples[("t_seconds_bucket", "0.01")] == 1
+    assert samples[("t_seconds_bucket", "0.1")] == 3
+    assert samples[("t_seconds_bucket", "1")] == 3
+    assert samples[("t_seconds_bucket", "+Inf")] == 4
+    assert samples[("t_seconds_count", None)] == 4
+    assert abs(samples[("t_seconds_sum", None)] - 2.105) < 1e-9
+
+
+def test_render_format():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("t_calls_total", "calls", ["route"]))
+    counter.inc(route='chat "x"')
+    counter.inc(2, route="hf")
+    registry.add_collector(lambda: [("t_ratio", "gauge", "ratio", [("t_ratio", {}, 0.5)])])
+    text = registry.render()
+    assert "# TYPE t_calls_total counter" in text
+    assert 't_calls_total{route="chat \\"x\\""} 1' in text
+    assert 't_calls_total{route="hf"} 2' in text
+    assert "t_ratio 0.5" in text
+    assert text.endswith("\n")
+
+
+def test_spans_collect_per_request():
+    metrics.start_request()
+    with metrics.span("clean_text"):
+        pass
+    metrics.observe_stage("ocr", 10.0)
+    metrics.observe_stage("ocr", 5.0)
+    timings = metrics.finish_request()
+    assert [stage for stage, _ in timings] == ["clean_text", "ocr", "ocr"]
+    header = metrics.server_timing_header(timings, total_ms=20.0)
+    assert "ocr;dur=15.0" in header and header.endswith("total;dur=20.0")
+
+    # Outside a request only the histogram is updated
+    metrics.observe_stage("ocr", 1.0)
+    assert metrics.finish_request() == []
+
+
+def test_snapshots_merge_across_processes():
+    registry = metrics.Registry()
+    calls = registry.register(metrics.Counter("t_calls_total", "calls", ["route"]))
+    latency = registry.register(metrics.Histogram("t_seconds", "test", buckets=(0.1, 1.0)))
+    registry.add_collector(lambda: [("t_entries", "gauge", "entries", [("t_entries", {}, 3)])])
+    calls.inc(2, route="hf")
+    latency.observe(0.05)
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics.write_snapshot(tmp, registry)
+        # A worker that has exited: its counts stay, its gauges don't
+        dead_pid = 2 ** 22 + 12345
+        with open(os.path.join(tmp, f"{dead_pid}.json"), "w") as f:
+            json.dump([("t_calls_total", "counter", "calls", [("t_calls_total", {"route": "hf"}, 5)]),
+                       ("t_seconds", "histogram", "test", [("t_seconds_bucket", {"le": "1"}, 1),
+                                                           ("t_seconds_count", {}, 1)]),
+                       ("t_entries", "gauge", "entries", [("t_entries", {}, 7)])], f)
+        text = metrics._format_families(metrics.merge_snapshots(tmp))
+        assert 't_calls_total{route="hf"} 7' in text
+        assert 't_seconds_bucket{le="1"} 2' in text and "t_seconds_count 2" in text
+        assert "t_entries 3" in text
+        metrics.clear_snapshots(tmp)
+        assert metrics.merge_snapshots(tmp) == []
+
+
+if __name__ == "__main__":
+    test_histogram_buckets_are_cumulative()
+    test_render_format()
+    test_spans_collect_per_request()
+    test_snapshots_merge_across_processes()
+    print("OK")
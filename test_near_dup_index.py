@@ -0,0 +1,111 @@
+# test_near_dup_index.py
+# MinHash near-duplicate lookups: OCR-style typos still match, unrelated
+# texts don't, the LRU bound holds, the snapshot + log round-trips and the
+# log is compacted; a near-duplicate that adds an allergen is predicted fresh
+# and LLM advice is only reused for the same product.
+# Run: python test_near_dup_index.py  (or pytest test_near_dup_index.py)
+import os
+import tempfile
+
+from near_dup_index import NearDuplicateIndex, log_path_for
+
+LABEL = ("wheat flour, sugar, palm oil, whole milk powder, hazelnuts 5%, cocoa, "
+         "emulsifier soy lecithin, salt, may contain peanuts")
+OCR_LABEL = ("wheat fiour, sugar, palm oil, whole milk powder, hazeInuts 5%, cocoa, "
+             "emulsifier soy lecithin, salt, may contain peanuts")
+OTHER = "water, tomatoes, onions, sunflower oil, salt, garlic, celery, mustard seeds, spices"
+
+
+def test_near_duplicate_hit_and_miss():
+    index = NearDuplicateIndex(threshold=0.8)
+    entry_id = index.insert(LABEL, {"product_name": "Spread"})
+    match = index.query(OCR_LABEL)
+    assert match["id"] == entry_id and match["payload"]["product_name"] == "Spread"
+    assert 0.8 <= match["similarity"] < 1.0
+    assert index.query(OTHER) is None
+    assert index.insert("milk, salt", {}) is None  # too short to fingerprint
+    stats = index.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_lru_bound():
+    index = NearDuplicateIndex(max_entries=2)
+    first = index.insert(LABEL, {"n": 1})
+    index.insert(OTHER, {"n": 2})
+    index.query(LABEL)  # refresh LABEL, so OTHER is the oldest
+    index.insert("rice, corn, sugar, salt, barley malt extract, contains barley", {"n": 3})
+    assert len(index) == 2 and index.stats()["evictions"] == 1
+    assert index.query(OTHER) is None
+    assert index.query(LABEL)["id"] == first
+
+
+def test_snapshot_and_log_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "near_dup_index.npz")
+        index = NearDuplicateIndex(path)
+        first = index.insert(LABEL, {"source": "off", "barcode": "3017620422003"})
+        index.save()
+        assert os.path.getsize(log_path_for(path)) == 0
+
+        # after the snapshot: one insert and one update, only in the log
+        second = index.insert(OTHER, {"source": "history"})
+        index.update(first, {"advice": {"milk|milk": {"summary": "avoid"}}})
+
+        reloaded = NearDuplicateIndex(path)
+        assert reloaded.load() == 2
+        assert reloaded.query(OCR_LABEL)["payload"] == {
+            "source": "off", "barcode": "3017620422003", "advice": {"milk|milk": {"summary": "avoid"}}}
+        assert reloaded.query(OTHER)["id"] == second
+
+        # a different parameterization ignores the snapshot instead of misreading it
+        assert NearDuplicateIndex(path, num_perm=32, bands=8).load() == 0
+
+
+def test_log_compacts_automatically():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "near_dup_index.npz")
+        index = NearDuplicateIndex(path, compact_log_bytes=4096)
+        for i in range(40):
+            index.insert(f"{OTHER}, batch {i:03d} {'x' * i}", {"n": i})
+            if index._compactor is not None:
+                index._compactor.join()
+        assert os.path.getsize(log_path_for(path)) < 4096
+        assert NearDuplicateIndex(path).load() == 40
+
+
+def test_added_ingredient_is_not_hidden():
+    import app
+
+    base = "rice flour, sugar, palm oil, corn starch, salt, natural flavouring, raising agent sodium bicarbonate"
+    app.near_dup_index, app.NEAR_DUP_ENABLED = NearDuplicateIndex(), True
+    app.near_dup_index.insert(app.clean_text(base), {"source": "off", "product_name": "Rice crackers"})
+    app.full_prediction_pipeline(base)
+    result = app.full_prediction_pipeline(base + ", whey powder")
+    assert result["near_duplicate"]["product_name"] == "Rice crackers"
+    assert "milk" in result["combined_allergens"]
+
+
+def test_advice_is_reused_only_for_the_same_product():
+    import app
+
+    calls = []
+    app.near_dup_index, app.NEAR_DUP_ENABLED = NearDuplicateIndex(), True
+    generate, app.generate_personalized_advice = app.generate_personalized_advice, \
+        lambda **kwargs: calls.append(kwargs["product_name"]) or {"summary": f"About {kwargs['product_name']}"}
+    try:
+        first = app.personalized_advice("Spread", ["milk"], ["milk"], LABEL)
+        assert app.personalized_advice(" spread ", ["milk"], ["milk"], OCR_LABEL) == first
+        other = app.personalized_advice("Wafers", ["milk"], ["milk"], OCR_LABEL)
+    finally:
+        app.generate_personalized_advice = generate
+    assert calls == ["Spread", "Wafers"] and other == {"summary": "About Wafers"}
+
+
+if __name__ == "__main__":
+    test_near_duplicate_hit_and_miss()
+    test_lru_bound()
+    test_snapshot_and_log_round_trip()
+    test_log_compacts_automatically()
+    test_added_ingredient_is_not_hidden()
+    test_advice_is_reused_only_for_the_same_product()
+    print("OK")
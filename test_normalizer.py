@@ -0,0 +1,63 @@
+# test_normalizer.py
+# Training (train_model.py) and serving (app.py) must feed the vectorizer
+# identical tokens. Run: python test_normalizer.py  (or pytest test_normalizer.py)
+import random
+import re
+
+import joblib
+
+import train_model
+from text_normalizer import clean_text, clean_texts
+
+SAMPLES = [
+    "Ingredients: Milk powder, sugar, WHEAT flour (gluten), soy lecithin.",
+    "May contain traces of peanuts & tree nuts. 2.5% cocoa",
+    "Wasser, Zucker, Weizenmehl, Haselnüsse 13%, E322",
+    "  tabs\tand\nnewlines\xa0and unicode  spaces  ",
+    "ÉMULSIFIANT: lécithine de SOJA; arôme",
+    "İstanbul ΣΟΥΣΑΜΙ",
+    "",
+]
+
+
+def _regex_reference(text):
+    # The cleaning train_model.py used before text_normalizer existed
+    if not isinstance(text, str):
+        return ""
+    s = text.lower()
+    s = re.sub(r"[^a-z0-9,;()\-/%\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+def _random_texts(n, seed=0):
+    rng = random.Random(seed)
+    alphabet = "abcXYZ019 ,;.()-/%&:!éüßΣİ\t\n\xa0 \x1f*'\"_"
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(n)]
+
+
+def test_matches_training_regex():
+    for text in SAMPLES + _random_texts(3000):
+        assert clean_text(text) == _regex_reference(text), repr(text)
+
+
+def test_batched_matches_single():
+    texts = SAMPLES + _random_texts(500) + [None, 3.5, "has\x00nul"]
+    assert clean_texts(texts) == [clean_text(t) for t in texts]
+
+
+def test_training_and_serving_tokens_match():
+    from app import clean_text as serving_clean_text
+    assert serving_clean_text is train_model.clean_text
+
+    analyzer = joblib.load("models/tfidf_vectorizer.joblib").build_analyzer()
+    trained = train_model.clean_series(__import__("pandas").Series(SAMPLES))
+    for raw, train_clean in zip(SAMPLES, trained):
+        assert analyzer(serving_clean_text(raw)) == analyzer(train_clean)
+
+
+if __name__ == "__main__":
+    test_matches_training_regex()
+    test_batched_matches_single()
+    test_training_and_serving_tokens_match()
+    print("All normalizer tests passed.")
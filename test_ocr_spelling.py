@@ -0,0 +1,59 @@
+# test_ocr_spelling.py
+# Building the symmetric-delete index and correcting OCR misreadings
+# without touching real words, numbers or E numbers.
+# Run: python test_ocr_spelling.py  (or pytest test_ocr_spelling.py)
+import os
+import tempfile
+
+from ocr_spelling import SpellingIndex, allergen_terms, build_index, ocr_cost
+
+WORDS = {"sugar": 0.5, "salt": 0.4, "flour": 0.3, "lecithin": 0.1, "powder": 0.2, "whole": 0.2, "soup": 0.05}
+
+
+def _index(tmp, known_words=()):
+    path = os.path.join(tmp, "ocr_spelling.idx")
+    stats = build_index(WORDS, allergen_terms(), path, known_words=known_words)
+    assert stats["words"] > len(WORDS) and stats["allergen_words"] == len(allergen_terms())
+    return SpellingIndex(path)
+
+
+def test_ocr_cost():
+    assert ocr_cost("rnilk", "milk") == 0.5
+    assert ocr_cost("hazeinuts", "hazelnuts") == 0.5
+    assert ocr_cost("silk", "milk") == 1.0
+    assert ocr_cost("silk", "sesame", limit=1.0) == float("inf")
+
+
+def test_corrects_misreadings():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _index(tmp)
+        text, corrections = index.correct_text("Whoie rnilk powder, s0y lecithin, hazeInuts, suqar, egq (12%)")
+        assert text == "whole milk powder, soy lecithin, hazelnuts, sugar, egg (12%)"
+        assert {"from": "rnilk", "to": "milk"} in corrections and len(corrections) == 6
+
+
+def test_leaves_real_words_and_codes():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _index(tmp)
+        text = "Silk, soap, custard, lemons, lobsters, 100g, E322, 2252kJ, salt"
+        assert index.correct_text(text) == (text, [])
+        # A plain edit is only taken on a token that looks misread
+        assert index.correct_text("s0ybeen, soybeen")[0] == "soybean, soybeen"
+        assert SpellingIndex(os.path.join(tmp, "missing.idx")).correct_text("rnilk") == ("rnilk", [])
+
+
+def test_known_words_are_not_corrected():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert _index(tmp).correct_text("molt")[0] == "malt"
+        index = _index(tmp, known_words=["molt", "milk"])
+        assert index.correct_text("molt, rnilk") == ("molt, milk", [{"from": "rnilk", "to": "milk"}])
+        # Known-only words are never suggested
+        assert index.correct_text("rnolt")[0] == "rnolt"
+
+
+if __name__ == "__main__":
+    test_ocr_cost()
+    test_corrects_misreadings()
+    test_leaves_real_words_and_codes()
+    test_known_words_are_not_corrected()
+    print("OK")
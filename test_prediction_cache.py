@@ -0,0 +1,32 @@
+# test_prediction_cache.py
+# LRU bound, invalidation on a new model version, and results computed
+# with a model that was swapped out meanwhile not being stored.
+# Run: python test_prediction_cache.py  (or pytest test_prediction_cache.py)
+from prediction_cache import PredictionCache
+
+
+def test_lru_and_version_change():
+    cache = PredictionCache(max_entries=2, version="v1")
+    cache.put("milk", {"n": 1})
+    cache.put("soy", {"n": 2})
+    cache.get("milk")
+    cache.put("egg", {"n": 3})
+    assert cache.get("soy") is None and cache.get("milk") == {"n": 1}
+    cache.set_version("v2")
+    assert cache.get("milk") is None and cache.stats()["invalidations"] == 1
+
+
+def test_put_from_old_version_is_dropped():
+    cache = PredictionCache(version="v1")
+    version = cache.version  # read before predicting
+    cache.set_version("v2")  # model reloaded meanwhile
+    cache.put("milk", {"model": "old"}, version)
+    assert cache.get("milk") is None and cache.stats()["stale_puts"] == 1
+    cache.put("milk", {"model": "new"}, cache.version)
+    assert cache.get("milk") == {"model": "new"}
+
+
+if __name__ == "__main__":
+    test_lru_and_version_change()
+    test_put_from_old_version_is_dropped()
+    print("OK")
@@ -0,0 +1,45 @@
+# test_prompt_compactor.py
+# Clause splitting and allergen-relevant excerpts for the advice prompt.
+# Run: python test_prompt_compactor.py  (or pytest test_prompt_compactor.py)
+from prompt_compactor import allergen_terms, compact_ingredients, estimate_tokens, split_clauses
+
+LABEL = (
+    "Energy 2252kJ Fat 30.9g of which saturates 10.6g Protein 6.3g\n"
+    "Ingredients: sugar, palm oil, hazelnuts (13%), skimmed milk powder (8.7%), cocoa, "
+    "emulsifier: lecithins (soya), vanillin. May contain peanuts. Best before: see lid."
+)
+
+
+def test_split_keeps_parentheses_and_decimals():
+    assert split_clauses("Enriched flour (wheat flour, niacin), eggs; salt 2.5%. Contains: milk") == [
+        "Enriched flour (wheat flour, niacin)", "eggs", "salt 2.5%", "Contains: milk"]
+
+
+def test_terms_from_labels_and_free_text():
+    terms = allergen_terms(["tree nuts", "dairy", "Celery"])
+    assert "hazelnut" in terms and "whey" in terms and "celery" in terms
+
+
+def test_keeps_only_relevant_clauses_in_label_order():
+    excerpt = compact_ingredients(LABEL, ["milk", "tree_nut"])
+    assert excerpt == "hazelnuts (13%); skimmed milk powder (8.7%); May contain peanuts"
+
+
+def test_budget_prefers_allergen_statements():
+    excerpt = compact_ingredients(LABEL, ["milk", "tree_nut"], token_budget=5)
+    assert excerpt == "May contain peanuts"
+    assert estimate_tokens(compact_ingredients(LABEL * 20, ["milk"], token_budget=30)) <= 30
+
+
+def test_falls_back_to_start_of_text():
+    assert compact_ingredients("Rice, salt, water", ["fish"]) == "Rice, salt, water"
+    assert compact_ingredients("", ["milk"]) == ""
+
+
+if __name__ == "__main__":
+    test_split_keeps_parentheses_and_decimals()
+    test_terms_from_labels_and_free_text()
+    test_keeps_only_relevant_clauses_in_label_order()
+    test_budget_prefers_allergen_statements()
+    test_falls_back_to_start_of_text()
+    print("OK")
@@ -0,0 +1,58 @@
+# test_scan_jobs.py
+# Scan job callbacks: only allowlisted hosts with public addresses are
+# called, and the payload is signed with SCAN_CALLBACK_SECRET.
+# Run: python test_scan_jobs.py  (or pytest test_scan_jobs.py)
+import hashlib
+import hmac
+import json
+
+import app
+
+PUBLIC_HOST = "93.184.216.34"
+
+
+def _configure(hosts, secret):
+    saved = app.SCAN_CALLBACK_HOSTS, app.SCAN_CALLBACK_SECRET
+    app.SCAN_CALLBACK_HOSTS, app.SCAN_CALLBACK_SECRET = set(hosts), secret
+    return saved
+
+
+def test_callback_url_checks():
+    saved = _configure([], "")
+    try:
+        assert "not enabled" in app._callback_url_error(f"https://{PUBLIC_HOST}/hook")
+        _configure([PUBLIC_HOST, "localhost", "10.0.0.5", "169.254.169.254"], "s3cret")
+        assert app._callback_url_error(f"https://{PUBLIC_HOST}/hook") is None
+        assert "not allowed" in app._callback_url_error("https://evil.example/hook")
+        assert "http(s)" in app._callback_url_error(f"ftp://{PUBLIC_HOST}/hook")
+        for internal in ("localhost", "10.0.0.5", "169.254.169.254"):
+            assert "non-public" in app._callback_url_error(f"http://{internal}/hook")
+    finally:
+        app.SCAN_CALLBACK_HOSTS, app.SCAN_CALLBACK_SECRET = saved
+
+
+def test_callback_is_signed():
+    sent = []
+    saved, post = _configure([PUBLIC_HOST], "s3cret"), app.requests.post
+    app.requests.post = lambda url, **kwargs: sent.append((url, kwargs))
+    try:
+        body = {"job_id": "abc", "status": "done", "result": {"combined_allergens": ["milk"]}}
+        app._send_scan_job_callback("abc", f"https://{PUBLIC_HOST}/hook", body)
+        app._send_scan_job_callback("abc", "http://localhost/hook", body)  # skipped
+    finally:
+        app.requests.post = post
+        app.SCAN_CALLBACK_HOSTS, app.SCAN_CALLBACK_SECRET = saved
+
+    assert len(sent) == 1
+    url, kwargs = sent[0]
+    headers = kwargs["headers"]
+    expected = hmac.new(b"s3cret", headers["X-Scan-Timestamp"].encode() + b"." + kwargs["data"],
+                        hashlib.sha256).hexdigest()
+    assert headers["X-Scan-Signature"] == f"sha256={expected}"
+    assert json.loads(kwargs["data"]) == body and kwargs["allow_redirects"] is False
+
+
+if __name__ == "__main__":
+    test_callback_url_checks()
+    test_callback_is_signed()
+    print("OK")
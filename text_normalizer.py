@@ -0,0 +1,78 @@
+"""
+Ingredient text normalization shared by train_model.py and app.py.
+
+Training and serving must produce identical text, otherwise the TF-IDF
+features drift. Equivalent to:
+
+    s = re.sub(r"[^a-z0-9,;()\\-/%\\s]", " ", text.lower())
+    s = re.sub(r"\\s+", " ", s).strip()
+
+but done with one translate() pass and split()/join(). Pure-ASCII input
+(the common case) goes through bytes.translate(), which is cheaper still.
+"""
+from typing import Iterable, List
+
+ALLOWED_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789,;()-/%"
+
+# Never produced by lower()/translate(), so it can delimit texts in a batch.
+_BATCH_SEP = "\x00"
+
+
+class _TranslateTable(dict):
+    """Lazily filled str.translate() table: allowed chars and whitespace map to themselves, everything else to a space."""
+
+    def __missing__(self, codepoint):
+        ch = chr(codepoint)
+        value = codepoint if (ch in ALLOWED_CHARS or ch.isspace()) else " "
+        self[codepoint] = value
+        return value
+
+
+_TABLE = _TranslateTable()
+_BATCH_TABLE = _TranslateTable({ord(_BATCH_SEP): ord(_BATCH_SEP)})
+
+# bytes.translate() equivalents for the ASCII fast path
+_ASCII_TABLE = bytes(c if isinstance(_TABLE[c], int) else 32 for c in range(256))
+_ASCII_BATCH_TABLE = bytes(c if isinstance(_BATCH_TABLE[c], int) else 32 for c in range(256))
+
+
+def clean_text(text: str) -> str:
+    """Lower, replace disallowed chars with spaces, collapse whitespace."""
+    if not isinstance(text, str):
+        return ""
+    s = text.lower()
+    if s.isascii():
+        s = s.encode("ascii").translate(_ASCII_TABLE).decode("ascii")
+    else:
+        s = s.translate(_TABLE)
+    return " ".join(s.split())
+
+
+def _clean_joined(items: List[str], ascii_only: bool) -> List[str]:
+    joined = _BATCH_SEP.join(items)
+    # A NUL inside an input would break the split; fall back in that case.
+    if joined.count(_BATCH_SEP) != len(items) - 1:
+        return [clean_text(t) for t in items]
+    joined = joined.lower()
+    if ascii_only:
+        joined = joined.encode("ascii").translate(_ASCII_BATCH_TABLE).decode("ascii")
+    else:
+        joined = joined.translate(_BATCH_TABLE)
+    return [" ".join(p.split()) for p in joined.split(_BATCH_SEP)]
+
+
+def clean_texts(texts: Iterable) -> List[str]:
+    """
+    Batched clean_text(): lowers and translates the whole batch in one call
+    (ASCII and non-ASCII texts as two joined strings), then splits it back.
+    Non-string items become "".
+    """
+    items = [t if isinstance(t, str) else "" for t in texts]
+    out = [""] * len(items)
+    ascii_idx = [i for i, t in enumerate(items) if t.isascii()]
+    other_idx = [i for i, t in enumerate(items) if not t.isascii()]
+    for idx, ascii_only in ((ascii_idx, True), (other_idx, False)):
+        if idx:
+            for i, cleaned in zip(idx, _clean_joined([items[i] for i in idx], ascii_only)):
+                out[i] = cleaned
+    return out
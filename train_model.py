@@ -1,21 +1,37 @@
 import os
 import json
 import re
+import argparse
 
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import MultiLabelBinarizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
-from joblib import dump
+from joblib import dump, load
+
+import feature_cache
+import text_normalizer
+from data_loader import PARQUET_PATH, load_training_frame
+from text_normalizer import clean_text, clean_texts
 
 # -------------------------
 # Config
 # -------------------------
-DATA_PATH = "off_sample_10k.csv"   # input file you created earlier
+DATA_PATH = PARQUET_PATH           # OFF Parquet dump (a legacy .csv also works)
+SAMPLE_SIZE = 10000
 MODELS_DIR = "models"
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
+VECTORIZER_CONFIG = {
+    "max_features": 20000,
+    "ngram_range": (1, 2),  # unigrams + bigrams
+    "min_df": 2,
+}
 os.makedirs(MODELS_DIR, exist_ok=True)
 
 # Define the allergen categories we care about
@@ -33,21 +49,29 @@ TARGET_ALLERGENS = [
     "mustard",
 ]
 
+# OFF tags that all count as tree_nut (rough grouping)
+TREE_NUT_TAGS = ["nuts", "hazelnut", "walnut", "almond", "pecan", "cashew"]
+
+# Ingredient keywords used when the allergens field is missing/empty
+KEYWORD_RULES = {
+    "milk": ["milk", "lactose", "casein", "whey"],
+    "egg": ["egg", "albumen", "albumin"],
+    "peanut": ["peanut", "groundnut"],
+    "tree_nut": ["almond", "hazelnut", "walnut", "cashew", "pistachio", "pecan", "macadamia"],
+    "soy": ["soy", "soya", "soybean"],
+    "wheat": ["wheat", "durum", "semolina"],
+    "gluten": ["gluten"],
+    "sesame": ["sesame"],
+    "fish": ["fish", "salmon", "tuna", "cod", "anchovy"],
+    "shellfish": ["shrimp", "prawn", "crab", "lobster", "mussel", "clam"],
+    "mustard": ["mustard"],
+}
+
 
 # -------------------------
 # Helper functions
 # -------------------------
 
-def clean_text(text: str) -> str:
-    """Simple cleaning: lower, remove weird chars, normalize spaces."""
-    if not isinstance(text, str):
-        return ""
-    s = text.lower()
-    s = re.sub(r"[^a-z0-9,;()\-/%\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
 def parse_allergens_field(raw_allergens: str):
     """
     OFF 'allergens_tags' field often looks like:
@@ -67,7 +91,7 @@ def parse_allergens_field(raw_allergens: str):
             token = token.split(":")[-1]
 
         # Map nuts → tree_nut (rough grouping)
-        if token in ["nuts", "hazelnut", "walnut", "almond", "pecan", "cashew"]:
+        if token in TREE_NUT_TAGS:
             labels.add("tree_nut")
         elif token in TARGET_ALLERGENS:
             labels.add(token)
@@ -83,29 +107,9 @@ def keyword_fallback(text: str):
     text = text.lower()
     labels = set()
 
-    # simple keyword rules
-    if any(k in text for k in ["milk", "lactose", "casein", "whey"]):
-        labels.add("milk")
-    if any(k in text for k in ["egg", "albumen", "albumin"]):
-        labels.add("egg")
-    if "peanut" in text or "groundnut" in text:
-        labels.add("peanut")
-    if any(k in text for k in ["almond", "hazelnut", "walnut", "cashew", "pistachio", "pecan", "macadamia"]):
-        labels.add("tree_nut")
-    if any(k in text for k in ["soy", "soya", "soybean"]):
-        labels.add("soy")
-    if any(k in text for k in ["wheat", "durum", "semolina"]):
-        labels.add("wheat")
-    if "gluten" in text:
-        labels.add("gluten")
-    if "sesame" in text:
-        labels.add("sesame")
-    if any(k in text for k in ["fish", "salmon", "tuna", "cod", "anchovy"]):
-        labels.add("fish")
-    if any(k in text for k in ["shrimp", "prawn", "crab", "lobster", "mussel", "clam"]):
-        labels.add("shellfish")
-    if "mustard" in text:
-        labels.add("mustard")
+    for label, keywords in KEYWORD_RULES.items():
+        if any(k in text for k in keywords):
+            labels.add(label)
 
     return list(labels)
 
@@ -121,13 +125,183 @@ def build_labels(row):
     return list(labels)
 
 
+# Everything str.strip() removes; spelled out because pandas may hand the
+# regex to pyarrow/RE2, whose \s is ASCII-only.
+_WS = "[" + "".join(chr(c) for c in range(0x3001) if chr(c).isspace()) + "]"
+
+
+def _tag_pattern(tags):
+    # Same semantics as parse_allergens_field(): a comma-separated token,
+    # surrounding whitespace stripped, matched after its last ':' prefix.
+    alternatives = "|".join(re.escape(t) for t in tags)
+    return rf"(?:^|,){_WS}*(?:[^,]*:)?(?:{alternatives}){_WS}*(?:,|$)"
+
+
+def _keyword_pattern(keywords):
+    return "|".join(re.escape(k) for k in keywords)
+
+
+def build_label_matrix(df, allergens_col="allergens", text_col="ingredients_text"):
+    """
+    Vectorized build_labels() over whole columns.
+
+    Returns the multi-hot uint8 matrix (rows x TARGET_ALLERGENS) that
+    MultiLabelBinarizer(classes=TARGET_ALLERGENS) would produce from
+    df.apply(build_labels, axis=1), using one regex per label per column.
+    """
+    n = len(df)
+    empty = pd.Series([""] * n, index=df.index)
+    tags = df[allergens_col] if allergens_col in df.columns else empty
+    text = df[text_col] if text_col in df.columns else empty
+    tags = tags.fillna("").astype(str).str.lower()
+    text = text.fillna("").astype(str).str.lower()
+
+    Y = np.zeros((n, len(TARGET_ALLERGENS)), dtype=np.uint8)
+    for j, label in enumerate(TARGET_ALLERGENS):
+        tag_names = TREE_NUT_TAGS + [label] if label == "tree_nut" else [label]
+        from_tags = tags.str.contains(_tag_pattern(tag_names), regex=True).to_numpy(dtype=bool)
+        from_text = text.str.contains(_keyword_pattern(KEYWORD_RULES[label]), regex=True).to_numpy(dtype=bool)
+        Y[:, j] = from_tags | from_text
+    return Y
+
+
 # -------------------------
 # Main training pipeline
 # -------------------------
 
-def main():
-    print(f"Loading data from {DATA_PATH} ...")
-    df = pd.read_csv(DATA_PATH)
+def load_data(args):
+    if args.data.endswith(".csv"):
+        return pd.read_csv(args.data)
+    sample_size = None if args.sample_size <= 0 else args.sample_size
+    return load_training_frame(
+        args.data,
+        sample_size=sample_size,
+        sampling=args.sampling,
+        country=args.country,
+        seed=args.seed,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the allergen classifier.")
+    parser.add_argument("--data", default=DATA_PATH, help="Parquet dump or legacy CSV sample")
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE, help="0 = use every row")
+    parser.add_argument("--sampling", choices=["reservoir", "stratified", "none"], default="reservoir")
+    parser.add_argument("--country", default=None, help="e.g. 'france' or 'en:united-states'")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--C", type=float, default=1.0, help="LogisticRegression inverse regularization")
+    parser.add_argument("--max-iter", type=int, default=200)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only vectorize rows not in the last cached split and warm-start the saved classifier")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and do not write the feature cache")
+    return parser.parse_args(argv)
+
+
+def clean_series(texts):
+    return pd.Series(clean_texts(texts), index=texts.index)
+
+
+def prepare_rows(df, use_cache=True):
+    """Cleaned text + label matrix for df, reusing cached rows when possible."""
+    if not use_cache:
+        return clean_series(df["ingredients_text"]).to_numpy(), build_label_matrix(df), len(df)
+    fingerprint = feature_cache.code_fingerprint(
+        text_normalizer, build_label_matrix, _tag_pattern, TARGET_ALLERGENS, TREE_NUT_TAGS, KEYWORD_RULES
+    )
+    rows = feature_cache.RowCache(fingerprint, len(TARGET_ALLERGENS))
+    return rows.prepare(df, feature_cache.row_hashes(df), clean_series, build_label_matrix)
+
+
+def vectorize_split(X, Y, hashes, use_cache=True):
+    """Train/val split + TF-IDF fit, served from the .npz cache when the data and config are unchanged."""
+    config = {"vectorizer": VECTORIZER_CONFIG, "test_size": TEST_SIZE, "random_state": SPLIT_SEED}
+    key = f"{feature_cache.dataset_key(hashes)}_{feature_cache.config_key(config)}"
+    if use_cache:
+        bundle = feature_cache.load_matrices(key)
+        if bundle is not None:
+            print(f"Loaded cached TF-IDF matrices ({key}).")
+            return bundle
+
+    X_train, X_val, Y_train, Y_val, h_train, h_val = train_test_split(
+        X, Y, hashes, test_size=TEST_SIZE, random_state=SPLIT_SEED
+    )
+
+    # Text vectorizer
+    print("Fitting TF-IDF vectorizer...")
+    vectorizer = TfidfVectorizer(**VECTORIZER_CONFIG)
+    bundle = {
+        "X_train": vectorizer.fit_transform(X_train),
+        "X_val": vectorizer.transform(X_val),
+        "Y_train": Y_train,
+        "Y_val": Y_val,
+        "h_train": h_train,
+        "h_val": h_val,
+        "vectorizer": vectorizer,
+    }
+    if use_cache:
+        feature_cache.save_matrices(key, bundle, config)
+    return bundle
+
+
+def extend_split(X, Y, hashes):
+    """
+    Incremental mode: keep the cached split and vocabulary, transform only
+    rows that are not in it yet and append them (every 5th row hash goes to
+    validation so the split stays stable as data grows).
+    Returns (bundle, n_new); n_new is None when a full build was needed.
+    """
+    base_key = feature_cache.latest_key()
+    bundle = feature_cache.load_matrices(base_key) if base_key else None
+    if bundle is None:
+        print("No cached matrices yet; running a full build.")
+        return vectorize_split(X, Y, hashes), None
+
+    seen = np.concatenate([bundle["h_train"], bundle["h_val"]])
+    _, first = np.unique(hashes, return_index=True)
+    is_new = np.zeros(len(hashes), dtype=bool)
+    is_new[first] = ~np.isin(hashes[first], seen)
+    n_new = int(is_new.sum())
+    print(f"Incremental: {n_new} new rows on top of {len(seen)} cached rows.")
+    if not n_new:
+        return bundle, 0
+
+    vectorizer = bundle["vectorizer"]
+    to_val = is_new & (hashes % 5 == 0)
+    to_train = is_new & ~to_val
+    bundle["X_train"] = sp.vstack([bundle["X_train"], vectorizer.transform(X[to_train])]).tocsr()
+    bundle["X_val"] = sp.vstack([bundle["X_val"], vectorizer.transform(X[to_val])]).tocsr()
+    bundle["Y_train"] = np.vstack([bundle["Y_train"], Y[to_train]])
+    bundle["Y_val"] = np.vstack([bundle["Y_val"], Y[to_val]])
+    bundle["h_train"] = np.concatenate([bundle["h_train"], hashes[to_train]])
+    bundle["h_val"] = np.concatenate([bundle["h_val"], hashes[to_val]])
+
+    all_hashes = np.concatenate([bundle["h_train"], bundle["h_val"]])
+    key = f"{feature_cache.dataset_key(all_hashes)}_incremental_{base_key}"
+    feature_cache.save_matrices(key, bundle, {"base": base_key, "new_rows": n_new})
+    return bundle, n_new
+
+
+def warm_start(clf, X_train, Y_train, C, max_iter):
+    """
+    Continue training a saved OneVsRest model from its current weights
+    (LogisticRegression warm_start) instead of from zero. Labels that were
+    constant in the old data get a freshly fitted estimator.
+    """
+    for j, est in enumerate(clf.estimators_):
+        y = Y_train[:, j]
+        if hasattr(est, "coef_") and len(np.unique(y)) > 1:
+            est.set_params(warm_start=True, C=C, max_iter=max_iter)
+            est.fit(X_train, y)
+        elif len(np.unique(y)) > 1:
+            clf.estimators_[j] = LogisticRegression(C=C, max_iter=max_iter).fit(X_train, y)
+    return clf
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    use_cache = not args.no_cache
+    print(f"Loading data from {args.data} ...")
+    df = load_data(args)
 
     # Ensure columns exist / rename if needed
     # If your CSV had 'allergens_tags' instead of 'allergens', rename it:
@@ -135,50 +309,51 @@ def main():
         df = df.rename(columns={"allergens_tags": "allergens"})
 
     # Keep only rows with ingredients_text not null
-    df = df[df["ingredients_text"].notnull()].copy()
+    df = df[df["ingredients_text"].notnull()].reset_index(drop=True)
     print(f"Rows with ingredients_text: {len(df)}")
 
-    # Clean text
-    print("Cleaning ingredient text...")
-    df["clean_text"] = df["ingredients_text"].apply(clean_text)
-
-    # Build labels
-    print("Building multi-label targets...")
-    df["labels_list"] = df.apply(build_labels, axis=1)
+    # Clean text + build labels (multi-hot, column order = TARGET_ALLERGENS)
+    print("Cleaning ingredient text and building multi-label targets...")
+    X, Y, n_processed = prepare_rows(df, use_cache)
+    print(f"Rows cleaned/labelled this run: {n_processed} (rest from cache)")
 
     # You can inspect how many have at least 1 allergen
-    df["has_label"] = df["labels_list"].apply(lambda x: len(x) > 0)
-    print("Rows with at least one allergen label:", df["has_label"].sum())
-
-    # Use all rows (including no-label) for training; no-label rows act as negatives.
-    X = df["clean_text"].values
-    y_list = df["labels_list"].values
+    print("Rows with at least one allergen label:", int(Y.any(axis=1).sum()))
 
-    # Multi-label binarization
+    # Saved alongside the model so serving knows the label order
     mlb = MultiLabelBinarizer(classes=TARGET_ALLERGENS)
-    Y = mlb.fit_transform(y_list)
-
-    # Train/val split
-    X_train, X_val, Y_train, Y_val = train_test_split(
-        X, Y, test_size=0.2, random_state=42
-    )
+    mlb.fit([TARGET_ALLERGENS])
 
-    # Text vectorizer
-    print("Fitting TF-IDF vectorizer...")
-    vectorizer = TfidfVectorizer(
-        max_features=20000,
-        ngram_range=(1, 2),  # unigrams + bigrams
-        min_df=2
-    )
-    X_train_vec = vectorizer.fit_transform(X_train)
-    X_val_vec = vectorizer.transform(X_val)
+    # Use all rows (including no-label) for training; no-label rows act as negatives.
+    hashes = feature_cache.row_hashes(df)
+    model_path = os.path.join(MODELS_DIR, "allergen_classifier.joblib")
+    if args.incremental:
+        bundle, n_new = extend_split(X, Y, hashes)
+    else:
+        bundle, n_new = vectorize_split(X, Y, hashes, use_cache), None
+    vectorizer = bundle["vectorizer"]
+    X_train_vec, X_val_vec = bundle["X_train"], bundle["X_val"]
+    Y_train, Y_val = bundle["Y_train"], bundle["Y_val"]
 
     # Classifier: One-vs-Rest Logistic Regression
-    print("Training classifier...")
-    base_clf = LogisticRegression(max_iter=200, n_jobs=-1)
-    clf = OneVsRestClassifier(base_clf)
-
-    clf.fit(X_train_vec, Y_train)
+    # Warm start only on the vocabulary the saved weights were trained on:
+    # a same-sized but different vocabulary would put words on the wrong columns
+    vocabulary = feature_cache.vocabulary_fingerprint(vectorizer)
+    previous = load(model_path) if n_new is not None and os.path.exists(model_path) else None
+    if previous is not None and getattr(previous, "vocabulary_fingerprint_", None) != vocabulary:
+        print("Saved classifier was trained on another vocabulary; training from scratch.")
+        previous = None
+    if previous is not None:
+        if n_new == 0:
+            print("No new rows; keeping the existing classifier.")
+            return
+        print("Warm-starting classifier from saved weights...")
+        clf = warm_start(previous, X_train_vec, Y_train, args.C, args.max_iter)
+    else:
+        print("Training classifier...")
+        base_clf = LogisticRegression(C=args.C, max_iter=args.max_iter, n_jobs=-1)
+        clf = OneVsRestClassifier(base_clf)
+        clf.fit(X_train_vec, Y_train)
 
     # Evaluate
     print("Evaluating on validation set...")
@@ -188,7 +363,8 @@ def main():
     # Save artifacts
     print("Saving model artifacts...")
     dump(vectorizer, os.path.join(MODELS_DIR, "tfidf_vectorizer.joblib"))
-    dump(clf, os.path.join(MODELS_DIR, "allergen_classifier.joblib"))
+    clf.vocabulary_fingerprint_ = vocabulary
+    dump(clf, model_path)
     dump(mlb, os.path.join(MODELS_DIR, "label_binarizer.joblib"))
 
     print("Done. Models saved in 'models/' folder.")
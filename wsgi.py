@@ -0,0 +1,28 @@
+"""
+Production entry point:
+
+    gunicorn -c gunicorn_conf.py wsgi:app
+
+`python app.py` still starts the Flask development server for local work.
+"""
+import os
+
+
+def create_app():
+    """
+    Import app.py (loads the models and creates the worker pools) and apply
+    production settings from the environment. With preload_app set in
+    gunicorn_conf.py this runs once in the master, before the workers fork,
+    so the models are shared copy-on-write instead of loaded per worker.
+    """
+    from app import app
+
+    secret_key = os.getenv("FLASK_SECRET_KEY")
+    if secret_key:
+        app.secret_key = secret_key
+    app.config["SESSION_COOKIE_SECURE"] = os.getenv("SESSION_COOKIE_SECURE", "0") == "1"
+    app.debug = False
+    return app
+
+
+app = create_app()